@@ -0,0 +1,324 @@
+from dataclasses import dataclass, asdict, field
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+# Czas między pomiarami to 1 minuta (1/60 godziny)
+SAMPLE_INTERVAL_H = 1/60
+
+# Prędkość, poniżej której pojazd uznajemy za stojący (km/h)
+IDLE_SPEED_KMH = 1.0
+
+# Percentyle prędkości liczone w raporcie
+SPEED_PERCENTILES = (50, 90, 95)
+
+
+@dataclass(frozen=True)
+class AnalysisResult:
+    """Wszystkie metryki zbioru danych policzone w jednym przebiegu."""
+    samples: int
+    avg_speed_kmh: float
+    min_speed_kmh: float
+    max_speed_kmh: float
+    std_speed_kmh: float
+    idle_share: float
+    total_distance_km: float
+    traction_energy_kwh: float
+    hvac_energy_kwh: float
+    total_energy_kwh: float
+    speed_percentiles: Dict[int, float] = field(default_factory=dict)
+    # True, gdy policzono z agregatów (rollups.py): średnie, sumy, energia i min/max są
+    # dokładne, a odchylenie, percentyle i udział postoju - przybliżone z kubełków.
+    aggregated: bool = False
+
+    def _per_km(self, energy_kwh):
+        if self.total_distance_km == 0:
+            return 0.0
+        return energy_kwh / self.total_distance_km
+
+    @property
+    def traction_energy_per_km(self) -> float:
+        return self._per_km(self.traction_energy_kwh)
+
+    @property
+    def hvac_energy_per_km(self) -> float:
+        return self._per_km(self.hvac_energy_kwh)
+
+    @property
+    def total_energy_per_km(self) -> float:
+        return self._per_km(self.total_energy_kwh)
+
+    def to_dict(self) -> dict:
+        """Słownik z metrykami zaokrąglonymi tak jak w narzędziach calculate_*."""
+        result = asdict(self)
+        del result["aggregated"]
+        for key in ("avg_speed_kmh", "min_speed_kmh", "max_speed_kmh", "std_speed_kmh", "total_distance_km"):
+            result[key] = round(result[key], 2)
+        for key in ("traction_energy_kwh", "hvac_energy_kwh", "total_energy_kwh", "idle_share"):
+            result[key] = round(result[key], 4)
+        result["speed_percentiles"] = {p: round(v, 2) for p, v in self.speed_percentiles.items()}
+        result["traction_energy_per_km"] = round(self.traction_energy_per_km, 4)
+        result["hvac_energy_per_km"] = round(self.hvac_energy_per_km, 4)
+        result["total_energy_per_km"] = round(self.total_energy_per_km, 4)
+        return result
+
+
+EMPTY_RESULT = AnalysisResult(
+    samples=0, avg_speed_kmh=0.0, min_speed_kmh=0.0, max_speed_kmh=0.0, std_speed_kmh=0.0,
+    idle_share=0.0, total_distance_km=0.0, traction_energy_kwh=0.0, hvac_energy_kwh=0.0,
+    total_energy_kwh=0.0, speed_percentiles={p: 0.0 for p in SPEED_PERCENTILES},
+)
+
+
+def _column(df: pd.DataFrame, name: str) -> np.ndarray:
+    """Zwraca kolumnę jako tablicę float64 (kolumny NUMERIC przychodzą jako Decimal)."""
+    return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _weighted_percentiles(values: np.ndarray, weights: np.ndarray, percentiles) -> np.ndarray:
+    """Percentyle ważone (wartości kubełków ważone liczbą pomiarów)."""
+    order = np.argsort(values)
+    cumulative = np.cumsum(weights[order])
+    targets = np.asarray(percentiles, dtype=np.float64) / 100 * cumulative[-1]
+    idx = np.minimum(np.searchsorted(cumulative, targets), len(values) - 1)
+    return values[order][idx]
+
+
+def analyze_arrays(speed: np.ndarray, distance: np.ndarray, traction: np.ndarray,
+                   hvac: np.ndarray, interval_h: float = SAMPLE_INTERVAL_H,
+                   weights: np.ndarray = None, speed_weights: np.ndarray = None,
+                   speed_min: np.ndarray = None, speed_max: np.ndarray = None) -> AnalysisResult:
+    """
+    Liczy wszystkie metryki na tablicach NumPy bez tworzenia pomocniczych kolumn.
+    Braki danych (NaN) są pomijane, tak jak w pandas.
+
+    Dla danych zagregowanych `weights` to liczba pomiarów w kubełku (moce są średnimi
+    na pomiar), `speed_weights` - liczba znanych prędkości, a `speed_min`/`speed_max`
+    - skrajne prędkości kubełków.
+    """
+    if len(speed) == 0:
+        return EMPTY_RESULT
+
+    aggregated = weights is not None
+    if not aggregated:
+        weights = np.ones(len(speed))
+    if speed_weights is None:
+        speed_weights = weights
+
+    known = ~np.isnan(speed)
+    valid_speed = speed[known]
+    valid_weights = speed_weights[known]
+    if len(valid_speed) == 0 or valid_weights.sum() == 0:
+        valid_speed, valid_weights = np.zeros(1), np.ones(1)
+    weight_sum = valid_weights.sum()
+
+    avg_speed = float(np.dot(valid_speed, valid_weights) / weight_sum)
+    if aggregated:
+        percentiles = _weighted_percentiles(valid_speed, valid_weights, SPEED_PERCENTILES)
+        variance = np.dot(valid_weights, (valid_speed - avg_speed) ** 2) / max(weight_sum - 1, 1)
+        std_speed = float(np.sqrt(variance))
+        idle_share = float(valid_weights[valid_speed < IDLE_SPEED_KMH].sum() / weight_sum)
+    else:
+        percentiles = np.percentile(valid_speed, SPEED_PERCENTILES)
+        std_speed = float(valid_speed.std(ddof=1)) if len(valid_speed) > 1 else 0.0
+        idle_share = float(np.count_nonzero(valid_speed < IDLE_SPEED_KMH) / len(valid_speed))
+
+    min_speed = np.nanmin(speed_min) if speed_min is not None else valid_speed.min()
+    max_speed = np.nanmax(speed_max) if speed_max is not None else valid_speed.max()
+
+    traction_sum = np.nansum(traction * weights)
+    hvac_sum = np.nansum(hvac * weights)
+    # Suma mocy liczona tylko tam, gdzie znane są obie składowe (jak traction + hvac w pandas)
+    both_known = ~(np.isnan(traction) | np.isnan(hvac))
+    total_sum = np.dot(traction[both_known] + hvac[both_known], weights[both_known])
+
+    return AnalysisResult(
+        samples=int(weights.sum()),
+        avg_speed_kmh=avg_speed,
+        min_speed_kmh=float(min_speed),
+        max_speed_kmh=float(max_speed),
+        std_speed_kmh=std_speed,
+        idle_share=idle_share,
+        total_distance_km=float(np.nansum(distance)),
+        traction_energy_kwh=float(traction_sum * interval_h),
+        hvac_energy_kwh=float(hvac_sum * interval_h),
+        total_energy_kwh=float(total_sum * interval_h),
+        speed_percentiles={p: float(v) for p, v in zip(SPEED_PERCENTILES, percentiles)},
+        aggregated=aggregated,
+    )
+
+
+def analyze_frame(df: pd.DataFrame, interval_h: float = SAMPLE_INTERVAL_H) -> AnalysisResult:
+    """
+    Liczy wszystkie metryki dla DataFrame zwróconego przez fetch_data_for_chart (bez modyfikacji df).
+    Ramki z agregatów (kolumna sample_count) są ważone liczbą pomiarów w kubełku.
+    """
+    if df.empty:
+        return EMPTY_RESULT
+    optional = {
+        name: _column(df, column) if column in df.columns else None
+        for name, column in [("weights", "sample_count"), ("speed_weights", "speed_count"),
+                             ("speed_min", "speed_min_kmh"), ("speed_max", "speed_max_kmh")]
+    }
+    return analyze_arrays(
+        _column(df, "speed_kmh"),
+        _column(df, "distance_km"),
+        _column(df, "traction_power_kw"),
+        _column(df, "hvac_power_kw"),
+        interval_h=interval_h,
+        **optional,
+    )
+
+
+# Rozdzielczość histogramu prędkości w MetricsAccumulator (prędkości w bazie mają 2 miejsca po przecinku)
+SPEED_HISTOGRAM_STEP_KMH = 0.01
+# Ciągła tablica histogramu obejmuje najwyżej prędkości 0..SPEED_HISTOGRAM_DENSE_MAX_KMH (~400 KB);
+# wartości spoza (np. błędne próbki 1e6 km/h) są liczone osobno, po jednym wpisie na wartość
+SPEED_HISTOGRAM_DENSE_MAX_KMH = 500.0
+
+
+class MetricsAccumulator:
+    """
+    Liczy te same metryki co analyze_frame przyrostowo, paczka po paczce surowych
+    pomiarów (np. ze streaming.iter_frames), w pamięci niezależnej od długości zakresu.
+
+    Sumy są akumulowane w float64, średnia i odchylenie prędkości scalane między
+    paczkami (wzór Chana), a percentyle liczone z histogramu prędkości o kroku
+    SPEED_HISTOGRAM_STEP_KMH - dla prędkości zapisanych z tą dokładnością wynik jest
+    taki sam jak np.percentile na całym zbiorze. Prędkości spoza zakresu
+    0..SPEED_HISTOGRAM_DENSE_MAX_KMH trafiają do rzadkiej części histogramu, więc
+    pojedyncza błędna próbka nie powiększa tablicy.
+    """
+
+    def __init__(self, interval_h: float = SAMPLE_INTERVAL_H):
+        self.interval_h = interval_h
+        self.samples = 0
+        self.chunks = 0
+        self._speed_n = 0
+        self._speed_mean = 0.0
+        self._speed_m2 = 0.0
+        self._speed_min = np.inf
+        self._speed_max = -np.inf
+        self._idle = 0
+        self._distance = 0.0
+        self._traction = 0.0
+        self._hvac = 0.0
+        self._total = 0.0
+        self._histogram = np.zeros(0, dtype=np.int64)
+        self._histogram_offset = 0
+        # Rzadka część histogramu: posortowane numery kubełków (float64 - mogą być ogromne) i liczności
+        self._outlier_bins = np.zeros(0, dtype=np.float64)
+        self._outlier_counts = np.zeros(0, dtype=np.int64)
+
+    def add_frame(self, df: pd.DataFrame) -> None:
+        """Dodaje paczkę w układzie kolumn fetch_data_for_chart (surowe pomiary)."""
+        self.add(_column(df, "speed_kmh"), _column(df, "distance_km"),
+                 _column(df, "traction_power_kw"), _column(df, "hvac_power_kw"))
+
+    def add(self, speed: np.ndarray, distance: np.ndarray, traction: np.ndarray, hvac: np.ndarray) -> None:
+        """Dodaje paczkę tablic NumPy (braki danych jako NaN są pomijane, jak w analyze_arrays)."""
+        speed, distance, traction, hvac = (np.asarray(a, dtype=np.float64) for a in (speed, distance, traction, hvac))
+        self.samples += len(speed)
+        self.chunks += 1
+
+        valid = speed[~np.isnan(speed)]
+        if len(valid):
+            n, mean = len(valid), float(valid.mean())
+            m2 = float(np.dot(valid - mean, valid - mean))
+            total_n = self._speed_n + n
+            delta = mean - self._speed_mean
+            self._speed_mean += delta * n / total_n
+            self._speed_m2 += m2 + delta * delta * self._speed_n * n / total_n
+            self._speed_n = total_n
+            self._speed_min = min(self._speed_min, float(valid.min()))
+            self._speed_max = max(self._speed_max, float(valid.max()))
+            self._idle += int(np.count_nonzero(valid < IDLE_SPEED_KMH))
+            self._add_to_histogram(valid)
+
+        self._distance += float(np.nansum(distance))
+        self._traction += float(np.nansum(traction))
+        self._hvac += float(np.nansum(hvac))
+        both_known = ~(np.isnan(traction) | np.isnan(hvac))
+        self._total += float(np.sum(traction[both_known] + hvac[both_known]))
+
+    def _add_to_histogram(self, speed: np.ndarray) -> None:
+        scaled = np.rint(speed / SPEED_HISTOGRAM_STEP_KMH)
+        dense = (scaled >= 0) & (scaled <= SPEED_HISTOGRAM_DENSE_MAX_KMH / SPEED_HISTOGRAM_STEP_KMH)
+        if not dense.all():
+            self._add_outliers(scaled[~dense])
+            scaled = scaled[dense]
+        if not len(scaled):
+            return
+        bins = scaled.astype(np.int64)
+        lowest = int(bins.min())
+        if not len(self._histogram):
+            self._histogram_offset = lowest
+        elif lowest < self._histogram_offset:
+            self._histogram = np.concatenate([np.zeros(self._histogram_offset - lowest, dtype=np.int64),
+                                              self._histogram])
+            self._histogram_offset = lowest
+        counts = np.bincount(bins - self._histogram_offset)
+        if len(counts) > len(self._histogram):
+            self._histogram = np.pad(self._histogram, (0, len(counts) - len(self._histogram)))
+        self._histogram[:len(counts)] += counts
+
+    def _add_outliers(self, scaled: np.ndarray) -> None:
+        keys = np.concatenate([self._outlier_bins, scaled])
+        weights = np.concatenate([self._outlier_counts, np.ones(len(scaled), dtype=np.int64)])
+        self._outlier_bins, inverse = np.unique(keys, return_inverse=True)
+        self._outlier_counts = np.bincount(inverse, weights=weights).astype(np.int64)
+
+    def _percentiles(self) -> np.ndarray:
+        """Percentyle z histogramu z interpolacją liniową jak np.percentile."""
+        occupied = np.flatnonzero(self._histogram)
+        bins = np.concatenate([(occupied + self._histogram_offset).astype(np.float64), self._outlier_bins])
+        counts = np.concatenate([self._histogram[occupied], self._outlier_counts])
+        order = np.argsort(bins, kind="stable")
+        bins, cumulative = bins[order], np.cumsum(counts[order])
+        ranks = np.asarray(SPEED_PERCENTILES, dtype=np.float64) / 100 * (self._speed_n - 1)
+        lower = np.floor(ranks).astype(np.int64)
+        upper = np.minimum(lower + 1, self._speed_n - 1)
+
+        def value_at(index):
+            return bins[np.searchsorted(cumulative, index, side="right")] * SPEED_HISTOGRAM_STEP_KMH
+
+        low_values, high_values = value_at(lower), value_at(upper)
+        return low_values + (high_values - low_values) * (ranks - lower)
+
+    def result(self) -> AnalysisResult:
+        """Zwraca metryki wszystkich dodanych paczek."""
+        if self.samples == 0:
+            return EMPTY_RESULT
+        if self._speed_n == 0:
+            # Brak znanych prędkości - jak w analyze_arrays (jedna prędkość 0)
+            avg_speed = std_speed = min_speed = max_speed = 0.0
+            idle_share = 1.0
+            percentiles = np.zeros(len(SPEED_PERCENTILES))
+        else:
+            avg_speed, min_speed, max_speed = self._speed_mean, self._speed_min, self._speed_max
+            std_speed = float(np.sqrt(self._speed_m2 / (self._speed_n - 1))) if self._speed_n > 1 else 0.0
+            idle_share = self._idle / self._speed_n
+            percentiles = self._percentiles()
+
+        return AnalysisResult(
+            samples=self.samples,
+            avg_speed_kmh=avg_speed,
+            min_speed_kmh=min_speed,
+            max_speed_kmh=max_speed,
+            std_speed_kmh=std_speed,
+            idle_share=idle_share,
+            total_distance_km=self._distance,
+            traction_energy_kwh=self._traction * self.interval_h,
+            hvac_energy_kwh=self._hvac * self.interval_h,
+            total_energy_kwh=self._total * self.interval_h,
+            speed_percentiles={p: float(v) for p, v in zip(SPEED_PERCENTILES, percentiles)},
+        )
+
+
+def analyze_chunks(chunks, interval_h: float = SAMPLE_INTERVAL_H) -> AnalysisResult:
+    """Liczy metryki z iteratora paczek DataFrame (np. streaming.iter_frames) w stałej pamięci."""
+    accumulator = MetricsAccumulator(interval_h)
+    for chunk in chunks:
+        accumulator.add_frame(chunk)
+    return accumulator.result()
@@ -1,29 +1,31 @@
+import time
+
+# Pomiar czasu wykonania skryptu (zimny start procesu i kolejne reruny Streamlit)
+_SCRIPT_STARTED = time.perf_counter()
+
 import os
 import json
 import streamlit as st
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.agents import create_tool_calling_agent
-from langchain.agents import AgentExecutor
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain.memory import ConversationBufferMemory
-from langchain_core.messages import HumanMessage, AIMessage
-import plotly.graph_objects as go
-import re
-from tools import (
-    get_available_vehicles,
-    get_available_vehicles_simple,
-    get_data_range,
-    fetch_data_for_chart,
-    format_analysis_report,
-    generate_single_chart,
-    generate_multi_chart
-)
+from chart_store import CHART_PATH_RE, store as chart_store
+
+# Ciężkie moduły (langchain, pandas, plotly, psycopg2 przez tools.py) są importowane
+# leniwie w funkcjach poniżej - pierwsze wyświetlenie strony na nie nie czeka.
 
 # Wczytanie zmiennych środowiskowych
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
+# Model językowy asystenta
+LLM_MODEL = "gpt-4.1-mini"
+
+# Połączenia HTTP do API modelu utrzymywane między zapytaniami (wspólne dla sesji)
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_KEEPALIVE_S = float(os.getenv("LLM_KEEPALIVE_S", "60"))
+
+# Strumieniowanie odpowiedzi i postępu narzędzi do dymka czatu (0 - odpowiedź po zakończeniu)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") != "0"
+
 if not OPENAI_API_KEY or OPENAI_API_KEY == "TWOJ_KLUCZ_API_GPT":
     st.error("BŁĄD: Uzupełnij klucz OPENAI_API_KEY w pliku .env!")
     st.stop()
@@ -45,79 +47,169 @@ Mogę pomóc Ci w:
 - Porównywaniu danych między pojazdy
 """)
 
-# Inicjalizacja sesji Streamlit
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# Narzędzia agenta (z tools.py lub z serwera MCP)
+AGENT_TOOLS = [
+    "get_available_vehicles",
+    "get_data_range",
+    "fetch_data_for_chart",
+    "calculate_range_metrics",
+    "compare_vehicles",
+    "format_analysis_report",
+    "generate_range_report",
+    "generate_single_chart",
+    "generate_multi_chart",
+]
 
-if "agent_executor" not in st.session_state:
-    # Definicja narzędzi (Tools)
-    tools = [
-        get_available_vehicles,
-        get_data_range,
-        fetch_data_for_chart,
-        format_analysis_report,
-        generate_single_chart,
-        generate_multi_chart
-    ]
-
-    # Inicjalizacja modelu LLM
-    llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0, api_key=OPENAI_API_KEY)
-
-    # Definicja promptu systemowego
-    system_prompt = """
+# Definicja promptu systemowego
+SYSTEM_PROMPT = """
 Jesteś zaawansowanym asystentem do analizy danych telemetrycznych pojazdów. 
 Twoim zadaniem jest odpowiadanie na pytania użytkownika dotyczące prędkości, 
 dystansu i zużycia energii pojazdów w określonych zakresach dat.
 
 Masz dostęp do zestawu narzędzi (tools), które MUSISZ wykorzystać do:
 1. Pobierania danych z bazy (fetch_data_for_chart).
-2. Wykonywania obliczeń analitycznych (format_analysis_report).
+2. Wykonywania obliczeń analitycznych (calculate_range_metrics, format_analysis_report).
 3. Generowania wykresów (generate_single_chart, generate_multi_chart).
 
 **Zasady działania:**
 - Zawsze najpierw użyj `get_available_vehicles`, aby sprawdzić, jakie pojazdy są dostępne.
 - Aby wykonać analizę, MUSISZ najpierw użyć `fetch_data_for_chart` z poprawnym `vehicle_id`, `start_date` i `end_date`.
+- `fetch_data_for_chart` zwraca uchwyt zbioru danych (pole `dataset`) - przekaż go jako `data_json` do kolejnych narzędzi.
+- Jeśli użytkownik pyta tylko o liczby (średnia prędkość, dystans, zużycie energii), użyj `calculate_range_metrics` - liczy w bazie bez pobierania danych.
+- Jeśli użytkownik chce porównać pojazdy lub pyta o całą flotę (np. który pojazd zużywa najmniej energii), użyj jednego wywołania `compare_vehicles` (lista pojazdów lub ['all']; `chart=True`, gdy prosi o wykres).
 - Jeśli użytkownik prosi o analizę, użyj `format_analysis_report` do podsumowania wyników.
+- Jeśli użytkownik prosi o raport z długiego okresu (np. kilka miesięcy lub rok) bez wykresu, użyj `generate_range_report` - liczy dokładny raport bez `fetch_data_for_chart`.
 - Jeśli użytkownik prosi o wykres, użyj `generate_single_chart` lub `generate_multi_chart`.
 - Zawsze podawaj daty w formacie 'YYYY-MM-DD'.
 - Bądź uprzejmy i precyzyjny w odpowiedziach.
 """
 
+
+@st.cache_resource
+def get_process_state():
+    """Stan wspólny dla procesu: czas zimnego startu (pierwszego wykonania skryptu)."""
+    return {"cold_start_s": None, "agent_build_s": None}
+
+
+@st.cache_resource(show_spinner="Przygotowuję asystenta...")
+def get_agent():
+    """
+    Buduje raz na proces niezmienne elementy agenta: klienta LLM z utrzymywanymi
+    połączeniami HTTP, narzędzia, prompt i agenta. Wszystkie sesje korzystają z tych
+    samych obiektów - per sesja trzymana jest tylko pamięć rozmowy.
+
+    Przy ASYNC_AGENT narzędzia mają wersje asynchroniczne (async_tools.py), a tury
+    wykonuje pętla async_runtime - niezależne wywołania narzędzi idą równolegle.
+    Z MCP_SERVER_URL narzędzia wykonuje serwer MCP zamiast procesu interfejsu.
+
+    :return: Krotka (agent, tools, llm).
+    """
+    started = time.perf_counter()
+    import httpx
+    from langchain_openai import ChatOpenAI
+    from langchain.agents import create_tool_calling_agent
+    from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+    from mcp_client import MCP_SERVER_URL, remote_tools
+
+    if MCP_SERVER_URL:
+        # Narzędzia na serwerze MCP (mcp_server.py) - zbiory danych, wykresy i połączenia
+        # z bazą są wspólne dla wszystkich instancji interfejsu
+        tools = remote_tools(MCP_SERVER_URL, AGENT_TOOLS)
+    else:
+        import tools as toolset
+        tools = [getattr(toolset, name) for name in AGENT_TOOLS]
+        from async_runtime import ASYNC_AGENT
+        from async_tools import with_async
+        if ASYNC_AGENT:
+            tools = with_async(tools)
+    # Szybka ścieżka korzysta z tych samych narzędzi co agent
+    from intent_router import router
+    router.use_tools(tools)
+
+    # Inicjalizacja modelu LLM (klienci HTTP z pulą połączeń keep-alive; asynchroniczny
+    # dla tur w pętli async_runtime, synchroniczny m.in. dla streszczania historii)
+    limits = httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_S,
+    )
+    http_client = httpx.Client(limits=limits)
+    http_async_client = httpx.AsyncClient(limits=limits)
+    # Czas i tokeny każdego wywołania modelu trafiają do metryk (instrumentation.py)
+    from instrumentation import llm_metrics_handler, start_metrics_server
+    start_metrics_server()
+    llm = ChatOpenAI(model=LLM_MODEL, temperature=0, api_key=OPENAI_API_KEY,
+                     http_client=http_client, http_async_client=http_async_client, streaming=STREAM_RESPONSES, callbacks=[llm_metrics_handler])
+
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", system_prompt),
+            ("system", SYSTEM_PROMPT),
             MessagesPlaceholder(variable_name="chat_history", optional=True),
             ("human", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ]
     )
 
-    # Inicjalizacja pamięci agenta
-    memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+    # Tworzenie agenta (odpowiedzi modelu zapisywane w trwałej pamięci podręcznej)
+    from llm_cache import LLM_CACHE_ENABLED, CachedChatModel, response_cache
+    agent_llm = llm
+    if LLM_CACHE_ENABLED:
+        agent_llm = CachedChatModel(model=llm, response_cache=response_cache, callbacks=[llm_metrics_handler])
+    agent = create_tool_calling_agent(agent_llm, tools, prompt)
+    get_process_state()["agent_build_s"] = time.perf_counter() - started
+    return agent, tools, llm
+
+
+def get_memory():
+    """Zwraca pamięć rozmowy bieżącej sesji (tworzoną przy pierwszym pytaniu)."""
+    from chat_memory import BudgetedConversationMemory
+
+    if "memory" not in st.session_state:
+        # Pamięć z budżetem tokenów: starsze tury są streszczane, wyniki narzędzi skracane
+        _, _, llm = get_agent()
+        st.session_state.memory = BudgetedConversationMemory(llm=llm)
+    return st.session_state.memory
+
+
+def get_history_key():
+    """Zwraca treść historii rozmowy sesji jako tekst - część klucza zapisanych odpowiedzi agenta."""
+    history = get_memory().load_memory_variables({})["chat_history"]
+    return json.dumps([[message.type, message.content] for message in history], ensure_ascii=False)
+
 
-    # Tworzenie agenta
-    agent = create_tool_calling_agent(llm, tools, prompt)
+def get_agent_executor():
+    """
+    Zwraca AgentExecutor dla bieżącej sesji: wspólny agent i narzędzia z `get_agent`
+    oraz pamięć rozmowy z st.session_state (tworzona przy pierwszym pytaniu).
+    """
+    from langchain.agents import AgentExecutor
 
-    # Tworzenie Agent Executor z pamięcią
-    st.session_state.agent_executor = AgentExecutor(
+    agent, tools, _ = get_agent()
+    return AgentExecutor(
         agent=agent,
         tools=tools,
-        memory=memory,
+        memory=get_memory(),
+        return_intermediate_steps=True,
         verbose=False,
         handle_parsing_errors=True
     )
 
-# Wyświetlenie historii wiadomości
+
+# Inicjalizacja sesji Streamlit
+if "messages" not in st.session_state:
+    st.session_state.messages = []
+
+# Wyświetlenie historii wiadomości (razem z wykresami)
 for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-        # Jeśli wiadomość zawiera wykres (JSON Plotly), wyświetl go
-        if message.get("chart"):
-            try:
-                chart_data = json.loads(message["chart"])
-                st.plotly_chart(chart_data, use_container_width=True)
-            except:
-                st.warning("Nie udało się wyświetlić wykresu.")
+        # Jeśli wiadomość zawiera wykresy, wyświetl je
+        if message.get("chart_paths"):
+            for chart_path in message["chart_paths"]:
+                try:
+                    st.plotly_chart(chart_store.load_figure(chart_path), use_container_width=True)
+                except Exception as e:
+                    st.warning(f"Nie udało się wyświetlić wykresu: {e}")
 
 # Pole wejściowe dla użytkownika
 user_input = st.chat_input("Wpisz swoje pytanie...")
@@ -129,56 +221,98 @@ if user_input:
         st.markdown(user_input)
 
     with st.chat_message("assistant"):
-        with st.spinner("Analizuję dane..."):
-            try:
-                response = st.session_state.agent_executor.invoke({"input": user_input})
+        try:
+            from intent_router import INTENT_ROUTER_ENABLED, router
+
+            # Narzędzia szybkiej ścieżki ustawia get_agent (lokalne lub z serwera MCP)
+            get_agent()
+            started = time.perf_counter()
+            # Typowe pytania (metryka/wykres dla pojazdu i dat) obsługuje szybka ścieżka bez modelu
+            routed = router.route(user_input) if INTENT_ROUTER_ENABLED else None
+            
+            # Ta sama odpowiedź agenta na to samo pytanie przy tej samej historii i wersji danych
+            from llm_cache import LLM_CACHE_ENABLED, response_cache
+            cached = None
+            if routed is None and LLM_CACHE_ENABLED:
+                history_key = get_history_key()
+                cached = response_cache.get_answer(user_input, LLM_MODEL, history_key)
+                if cached is not None and not all(os.path.exists(p) for p in cached["chart_paths"]):
+                    cached = None
+            
+            ready_charts = []
+            if routed is not None or cached is not None:
+                assistant_message = routed.answer if routed is not None else cached["output"]
+                st.markdown(assistant_message)
+                chart_paths = []
+                ready_charts = routed.chart_paths if routed is not None else cached["chart_paths"]
+                # Tura trafia do pamięci, aby agent znał jej wynik w kolejnych pytaniach
+                get_memory().save_context({"input": user_input}, {
+                    "output": assistant_message,
+                    "intermediate_steps": routed.steps if routed is not None else [],
+                })
+                if routed is not None:
+                    st.caption(f"⚡ Odpowiedź bez modelu ({routed.intent}) w {routed.elapsed_s * 1000:.0f} ms")
+                else:
+                    st.caption(f"💾 Odpowiedź z pamięci podręcznej w {(time.perf_counter() - started) * 1000:.0f} ms")
+            elif STREAM_RESPONSES:
+                from chat_streaming import StreamlitChatHandler, invoke_streaming
+
+                # Tokeny, postęp narzędzi i wykresy pojawiają się w dymku na bieżąco
+                handler = StreamlitChatHandler(st.container())
+                response = invoke_streaming(get_agent_executor(), {"input": user_input}, handler)
+                assistant_message = response.get("output", "Nie udało się uzyskać odpowiedzi.")
+                handler.finish(assistant_message)
+                chart_paths = handler.chart_paths
+                st.caption(
+                    f"⏱️ Pierwsza treść po {handler.first_output_s:.2f} s, "
+                    f"odpowiedź po {time.perf_counter() - handler.started:.2f} s · "
+                    f"prompt: do {max(handler.prompt_tokens, default=0)} tokenów "
+                    f"(historia: {st.session_state.memory.last_history_tokens})"
+                )
+            else:
+                from async_runtime import invoke
+
+                with st.spinner("Analizuję dane..."):
+                    response = invoke(get_agent_executor(), {"input": user_input})
                 assistant_message = response.get("output", "Nie udało się uzyskać odpowiedzi.")
                 
                 # Wyświetl tekst odpowiedzi
                 st.markdown(assistant_message)
-                
-                # Sprawdź, czy odpowiedź zawiera ścieżkę do wykresu
                 chart_paths = []
-                if "/tmp/chart_" in assistant_message:
-                    import re
-                    chart_paths = re.findall(r'/tmp/chart_\S+\.html', assistant_message)
-                    for chart_path in chart_paths:
-                        try:
-                            with open(chart_path, 'r', encoding='utf-8') as f:
-                                chart_html = f.read()
-                            st.components.v1.html(chart_html, height=600)
-                        except Exception as e:
-                            st.warning(f"Nie udało się wyświetlić wykresu: {e}")
-                
-                # Dodaj odpowiedź do historii (razem z ścieżkami do wykresów)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": assistant_message,
-                    "chart_paths": chart_paths  # DODAJ TĘ LINIĘ
-                })
-                
-            except Exception as e:
-                error_message = f"Błąd: {str(e)}"
-                st.error(error_message)
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": error_message,
-                    "chart_paths": []  # DODAJ TĘ LINIĘ
-                })
-
-# app.py - zmiana w sekcji wyświetlania historii
-for message in st.session_state.messages:
-    with st.chat_message(message["role"]):
-        st.markdown(message["content"])
-        # Jeśli wiadomość zawiera wykresy, wyświetl je
-        if message.get("chart_paths"):
-            for chart_path in message["chart_paths"]:
+            answered_by_agent = routed is None and cached is None
+            if answered_by_agent:
+                router.record_agent_latency(time.perf_counter() - started)
+            
+            # Sprawdź, czy odpowiedź zawiera ścieżkę do wykresu, który nie został jeszcze pokazany
+            # (figura z magazynu wykresów zamiast osadzania pliku HTML)
+            for chart_path in ready_charts + CHART_PATH_RE.findall(assistant_message):
+                if chart_path in chart_paths:
+                    continue
                 try:
-                    with open(chart_path, 'r', encoding='utf-8') as f:
-                        chart_html = f.read()
-                    st.components.v1.html(chart_html, height=600)
+                    st.plotly_chart(chart_store.load_figure(chart_path), use_container_width=True)
+                    chart_paths.append(chart_path)
                 except Exception as e:
                     st.warning(f"Nie udało się wyświetlić wykresu: {e}")
+            
+            if answered_by_agent and LLM_CACHE_ENABLED:
+                response_cache.put_answer(user_input, LLM_MODEL,
+                                          {"output": assistant_message, "chart_paths": chart_paths}, history_key)
+            
+            # Dodaj odpowiedź do historii (razem z ścieżkami do wykresów)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": assistant_message,
+                "chart_paths": chart_paths
+            })
+            
+        except Exception as e:
+            error_message = f"Błąd: {str(e)}"
+            st.error(error_message)
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": error_message,
+                "chart_paths": []
+            })
 
 # Sidebar z informacjami
 with st.sidebar:
@@ -186,13 +320,52 @@ with st.sidebar:
     
     if st.button("Wyświetl dostępne pojazdy"):
         try:
-            vehicles = get_available_vehicles_simple()
-            st.success(f"Dostępne pojazdy: {', '.join(vehicles)}")
+            _, agent_tools, _ = get_agent()
+            vehicles = next(t for t in agent_tools if t.name == "get_available_vehicles").invoke({})
+            if isinstance(vehicles, str):
+                # Komunikat o błędzie serwera narzędzi
+                st.error(vehicles)
+            else:
+                st.success(f"Dostępne pojazdy: {', '.join(vehicles)}")
         except Exception as e:
             st.error(f"Błąd: {e}")
     
+    if st.button("Statystyki wydajności"):
+        from intent_router import router
+        from llm_cache import response_cache
+        stats = router.stats()
+        st.info(
+            f"Szybka ścieżka - trafienia: {stats['hits']}/{stats['queries']} ({stats['hit_rate']:.0%}), "
+            f"średni czas: {stats['avg_routed_time_s'] * 1000:.0f} ms, "
+            f"zaoszczędzony czas: {stats['saved_time_s']:.1f} s"
+        )
+        cache_stats = response_cache.stats()
+        st.info(
+            f"Pamięć odpowiedzi - trafienia: {cache_stats['hits']}, chybienia: {cache_stats['misses']} "
+            f"({cache_stats['hit_rate']:.0%}), wpisy: {cache_stats['entries']} "
+            f"({cache_stats['bytes'] / 1024:.0f} KB)"
+        )
+    
+    with st.expander("🛠️ Panel debugowania"):
+        from instrumentation import metrics
+        summary = metrics.summary()
+        if summary:
+            st.caption("Narzędzia i wywołania modelu (ostatnie pomiary)")
+            st.dataframe([
+                {"nazwa": name, "rodzaj": s["kind"], "wywołania": s["calls"], "błędy": s["errors"],
+                 "p50 [ms]": round(s["p50_s"] * 1000, 1), "p95 [ms]": round(s["p95_s"] * 1000, 1),
+                 "baza [ms]": round(s["avg_db_s"] * 1000, 1), "wiersze": round(s["avg_rows"]),
+                 "wynik [B]": round(s["avg_bytes_out"]), "tokeny promptu": round(s["avg_tokens_in"])}
+                for name, s in summary.items()
+            ], hide_index=True)
+            st.caption("Ostatnie spany")
+            st.dataframe(metrics.recent_spans()[-20:][::-1], hide_index=True)
+        else:
+            st.caption("Brak pomiarów - zadaj pytanie.")
+    
     if st.button("Wyczyść historię czatu"):
         st.session_state.messages = []
+        st.session_state.pop("memory", None)
         st.success("Historia czatu została wyczyszczona.")
     
     st.markdown("---")
@@ -203,3 +376,28 @@ with st.sidebar:
     - "Wygeneruj wykres prędkości dla Pojazd_2 w dniu 2025-02-10."
     - "Jakie jest całkowite zużycie energii dla Pojazd_3?"
     """)
+
+    # Czas wykonania skryptu: pierwszy w procesie (zimny start) i bieżący rerun
+    timing_placeholder = st.empty()
+
+# Agent budowany po wyrenderowaniu strony - pierwsze wyświetlenie na niego nie czeka,
+# a pierwsze pytanie korzysta już z gotowego obiektu wspólnego dla procesu
+try:
+    get_agent()
+except Exception as e:
+    # Np. niedostępny serwer narzędzi MCP - kolejny rerun spróbuje ponownie
+    st.error(f"Nie udało się przygotować asystenta: {e}")
+    st.stop()
+
+script_s = time.perf_counter() - _SCRIPT_STARTED
+process_state = get_process_state()
+if process_state["cold_start_s"] is None:
+    process_state["cold_start_s"] = script_s
+    print(f"Zimny start aplikacji: {script_s:.2f} s (budowa agenta: {process_state['agent_build_s']:.2f} s)")
+
+with timing_placeholder.container():
+    st.caption(
+        f"⏱️ Zimny start: {process_state['cold_start_s']:.2f} s · "
+        f"ostatni rerun: {script_s:.2f} s"
+        + (" (w tym odpowiedź asystenta)" if user_input else "")
+    )
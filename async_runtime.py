@@ -0,0 +1,234 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import os
+import re
+import threading
+
+from dotenv import load_dotenv
+
+try:
+    import asyncpg
+except ImportError:  # pragma: no cover - asyncpg jest w requirements.txt
+    asyncpg = None
+
+# Wczytanie zmiennych środowiskowych
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL")
+
+# Agent wykonywany asynchronicznie (niezależne wywołania narzędzi równolegle); 0 - dawne invoke
+ASYNC_AGENT = os.getenv("ASYNC_AGENT", "1") != "0"
+# Pula połączeń asyncpg - wspólny limit połączeń dla narzędzi asynchronicznych procesu
+ASYNC_DB_POOL_MIN_SIZE = int(os.getenv("ASYNC_DB_POOL_MIN_SIZE", "1"))
+ASYNC_DB_POOL_MAX_SIZE = int(os.getenv("ASYNC_DB_POOL_MAX_SIZE", "10"))
+# Wątki do obliczeń pandas/plotly, aby nie blokowały pętli zdarzeń
+TOOL_WORKERS = int(os.getenv("TOOL_WORKERS", "4"))
+
+_PARAM_RE = re.compile(r"%s")
+
+_loop = None
+_workers = None
+_runtime_lock = threading.Lock()
+_db_pool = None
+_db_pool_lock = None
+
+
+def async_db_enabled() -> bool:
+    """Czy narzędzia asynchroniczne korzystają z asyncpg (bez niego - wersje synchroniczne w wątkach)."""
+    return asyncpg is not None and bool(DB_URL)
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Zwraca wspólną dla procesu pętlę zdarzeń działającą w osobnym wątku. Żyje w niej
+    pula asyncpg i klienci HTTP modelu, więc nie są związani z pętlą pojedynczej tury.
+    """
+    global _loop
+    if _loop is None:
+        with _runtime_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="async-runtime", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def _workers_pool() -> concurrent.futures.ThreadPoolExecutor:
+    global _workers
+    if _workers is None:
+        with _runtime_lock:
+            if _workers is None:
+                _workers = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=TOOL_WORKERS, thread_name_prefix="tool-worker")
+    return _workers
+
+
+def submit(coro) -> concurrent.futures.Future:
+    """
+    Uruchamia korutynę we wspólnej pętli i zwraca concurrent.futures.Future.
+    Korutyna dostaje kopię kontekstu wywołującego (np. bieżący span lub collect_spans).
+    Anulowanie zwróconego Future anuluje zadanie w pętli (Future kończy się od razu, a
+    korutyna dostaje CancelledError w najbliższym punkcie await).
+    """
+    return _submit(coro)[0]
+
+
+def _submit(coro):
+    """Jak `submit`, ale zwraca też Future kończone dopiero po faktycznym zakończeniu zadania."""
+    loop = get_loop()
+    result = concurrent.futures.Future()
+    finished = concurrent.futures.Future()
+
+    def start():
+        if result.cancelled():
+            coro.close()
+            finished.set_result(None)
+            return
+        task = loop.create_task(coro)
+        task.add_done_callback(functools.partial(_copy_outcome, result))
+        task.add_done_callback(lambda _: finished.set_result(None))
+        result.add_done_callback(functools.partial(_cancel_task, loop, task))
+
+    loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+    return result, finished
+
+
+def _cancel_task(loop, task, result):
+    if result.cancelled():
+        loop.call_soon_threadsafe(task.cancel)
+
+
+def _copy_outcome(result, task):
+    if task.cancelled():
+        result.cancel()
+    # Po tym wywołaniu Future nie da się już anulować (lub zostało anulowane wcześniej)
+    if not result.set_running_or_notify_cancel():
+        return
+    if task.exception() is not None:
+        result.set_exception(task.exception())
+    else:
+        result.set_result(task.result())
+
+
+def run(coro, timeout=None):
+    """Wykonuje korutynę we wspólnej pętli i czeka na wynik (dla kodu synchronicznego)."""
+    return submit(coro).result(timeout)
+
+
+def invoke(runnable, inputs, config=None):
+    """
+    Wykonuje turę agenta (AgentExecutor): przy ASYNC_AGENT przez `ainvoke` we wspólnej
+    pętli - niezależne wywołania narzędzi z jednej odpowiedzi modelu idą równolegle.
+    """
+    if ASYNC_AGENT:
+        return run(runnable.ainvoke(inputs, config=config))
+    return runnable.invoke(inputs, config=config)
+
+
+async def on_runtime(coro):
+    """
+    Await korutyny, która musi działać we wspólnej pętli (pula asyncpg), z dowolnej pętli.
+    Anulowanie kończy się dopiero, gdy zadanie we wspólnej pętli faktycznie się zakończy.
+    """
+    if asyncio.get_running_loop() is get_loop():
+        return await coro
+    result, finished = _submit(coro)
+    try:
+        return await asyncio.wrap_future(result)
+    except asyncio.CancelledError:
+        await asyncio.wait([asyncio.wrap_future(finished)])
+        raise
+
+
+async def to_worker(func, *args, **kwargs):
+    """
+    Wykonuje funkcję synchroniczną (pandas, plotly, psycopg2) w puli wątków TOOL_WORKERS.
+    Anulowanie usuwa z kolejki funkcję, która jeszcze nie ruszyła; rozpoczętej nie da się
+    przerwać, więc anulowanie kończy się dopiero razem z nią (wątek pozostaje zajęty).
+    """
+    call = functools.partial(contextvars.copy_context().run, func, *args, **kwargs)
+    future = _workers_pool().submit(call)
+    try:
+        return await asyncio.wrap_future(future)
+    except asyncio.CancelledError:
+        if not future.done():
+            await asyncio.wait([asyncio.wrap_future(future)])
+        raise
+
+
+async def _init_connection(conn):
+    # NUMERIC jako float zamiast Decimal - jak w transporcie kolumnowym i strumieniowym
+    await conn.set_type_codec("numeric", encoder=str, decoder=float, schema="pg_catalog", format="text")
+
+
+async def get_db_pool():
+    """
+    Zwraca pulę asyncpg procesu (tworzoną przy pierwszym użyciu). Wywoływać tylko we
+    wspólnej pętli (przez on_runtime) - połączenia asyncpg są związane z pętlą.
+    """
+    global _db_pool, _db_pool_lock
+    if _db_pool_lock is None:
+        _db_pool_lock = asyncio.Lock()
+    async with _db_pool_lock:
+        if _db_pool is None:
+            if not DB_URL:
+                raise ValueError("DATABASE_URL nie jest ustawione w zmiennych środowiskowych.")
+            _db_pool = await asyncpg.create_pool(
+                DB_URL, min_size=ASYNC_DB_POOL_MIN_SIZE, max_size=ASYNC_DB_POOL_MAX_SIZE,
+                init=_init_connection,
+            )
+    return _db_pool
+
+
+def pg_query(query: str) -> str:
+    """Zamienia parametry w stylu psycopg2 (%s) na numerowane parametry asyncpg ($1, $2, ...)."""
+    counter = iter(range(1, query.count("%s") + 1))
+    return _PARAM_RE.sub(lambda _: f"${next(counter)}", query)
+
+
+async def _fetch(method, query, params):
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        return await getattr(conn, method)(pg_query(query), *params)
+
+
+async def fetch(query: str, *params):
+    """Wiersze zapytania (zapytania w stylu psycopg2 z %s, jak w tools.py)."""
+    return await on_runtime(_fetch("fetch", query, params))
+
+
+async def fetchrow(query: str, *params):
+    """Pierwszy wiersz zapytania."""
+    return await on_runtime(_fetch("fetchrow", query, params))
+
+
+async def fetchval(query: str, *params):
+    """Pierwsza wartość pierwszego wiersza zapytania."""
+    return await on_runtime(_fetch("fetchval", query, params))
+
+
+async def _copy_csv(query, params, buffer):
+    async def write(data):
+        buffer.write(data)
+
+    pool = await get_db_pool()
+    async with pool.acquire() as conn:
+        await conn.copy_from_query(pg_query(query.strip().rstrip(";")), *params, output=write,
+                                   format="csv", header=True)
+
+
+async def copy_csv(query: str, params, buffer):
+    """Zapisuje wynik zapytania do pliku `buffer` jako COPY ... (FORMAT csv, HEADER true)."""
+    await on_runtime(_copy_csv(query, params, buffer))
+
+
+def db_pool_stats():
+    """Zwraca metryki puli asyncpg lub pusty słownik, jeśli pula nie powstała."""
+    if _db_pool is None:
+        return {}
+    return {
+        "size": _db_pool.get_size(),
+        "idle": _db_pool.get_idle_size(),
+        "max_size": _db_pool.get_max_size(),
+    }
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Union
+
+from langchain_core.tools import StructuredTool
+
+import rollups
+import tools
+from analysis import MetricsAccumulator
+from async_runtime import (asyncpg, async_db_enabled, copy_csv, fetch, fetchrow, fetchval, get_db_pool,
+                           on_runtime, pg_query, to_worker)
+from columnar import COPY_SPOOL_BYTES, columnar_enabled, parse_csv
+from dataset_registry import registry
+from instrumentation import db_call, traced_tool
+from streaming import RAW_SERIES_QUERY, STREAM_CHUNK_ROWS, compact_frame
+from vehicle_catalog import aget_catalog
+
+# Asynchroniczne wersje narzędzi z tools.py o tych samych nazwach, argumentach i wynikach.
+# Zapytania idą przez pulę asyncpg (async_runtime.py), a obliczenia pandas/plotly - do puli
+# wątków TOOL_WORKERS. Narzędzia bez własnej wersji działają w tej puli w całości.
+
+
+def _timestamp_bounds(start_date: str, end_date: str) -> tuple:
+    """Jak tools._date_bounds, ale jako datetime - asyncpg wymaga typów zgodnych z kolumną."""
+    return tuple(datetime.strptime(d, "%Y-%m-%d") for d in tools._date_bounds(start_date, end_date))
+
+
+async def _rollups_fresh(vehicle_ids: List[str], range_end: datetime) -> bool:
+    """Jak rollups.rollups_fresh - czy agregaty obejmują wiersze pojazdów przed `range_end`."""
+    try:
+        high_water_id, max_id = await fetchrow(rollups.ROLLUP_PROGRESS_QUERY)
+        fresh = rollups.pending_check(high_water_id, max_id)
+        if fresh is not None:
+            return fresh
+        query = rollups.PENDING_FROM_QUERY.format(high_water_id=int(high_water_id))
+        return rollups.range_covered(await fetchval(query, list(vehicle_ids)), range_end)
+    except asyncpg.PostgresError:
+        # Brak tabel agregatów - zapytania idą do surowych danych
+        return False
+
+
+@traced_tool
+async def get_available_vehicles() -> List[str]:
+    try:
+        return list(await aget_catalog())
+    except Exception as e:
+        return [f"Błąd podczas pobierania listy pojazdów: {e}"]
+
+
+@traced_tool
+async def get_data_range(vehicle_id: str) -> str:
+    try:
+        info = (await aget_catalog()).get(vehicle_id)
+        if info is None:
+            return f"Brak danych dla pojazdu {vehicle_id}."
+        return (f"Zakres dat dla {vehicle_id}: od {info.first_ts.strftime('%Y-%m-%d')} "
+                f"do {info.last_ts.strftime('%Y-%m-%d')}.")
+    except Exception as e:
+        return f"Błąd podczas pobierania zakresu dat: {e}"
+
+
+async def _read_series(query: str, params: tuple):
+    if not columnar_enabled():
+        return await to_worker(_read_series_sync, query, params)
+    with db_call() as call, tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_BYTES) as buffer:
+        await copy_csv(query, params, buffer)
+        df, spill_path = await to_worker(parse_csv, buffer)
+        call.rows = len(df)
+    return df, spill_path
+
+
+def _read_series_sync(query, params):
+    with tools.get_db_connection() as conn:
+        return tools._read_series(query, conn, params=params)
+
+
+@traced_tool
+async def fetch_data_for_chart(vehicle_id: str, start_date: str, end_date: str, resolution: str = "auto") -> str:
+    if resolution not in tools.RESOLUTIONS:
+        return f"Nieznana rozdzielczość: {resolution} (dozwolone: 'auto', 'raw', 'hour', 'day')."
+    try:
+        cache_key = (vehicle_id, start_date, end_date, resolution)
+        closed = tools._range_closed(vehicle_id, end_date, await aget_catalog())
+        handle = registry.find(cache_key) if closed else None
+        if handle is not None:
+            return json.dumps(registry.summary(handle), ensure_ascii=False)
+
+        bounds = _timestamp_bounds(start_date, end_date)
+        if resolution == "auto":
+            with db_call():
+                fresh = await _rollups_fresh([vehicle_id], bounds[1])
+            resolution = rollups.choose_resolution(*tools._date_bounds(start_date, end_date), fresh)
+        query = RAW_SERIES_QUERY if resolution == "raw" else rollups.series_query(resolution)
+        df, spill_path = await _read_series(query, (vehicle_id, *bounds))
+        return tools._register_series(df, spill_path, cache_key, resolution)
+    except Exception as e:
+        return f"Błąd podczas pobierania danych: {e}"
+
+
+async def _query_aggregate_metrics(vehicle_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
+    bounds = _timestamp_bounds(start_date, end_date)
+    with db_call() as call:
+        fresh = await _rollups_fresh([vehicle_id], bounds[1])
+        query = rollups.ROLLUP_METRICS_QUERY if fresh else tools.AGGREGATE_METRICS_QUERY
+        row = await fetchrow(query, vehicle_id, *bounds)
+        call.rows = 1
+    return tools._metrics_from_sums(*row, resolution="day" if fresh else "raw")
+
+
+@traced_tool
+async def calculate_range_metrics(vehicle_id: str, start_date: str, end_date: str) -> str:
+    try:
+        return json.dumps(await _query_aggregate_metrics(vehicle_id, start_date, end_date))
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+
+@traced_tool
+async def calculate_average_speed_in_range(vehicle_id: str, start_date: str, end_date: str) -> Union[float, str]:
+    try:
+        return (await _query_aggregate_metrics(vehicle_id, start_date, end_date))["avg_speed_kmh"]
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+
+@traced_tool
+async def calculate_total_distance_in_range(vehicle_id: str, start_date: str, end_date: str) -> Union[float, str]:
+    try:
+        return (await _query_aggregate_metrics(vehicle_id, start_date, end_date))["total_distance_km"]
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+
+@traced_tool
+async def calculate_energy_per_km_in_range(vehicle_id: str, start_date: str, end_date: str,
+                                           energy_type: str = "total") -> Union[float, str]:
+    if energy_type not in ("traction", "hvac", "total"):
+        return f"Nieznany rodzaj energii: {energy_type} (dozwolone: 'traction', 'hvac', 'total')."
+    try:
+        return (await _query_aggregate_metrics(vehicle_id, start_date, end_date))[f"{energy_type}_energy_per_km"]
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+
+@traced_tool
+async def compare_vehicles(vehicle_ids: List[str], start_date: str, end_date: str,
+                           sort_by: str = "total_energy_per_km", top_n: int = 20, chart: bool = False) -> str:
+    if sort_by not in tools.FLEET_COLUMNS:
+        return f"Nieznana metryka rankingu: {sort_by} (dozwolone: {', '.join(tools.FLEET_COLUMNS)})."
+    try:
+        requested, unknown = tools._fleet_selection(vehicle_ids, await aget_catalog())
+        metrics = {}
+        if requested:
+            bounds = _timestamp_bounds(start_date, end_date)
+            with db_call() as call:
+                fresh = await _rollups_fresh(requested, bounds[1])
+                query = rollups.ROLLUP_FLEET_METRICS_QUERY if fresh else tools.AGGREGATE_FLEET_METRICS_QUERY
+                rows = await fetch(query, requested, *bounds)
+                call.rows = len(rows)
+            resolution = "day" if fresh else "raw"
+            metrics = {row[0]: tools._metrics_from_sums(*row[1:], resolution=resolution) for row in rows if row[1]}
+    except Exception as e:
+        return f"Błąd podczas porównywania pojazdów: {e}"
+    # Tabela i wykres (plotly) w puli wątków
+    return await to_worker(tools._format_fleet, metrics, requested, unknown, start_date, end_date,
+                           sort_by, top_n, chart)
+
+
+async def _stream_metrics(vehicle_id: str, start_date: str, end_date: str) -> MetricsAccumulator:
+    """
+    Czyta surowe pomiary kursorem asyncpg w paczkach STREAM_CHUNK_ROWS. Kolejna paczka jest
+    pobierana, gdy poprzednia jest składana w puli wątków - w pamięci są najwyżej dwie.
+    """
+    accumulator = MetricsAccumulator()
+    pool = await get_db_pool()
+    async with pool.acquire() as conn, conn.transaction():
+        statement = await conn.prepare(pg_query(RAW_SERIES_QUERY))
+        columns = [attribute.name for attribute in statement.get_attributes()]
+        cursor = await statement.cursor(vehicle_id, *_timestamp_bounds(start_date, end_date))
+        folding = None
+        try:
+            while True:
+                with db_call() as call:
+                    rows = await cursor.fetch(STREAM_CHUNK_ROWS)
+                    call.rows = len(rows)
+                if folding is not None:
+                    await folding
+                if not rows:
+                    return accumulator
+                folding = asyncio.ensure_future(to_worker(
+                    lambda chunk: accumulator.add_frame(compact_frame(chunk, columns)), rows))
+        except asyncio.CancelledError:
+            # Składanie paczki w wątku nie może przeżyć anulowanego raportu
+            if folding is not None and not folding.done():
+                folding.cancel()
+                await asyncio.wait([folding])
+            raise
+
+
+@traced_tool
+async def generate_range_report(vehicle_id: str, start_date: str, end_date: str) -> str:
+    try:
+        accumulator = await on_runtime(_stream_metrics(vehicle_id, start_date, end_date))
+        result = accumulator.result()
+    except Exception as e:
+        return f"Błąd podczas generowania raportu: {e}"
+    if result.samples == 0:
+        return f"Brak danych dla pojazdu {vehicle_id} w zakresie od {start_date} do {end_date}."
+    return tools._format_report(vehicle_id, start_date, end_date, result)
+
+
+# Narzędzia z własną wersją asynchroniczną (zapytania przez asyncpg)
+ASYNC_IMPLEMENTATIONS = {
+    func.__name__: func for func in (
+        get_available_vehicles,
+        get_data_range,
+        fetch_data_for_chart,
+        calculate_range_metrics,
+        calculate_average_speed_in_range,
+        calculate_total_distance_in_range,
+        calculate_energy_per_km_in_range,
+        compare_vehicles,
+        generate_range_report,
+    )
+}
+
+
+def _in_worker(func):
+    async def coroutine(*args, **kwargs):
+        return await to_worker(func, *args, **kwargs)
+    return coroutine
+
+
+def with_async(tool_list):
+    """
+    Zwraca kopie narzędzi z wersją asynchroniczną (`coroutine`), z której korzysta
+    AgentExecutor.ainvoke - niezależne wywołania z jednej odpowiedzi modelu wykonują się
+    równolegle. Wersja synchroniczna (`invoke`) pozostaje bez zmian. Narzędzia, które
+    mają już wersję asynchroniczną (np. zdalne z mcp_client.py), są zwracane bez zmian.
+    """
+    result = []
+    for tool in tool_list:
+        if getattr(tool, "coroutine", None) is not None:
+            result.append(tool)
+            continue
+        coroutine = ASYNC_IMPLEMENTATIONS.get(tool.name) if async_db_enabled() else None
+        result.append(StructuredTool(
+            name=tool.name, description=tool.description, args_schema=tool.args_schema,
+            return_direct=tool.return_direct, func=tool.func, coroutine=coroutine or _in_worker(tool.func),
+        ))
+    return result
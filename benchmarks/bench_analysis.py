@@ -0,0 +1,80 @@
+"""
+Porównanie dotychczasowego sposobu liczenia raportu (pięć narzędzi, każde parsuje
+JSON i liczy metrykę w pandas) z jednoprzebiegowym silnikiem analysis.analyze_frame.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/bench_analysis.py --rows 1000000
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from analysis import SAMPLE_INTERVAL_H, analyze_frame  # noqa: E402
+from db_manager import generate_vehicle_telemetry  # noqa: E402
+
+
+def legacy_report_metrics(data_json):
+    """Odtworzenie dawnych obliczeń: każda metryka osobno parsuje JSON."""
+    def energy_per_km(df, power_col):
+        df['energy_kwh'] = df[power_col] * SAMPLE_INTERVAL_H
+        distance = df['distance_km'].sum()
+        return round(df['energy_kwh'].sum() / distance, 4) if distance else 0.0
+
+    avg_speed = round(pd.read_json(io.StringIO(data_json))['speed_kmh'].mean(), 2)
+    total_dist = round(pd.read_json(io.StringIO(data_json))['distance_km'].sum(), 2)
+    traction = energy_per_km(pd.read_json(io.StringIO(data_json)), 'traction_power_kw')
+    hvac = energy_per_km(pd.read_json(io.StringIO(data_json)), 'hvac_power_kw')
+    df = pd.read_json(io.StringIO(data_json))
+    df['total_power_kw'] = df['traction_power_kw'] + df['hvac_power_kw']
+    total = energy_per_km(df, 'total_power_kw')
+    return avg_speed, total_dist, traction, hvac, total
+
+
+def timed(fn, *args, repeat=3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Liczba wierszy (domyślnie 1 000 000).")
+    parser.add_argument("--repeat", type=int, default=3, help="Liczba powtórzeń (liczy się najlepszy czas).")
+    args = parser.parse_args()
+
+    df = generate_vehicle_telemetry("Pojazd_1", args.rows, seed=0).drop(columns=["vehicle_id"])
+    json_df = df.assign(timestamp=df["timestamp"].dt.strftime('%Y-%m-%d %H:%M:%S'))
+    data_json = json_df.to_json(orient="records")
+    print(f"Wiersze: {args.rows}, rozmiar JSON: {len(data_json) / 1e6:.1f} MB")
+
+    legacy_s, legacy = timed(legacy_report_metrics, data_json, repeat=args.repeat)
+    json_s, from_json = timed(lambda s: analyze_frame(pd.read_json(io.StringIO(s))), data_json, repeat=args.repeat)
+    frame_s, from_frame = timed(analyze_frame, df, repeat=args.repeat)
+
+    metrics = from_frame.to_dict()
+    expected = (metrics["avg_speed_kmh"], metrics["total_distance_km"], metrics["traction_energy_per_km"],
+                metrics["hvac_energy_per_km"], metrics["total_energy_per_km"])
+    assert legacy == expected, f"Niezgodne wyniki: {legacy} != {expected}"
+    assert from_json.to_dict() == metrics
+
+    print(f"{'wariant':<38}{'czas [s]':>10}{'przyspieszenie':>16}")
+    for name, seconds in [
+        ("dawny raport (5x read_json + pandas)", legacy_s),
+        ("analyze_frame z JSON (1x read_json)", json_s),
+        ("analyze_frame z uchwytu (bez JSON)", frame_s),
+    ]:
+        print(f"{name:<38}{seconds:>10.3f}{legacy_s / seconds:>15.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""
+Benchmark ścieżki danych narzędzi (tools.py) dla zbiorów od 1 tys. do 10 mln wierszy.
+
+Dla każdego rozmiaru mierzy czas (najlepszy z kilku powtórzeń), szczyt pamięci
+(tracemalloc) i rozmiar wyniku narzędzia: fetch_data_for_chart, calculate_*,
+format_analysis_report oraz obu generatorów wykresów. Wyniki są porównywane
+z zapisaną linią bazową (benchmarks/baseline_tools.json).
+
+Dane syntetyczne trafiają do osobnego schematu (domyślnie 'vehicle_bench') w bazie
+z BENCH_DATABASE_URL lub DATABASE_URL - tabela vehicle_data aplikacji nie jest
+zmieniana. Każdy rozmiar to osobny pojazd (np. 'Bench_1M'); raz załadowane dane
+są używane ponownie w kolejnych uruchomieniach.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/bench_tools.py --sizes 1k,100k,1M,10M
+    python benchmarks/bench_tools.py --sizes 1k,100k --save-baseline
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+DEFAULT_SIZES = "1k,100k,1M,10M"
+DEFAULT_SCHEMA = "vehicle_bench"
+BASELINE_PATH = os.path.join(REPO_DIR, "benchmarks", "baseline_tools.json")
+
+# Odstęp między pomiarami w danych syntetycznych (jak w db_manager)
+INTERVAL_S = 60
+
+# Dopuszczalny wzrost czasu i pamięci względem linii bazowej, zanim zgłosimy regresję
+DEFAULT_TOLERANCE = 0.25
+# Różnice poniżej tych progów są traktowane jako szum pomiaru
+LATENCY_SLACK_S = 0.002
+MEMORY_SLACK_MB = 1.0
+
+CALCULATE_TOOLS = (
+    "calculate_average_speed",
+    "calculate_total_distance",
+    "calculate_traction_energy_per_km",
+    "calculate_hvac_energy_per_km",
+    "calculate_total_energy_per_km",
+)
+MULTI_CHART_PARAMETERS = ["speed_kmh", "traction_power_kw", "hvac_power_kw"]
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(text):
+    """Zamienia rozmiar w postaci '1k', '100k', '1M' lub '2500' na liczbę wierszy."""
+    text = text.strip().lower()
+    multiplier = SIZE_SUFFIXES.get(text[-1:], 1)
+    number = text[:-1] if text[-1:] in SIZE_SUFFIXES else text
+    return int(float(number) * multiplier)
+
+
+def size_label(rows):
+    for suffix, multiplier in (("M", 1_000_000), ("k", 1_000)):
+        if rows >= multiplier and rows % multiplier == 0:
+            return f"{rows // multiplier}{suffix}"
+    return str(rows)
+
+
+def configure_environment(dsn, schema, chart_dir):
+    """
+    Kieruje pulę połączeń narzędzi do schematu benchmarku. Musi być wywołane
+    przed importem tools/db_pool, które czytają DATABASE_URL przy imporcie.
+    """
+    from psycopg2.extensions import make_dsn
+
+    os.environ["DATABASE_URL"] = make_dsn(dsn, options=f"-c search_path={schema}")
+    os.environ["CHART_DIR"] = chart_dir
+    # Cały zbiór 10M musi zmieścić się w rejestrze, inaczej zostałby od razu usunięty
+    os.environ.setdefault("DATASET_CACHE_MAX_MB", "65536")
+
+
+def seed(sizes, schema, reseed=False):
+    """
+    Ładuje brakujące pojazdy 'Bench_<rozmiar>' do schematu benchmarku (COPY przez
+    db_manager.bulk_load). Niekompletne dane (np. po przerwanym ładowaniu) oznaczają
+    odtworzenie schematu od zera.
+    """
+    import psycopg2
+    from db_manager import DEFAULT_START_DATE, bulk_load, create_table, generate_vehicle_telemetry
+
+    conn = psycopg2.connect(os.environ["DATABASE_URL"])
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema};")
+        conn.commit()
+        create_table(conn, schema_mode="simple")
+
+        counts = {}
+        with conn.cursor() as cur:
+            cur.execute("SELECT vehicle_id, COUNT(*) FROM vehicle_data GROUP BY vehicle_id;")
+            counts = dict(cur.fetchall())
+
+        broken = [rows for rows in sizes if counts.get(vehicle_for(rows), 0) not in (0, rows)]
+        if reseed or broken:
+            print(f"Odtwarzanie schematu {schema}...")
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA {schema} CASCADE; CREATE SCHEMA {schema};")
+            conn.commit()
+            create_table(conn, schema_mode="simple")
+            counts = {}
+
+        missing = [rows for rows in sizes if counts.get(vehicle_for(rows), 0) == 0]
+        for i, rows in enumerate(missing):
+            print(f"Generowanie {rows} wierszy dla {vehicle_for(rows)}...")
+            df = generate_vehicle_telemetry(vehicle_for(rows), rows, start_date=DEFAULT_START_DATE,
+                                            interval_s=INTERVAL_S, seed=rows)
+            # Agregaty odświeżamy raz, po ostatnim pojeździe
+            bulk_load(conn, df, update_rollups=i == len(missing) - 1)
+            del df
+        if missing:
+            with conn.cursor() as cur:
+                cur.execute("ANALYZE vehicle_data;")
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def vehicle_for(rows):
+    return f"Bench_{size_label(rows)}"
+
+
+def date_range(rows):
+    """Zakres dat 'YYYY-MM-DD' obejmujący wszystkie pomiary pojazdu danego rozmiaru."""
+    from db_manager import DEFAULT_START_DATE
+
+    first = DEFAULT_START_DATE + timedelta(seconds=INTERVAL_S)
+    last = DEFAULT_START_DATE + timedelta(seconds=INTERVAL_S * rows)
+    return first.strftime("%Y-%m-%d"), last.strftime("%Y-%m-%d")
+
+
+def clear_charts(chart_dir):
+    """Usuwa zapisane wykresy, aby każdy pomiar renderował wykres od nowa (plotly.min.js zostaje)."""
+    for name in os.listdir(chart_dir):
+        if name.startswith("chart_"):
+            os.remove(os.path.join(chart_dir, name))
+
+
+def measure(tool, prepare, repeat):
+    """
+    Mierzy jedno narzędzie. `prepare()` przywraca zimny stan (puste pamięci podręczne)
+    i zwraca argumenty wywołania. Czas to najlepszy z `repeat` przebiegów bez śledzenia
+    pamięci; szczyt pamięci pochodzi z osobnego przebiegu pod tracemalloc.
+    """
+    from instrumentation import metrics
+
+    best = float("inf")
+    for _ in range(repeat):
+        args = prepare()
+        started = time.perf_counter()
+        tool.invoke(args)
+        elapsed = time.perf_counter() - started
+        if elapsed < best:
+            # Czas bazy i liczba wierszy z tego samego (najszybszego) przebiegu
+            best, span = elapsed, metrics.recent_spans()[-1]
+
+    # Wynik ostatniego przebiegu zostaje zwrócony (np. uchwyt zbioru z fetch_data_for_chart)
+    args = prepare()
+    tracemalloc.start()
+    try:
+        output = tool.invoke(args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    text = output if isinstance(output, str) else json.dumps(output, ensure_ascii=False)
+    return {
+        "latency_s": round(best, 6),
+        "peak_mb": round(peak / 1024 / 1024, 3),
+        "payload_bytes": len(text.encode("utf-8")),
+        "db_s": round(span["db_time_s"], 6),
+        "rows": span["rows"],
+        "error": span["error"] if span["status"] == "error" else None,
+    }, output
+
+
+def run_size(rows, chart_dir, repeat):
+    """Mierzy wszystkie narzędzia na zbiorze `rows` wierszy. Zwraca słownik narzędzie -> wyniki."""
+    import tools
+    from dataset_registry import registry
+
+    vehicle_id = vehicle_for(rows)
+    start_date, end_date = date_range(rows)
+    fetch_args = {"vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date, "resolution": "raw"}
+    results = {}
+
+    def prepare_fetch():
+        registry.clear()
+        return fetch_args
+
+    results["fetch_data_for_chart"], output = measure(tools.fetch_data_for_chart, prepare_fetch, repeat)
+    summary = json.loads(output)
+    key = (vehicle_id, start_date, end_date, "raw")
+    df = registry.get(summary["dataset"])
+
+    def with_dataset(**extra):
+        # Świeży uchwyt bez policzonych wcześniej metryk i bez zapisanych wykresów
+        def prepare():
+            registry.clear()
+            clear_charts(chart_dir)
+            handle = registry.register(df, key=key, meta={"vehicle_id": vehicle_id, "resolution": "raw"})
+            return {"data_json": handle, **extra}
+        return prepare
+
+    for name in CALCULATE_TOOLS:
+        results[name], _ = measure(getattr(tools, name), with_dataset(), repeat)
+    results["format_analysis_report"], _ = measure(
+        tools.format_analysis_report,
+        with_dataset(vehicle_id=vehicle_id, start_date=start_date, end_date=end_date),
+        repeat,
+    )
+    results["generate_single_chart"], _ = measure(
+        tools.generate_single_chart, with_dataset(parameter="traction_power_kw"), repeat
+    )
+    results["generate_multi_chart"], _ = measure(
+        tools.generate_multi_chart, with_dataset(parameters=MULTI_CHART_PARAMETERS), repeat
+    )
+    registry.clear()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Porównuje wyniki z linią bazową. Zwraca listę regresji: wzrost czasu lub pamięci
+    powyżej `tolerance` (i ponad próg szumu) albo zmiana rozmiaru wyniku.
+    """
+    regressions = []
+    for size, tools_results in results.items():
+        for name, current in tools_results.items():
+            previous = baseline.get(size, {}).get(name)
+            if not previous:
+                continue
+            if (current["latency_s"] > previous["latency_s"] * (1 + tolerance)
+                    and current["latency_s"] - previous["latency_s"] > LATENCY_SLACK_S):
+                regressions.append(f"{size} {name}: czas {previous['latency_s'] * 1000:.1f} -> "
+                                   f"{current['latency_s'] * 1000:.1f} ms")
+            if (current["peak_mb"] > previous["peak_mb"] * (1 + tolerance)
+                    and current["peak_mb"] - previous["peak_mb"] > MEMORY_SLACK_MB):
+                regressions.append(f"{size} {name}: pamięć {previous['peak_mb']:.1f} -> "
+                                   f"{current['peak_mb']:.1f} MB")
+            if current["payload_bytes"] != previous["payload_bytes"]:
+                regressions.append(f"{size} {name}: wynik {previous['payload_bytes']} -> "
+                                   f"{current['payload_bytes']} B")
+    return regressions
+
+
+def print_results(size, tools_results, baseline):
+    print(f"\n=== {size} wierszy ===")
+    print(f"{'narzędzie':<34}{'czas [ms]':>11}{'baza [ms]':>11}{'pamięć [MB]':>13}"
+          f"{'wynik [B]':>11}{'wiersze':>10}{'vs bazowa':>11}")
+    for name, r in tools_results.items():
+        previous = baseline.get(size, {}).get(name)
+        ratio = f"{r['latency_s'] / previous['latency_s']:.2f}x" if previous and previous["latency_s"] else "-"
+        print(f"{name:<34}{r['latency_s'] * 1000:>11.1f}{r['db_s'] * 1000:>11.1f}{r['peak_mb']:>13.1f}"
+              f"{r['payload_bytes']:>11}{r['rows']:>10}{ratio:>11}")
+        if r["error"]:
+            print(f"    błąd: {r['error']}")
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("results", {})
+
+
+def save_results(path, results, repeat, merge_with=None):
+    """Zapisuje wyniki (z metadanymi środowiska); `merge_with` zachowuje inne rozmiary z linii bazowej."""
+    import pandas as pd
+
+    merged = dict(merge_with or {})
+    merged.update(results)
+    payload = {
+        "meta": {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "repeat": repeat,
+        },
+        "results": dict(sorted(merged.items(), key=lambda item: int(item[0]))),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+    print(f"\nZapisano wyniki: {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"Rozmiary zbiorów oddzielone przecinkami (domyślnie {DEFAULT_SIZES}).")
+    parser.add_argument("--repeat", type=int, default=3, help="Liczba powtórzeń (liczy się najlepszy czas).")
+    parser.add_argument("--dsn", default=os.getenv("BENCH_DATABASE_URL") or os.getenv("DATABASE_URL"),
+                        help="Adres bazy PostgreSQL (domyślnie BENCH_DATABASE_URL lub DATABASE_URL).")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA, help=f"Schemat na dane (domyślnie {DEFAULT_SCHEMA}).")
+    parser.add_argument("--reseed", action="store_true", help="Wygeneruj dane od nowa.")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Plik linii bazowej.")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Zapisz wyniki jako nową linię bazową (pozostałe rozmiary zostają).")
+    parser.add_argument("--output", help="Dodatkowo zapisz wyniki tego uruchomienia do pliku JSON.")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="Dopuszczalny względny wzrost czasu i pamięci (domyślnie 0.25).")
+    args = parser.parse_args()
+
+    if not args.dsn:
+        parser.error("Brak adresu bazy: ustaw BENCH_DATABASE_URL/DATABASE_URL lub podaj --dsn.")
+    sizes = [parse_size(size) for size in args.sizes.split(",") if size.strip()]
+
+    chart_dir = tempfile.mkdtemp(prefix="bench_charts_")
+    configure_environment(args.dsn, args.schema, chart_dir)
+    seed(sizes, args.schema, reseed=args.reseed)
+
+    baseline = load_baseline(args.baseline)
+    results = {}
+    for rows in sizes:
+        results[str(rows)] = run_size(rows, chart_dir, args.repeat)
+        print_results(str(rows), results[str(rows)], baseline)
+
+    if args.output:
+        save_results(args.output, results, args.repeat)
+    if args.save_baseline:
+        save_results(args.baseline, results, args.repeat, merge_with=baseline)
+        return 0
+
+    regressions = compare(results, baseline, args.tolerance)
+    if not baseline:
+        print("\nBrak linii bazowej - uruchom z --save-baseline, aby ją zapisać.")
+    elif regressions:
+        print(f"\nRegresje względem linii bazowej (tolerancja {args.tolerance:.0%}):")
+        for line in regressions:
+            print(f"- {line}")
+        return 1
+    else:
+        print("\nBrak regresji względem linii bazowej.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Test obciążeniowy usługi ingest_service.py: N nadawców wysyła próbki telemetrii
+paczkami przez HTTP (POST /ingest, protokół liniowy) albo strumieniem TCP.
+
+Raport podaje liczbę próbek/s przyjętych przez usługę oraz zapisanych w bazie
+(według /health), odpowiedzi 503 (wstrzymanie przy pełnym buforze) i czas, po którym
+bufor został opróżniony po zakończeniu wysyłania.
+
+Uruchomienie (usługa działa, z katalogu głównego repozytorium):
+    python ingest_service.py
+    python benchmarks/ingest_load.py --senders 4 --samples 200000
+    python benchmarks/ingest_load.py --senders 8 --samples 500000 --transport tcp
+"""
+import argparse
+import json
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+DEFAULT_URL = "http://127.0.0.1:8100"
+
+
+def _lines(sender: int, count: int, offset: int):
+    """Próbki nadawcy `sender` w formacie protokołu liniowego (po sekundzie, od 2030-01-01)."""
+    vehicle_id = f"Ingest_Bench_{sender}"
+    start = datetime(2030, 1, 1) + timedelta(seconds=offset)
+    return "".join(
+        f"{vehicle_id},{(start + timedelta(seconds=i)).isoformat(sep=' ')},{40 + i % 30},{15 + i % 20},2.5,0.011\n"
+        for i in range(count)
+    )
+
+
+def _send_http(url, sender, samples, batch, stats, lock):
+    sent = 0
+    with httpx.Client(timeout=30) as client:
+        while sent < samples:
+            count = min(batch, samples - sent)
+            body = _lines(sender, count, sent)
+            while True:
+                response = client.post(f"{url}/ingest", content=body, headers={"content-type": "text/plain"})
+                if response.status_code != 503:
+                    break
+                with lock:
+                    stats["throttled"] += 1
+                time.sleep(float(response.headers.get("Retry-After", "1")))
+            response.raise_for_status()
+            with lock:
+                stats["accepted"] += response.json()["accepted"]
+            sent += count
+
+
+def _send_tcp(host, port, sender, samples, batch, stats, lock):
+    sent = 0
+    with socket.create_connection((host, port)) as sock:
+        while sent < samples:
+            count = min(batch, samples - sent)
+            sock.sendall(_lines(sender, count, sent).encode())
+            sent += count
+    with lock:
+        stats["accepted"] += samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--url", default=DEFAULT_URL, help=f"Adres HTTP usługi (domyślnie {DEFAULT_URL}).")
+    parser.add_argument("--transport", choices=("http", "tcp"), default="http", help="Sposób wysyłania próbek.")
+    parser.add_argument("--tcp-port", type=int, default=8101, help="Port protokołu liniowego TCP.")
+    parser.add_argument("--senders", type=int, default=4, help="Liczba równoległych nadawców (pojazdów).")
+    parser.add_argument("--samples", type=int, default=200_000, help="Łączna liczba próbek.")
+    parser.add_argument("--batch", type=int, default=1000, help="Próbek w jednym żądaniu HTTP / zapisie TCP.")
+    parser.add_argument("--drain-timeout", type=float, default=120, help="Maks. czas oczekiwania na zapis bufora.")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    before = httpx.get(f"{url}/health").json()
+    stats = {"accepted": 0, "throttled": 0}
+    lock = threading.Lock()
+    per_sender = args.samples // args.senders
+    if args.transport == "http":
+        target, params = _send_http, (url,)
+    else:
+        target, params = _send_tcp, (httpx.URL(url).host, args.tcp_port)
+    threads = [threading.Thread(target=target, args=(*params, sender, per_sender, args.batch, stats, lock))
+               for sender in range(args.senders)]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sent_s = time.perf_counter() - started
+
+    total = per_sender * args.senders
+    health = before
+    while time.perf_counter() - started < sent_s + args.drain_timeout:
+        health = httpx.get(f"{url}/health").json()
+        if health["written_rows"] - before["written_rows"] >= total or (
+                health["accepted"] - before["accepted"] >= total and health["pending_rows"] == 0):
+            break
+        time.sleep(0.1)
+    written_s = time.perf_counter() - started
+    written = health["written_rows"] - before["written_rows"]
+
+    result = {
+        "transport": args.transport,
+        "senders": args.senders,
+        "samples": total,
+        "accepted_per_s": round(total / sent_s),
+        "written": written,
+        "written_per_s": round(written / written_s),
+        "drain_s": round(written_s - sent_s, 2),
+        "throttled_responses": stats["throttled"],
+        "rejected": health["rejected"] - before["rejected"],
+    }
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
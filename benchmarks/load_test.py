@@ -0,0 +1,407 @@
+"""
+Test obciążeniowy całej ścieżki czatu: AgentExecutor z main.py, narzędzia i baza danych,
+z lokalnym modelem udającym LLM (bez klucza OpenAI).
+
+Model ScriptedChatModel czyta pytanie użytkownika i wywołuje narzędzia w takiej
+kolejności, jak robi to prawdziwy agent (np. fetch_data_for_chart -> generate_single_chart),
+odczekując zadany czas odpowiedzi modelu. Scenariusz "summary" zleca kilka niezależnych
+narzędzi w jednej odpowiedzi - przy ASYNC_AGENT wykonują się one równolegle. N sesji (wątków) zadaje pytania równolegle,
+każda z własną pamięcią rozmowy, a zapytania idą do prawdziwej bazy z DATABASE_URL.
+
+Dla każdego poziomu współbieżności raport podaje przepustowość (tury/s) oraz p50/p95/p99
+czasu tury z podziałem na model, narzędzia (bez bazy), bazę i resztę (agent, pamięć),
+a także oczekiwanie na połączenie z puli i pracę magazynu wykresów.
+
+Uruchomienie (z katalogu głównego repozytorium):
+    python benchmarks/load_test.py --sessions 1,4,16 --turns 10
+    python benchmarks/load_test.py --sessions 8 --llm-latency-ms 0 --mix chart=1
+    python benchmarks/load_test.py --sessions 4 --mix summary=1
+    python benchmarks/load_test.py --sessions 1,4,16 --mcp-url http://localhost:8000  # narzędzia z mcp_server.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel  # noqa: E402
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage  # noqa: E402
+from langchain_core.outputs import ChatGeneration, ChatResult  # noqa: E402
+
+from chat_memory import count_message_tokens, count_tokens  # noqa: E402
+
+# Scenariusze rozmowy: szablon pytania i kolejne wywołania narzędzi, które wykona model.
+# W argumentach '{...}' to pola pytania, a '$dataset' - uchwyt z ostatniego fetch_data_for_chart.
+# Krok będący listą wywołań to jedna odpowiedź modelu z kilkoma niezależnymi narzędziami.
+SCENARIOS = {
+    "metrics": (
+        "Jaka była średnia prędkość i zużycie energii {vehicle_id} od {start_date} do {end_date}?",
+        [
+            ("get_data_range", {"vehicle_id": "{vehicle_id}"}),
+            ("calculate_range_metrics", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                         "end_date": "{end_date}"}),
+        ],
+    ),
+    "report": (
+        "Przygotuj raport dla {vehicle_id} od {start_date} do {end_date}.",
+        [
+            ("fetch_data_for_chart", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                      "end_date": "{end_date}"}),
+            ("format_analysis_report", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                        "end_date": "{end_date}", "data_json": "$dataset"}),
+        ],
+    ),
+    "chart": (
+        "Pokaż wykres mocy trakcyjnej {vehicle_id} od {start_date} do {end_date}.",
+        [
+            ("fetch_data_for_chart", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                      "end_date": "{end_date}"}),
+            ("generate_single_chart", {"data_json": "$dataset", "parameter": "traction_power_kw"}),
+        ],
+    ),
+    "multi_chart": (
+        "Pokaż na jednym wykresie prędkość i moce {vehicle_id} od {start_date} do {end_date}.",
+        [
+            ("fetch_data_for_chart", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                      "end_date": "{end_date}"}),
+            ("generate_multi_chart", {"data_json": "$dataset",
+                                      "parameters": ["speed_kmh", "traction_power_kw", "hvac_power_kw"]}),
+        ],
+    ),
+    "summary": (
+        "Podsumuj {vehicle_id} od {start_date} do {end_date}.",
+        [
+            [
+                ("get_data_range", {"vehicle_id": "{vehicle_id}"}),
+                ("calculate_range_metrics", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                             "end_date": "{end_date}"}),
+                ("generate_range_report", {"vehicle_id": "{vehicle_id}", "start_date": "{start_date}",
+                                           "end_date": "{end_date}"}),
+            ],
+        ],
+    ),
+    "fleet": (
+        "Porównaj wszystkie pojazdy od {start_date} do {end_date}.",
+        [
+            ("compare_vehicles", {"vehicle_ids": ["all"], "start_date": "{start_date}", "end_date": "{end_date}"}),
+        ],
+    ),
+    "vehicles": (
+        "Jakie pojazdy są dostępne?",
+        [("get_available_vehicles", {})],
+    ),
+}
+DEFAULT_MIX = "metrics=3,report=2,chart=2,multi_chart=1,vehicles=1"
+
+# Rozpoznawanie scenariusza i parametrów z treści pytania (kolejność ma znaczenie)
+SCENARIO_KEYWORDS = (
+    ("Porównaj", "fleet"),
+    ("Podsumuj", "summary"),
+    ("raport", "report"),
+    ("na jednym wykresie", "multi_chart"),
+    ("wykres", "chart"),
+    ("średnia", "metrics"),
+    ("pojazdy", "vehicles"),
+)
+QUESTION_RE = re.compile(r"(?P<vehicle_id>\S+) od (?P<start_date>\d{4}-\d{2}-\d{2}) do (?P<end_date>\d{4}-\d{2}-\d{2})")
+# Zapytanie o streszczenie historii (chat_memory.SUMMARY_PROMPT)
+SUMMARY_MARKER = "Nowe streszczenie:"
+FINAL_ANSWER_MAX_CHARS = 300
+
+
+def _resolve(value, fields, dataset):
+    if isinstance(value, list):
+        return [_resolve(item, fields, dataset) for item in value]
+    if value == "$dataset":
+        return dataset
+    return value.format(**fields)
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Model udający LLM z wywoływaniem narzędzi. Kolejne wywołania w ramach tury
+    zwracają kolejne kroki scenariusza rozpoznanego z pytania, a na końcu krótką
+    odpowiedź z wynikiem ostatniego narzędzia. Każde wywołanie trwa `latency_s`
+    (± `jitter`), jak oczekiwanie na odpowiedź API.
+    """
+
+    latency_s: float = 0.8
+    jitter: float = 0.3
+    model_name: str = "scripted-fake"
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        # Scenariusze znają nazwy narzędzi, schematy nie są potrzebne
+        return self
+
+    def _next_message(self, messages: List[BaseMessage]) -> AIMessage:
+        last_human = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        question = messages[last_human].content
+        if SUMMARY_MARKER in question:
+            return AIMessage(content="Użytkownik pytał o dane pojazdów; odpowiedzi zawierały metryki i wykresy.")
+
+        results = [m.content for m in messages[last_human + 1:] if isinstance(m, ToolMessage)]
+        scenario = next((name for keyword, name in SCENARIO_KEYWORDS if keyword in question), None)
+        steps = [step if isinstance(step, list) else [step] for step in SCENARIOS[scenario][1]] if scenario else []
+        position, answered = 0, 0
+        while position < len(steps) and answered + len(steps[position]) <= len(results):
+            answered += len(steps[position])
+            position += 1
+        if position >= len(steps):
+            answer = results[-1] if results else "Nie rozumiem pytania."
+            return AIMessage(content=f"Wynik: {answer[:FINAL_ANSWER_MAX_CHARS]}")
+
+        match = QUESTION_RE.search(question)
+        fields = match.groupdict() if match else {}
+        dataset = None
+        for result in reversed(results):
+            if result.startswith("{") and '"dataset"' in result:
+                dataset = json.loads(result)["dataset"]
+                break
+        tool_calls = []
+        for name, args in steps[position]:
+            if "$dataset" in args.values() and dataset is None:
+                # Pobranie danych nie zwróciło uchwytu (np. brak danych) - model kończy turę komunikatem
+                return AIMessage(content=f"Wynik: {results[-1][:FINAL_ANSWER_MAX_CHARS]}")
+            args = {key: _resolve(value, fields, dataset) for key, value in args.items()}
+            tool_calls.append({"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"})
+        return AIMessage(content="", tool_calls=tool_calls)
+
+    def _latency(self) -> float:
+        return self.latency_s * random.uniform(1 - self.jitter, 1 + self.jitter) if self.latency_s > 0 else 0.0
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self._latency())
+        return self._result(messages)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        # Jak klient HTTP API: oczekiwanie na odpowiedź nie zajmuje wątku
+        await asyncio.sleep(self._latency())
+        return self._result(messages)
+
+    def _result(self, messages: List[BaseMessage]) -> ChatResult:
+        message = self._next_message(messages)
+        completion = count_tokens(message.content) + sum(
+            count_tokens(json.dumps(call["args"], ensure_ascii=False)) for call in message.tool_calls
+        )
+        usage = {"prompt_tokens": count_message_tokens(messages), "completion_tokens": completion}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": usage, "model_name": self.model_name})
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f"Nieznany scenariusz: {name} (dostępne: {', '.join(SCENARIOS)}).")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def discover_vehicles():
+    """Zwraca {pojazd: (pierwszy dzień, ostatni dzień)} z bazy - zakresy do losowania pytań."""
+    from tools import get_available_vehicles_simple, get_data_range
+
+    ranges = {}
+    pattern = re.compile(r"od (\d{4}-\d{2}-\d{2}) do (\d{4}-\d{2}-\d{2})")
+    for vehicle_id in get_available_vehicles_simple():
+        match = pattern.search(get_data_range.invoke({"vehicle_id": vehicle_id}))
+        if match:
+            ranges[vehicle_id] = tuple(datetime.strptime(d, "%Y-%m-%d") for d in match.groups())
+    if not ranges:
+        raise SystemExit("Brak danych w bazie - załaduj je przez db_manager.py.")
+    return ranges
+
+
+def make_question(rng, mix, vehicles, window_days):
+    scenario = rng.choices(list(mix), weights=list(mix.values()))[0]
+    vehicle_id = rng.choice(list(vehicles))
+    first, last = vehicles[vehicle_id]
+    span_days = max((last - first).days - window_days, 0)
+    start = first + timedelta(days=rng.randint(0, span_days))
+    end = min(start + timedelta(days=window_days), last)
+    template = SCENARIOS[scenario][0]
+    return scenario, template.format(vehicle_id=vehicle_id, start_date=start.strftime("%Y-%m-%d"),
+                                     end_date=end.strftime("%Y-%m-%d"))
+
+
+def run_session(session_id, llm, args, mix, vehicles, start_barrier):
+    """Jedna sesja czatu: własna pamięć rozmowy i executor, `args.turns` pytań po kolei."""
+    from async_runtime import invoke
+    from chat_memory import BudgetedConversationMemory
+    from instrumentation import collect_spans
+    from main import TOOLS, build_agent_executor
+    from mcp_client import remote_tools
+
+    rng = random.Random(args.seed * 1000 + session_id)
+    memory = BudgetedConversationMemory(llm=llm) if not args.no_memory else None
+    tools = remote_tools(args.mcp_url, [tool.name for tool in TOOLS]) if args.mcp_url else TOOLS
+    executor = build_agent_executor(llm, tools=tools, memory=memory, verbose=False)
+    turns = []
+    start_barrier.wait()
+    for _ in range(args.turns):
+        scenario, question = make_question(rng, mix, vehicles, args.window_days)
+        error = None
+        with collect_spans() as spans:
+            started = time.perf_counter()
+            try:
+                invoke(executor, {"input": question})
+            except Exception as e:
+                error = str(e)[:200]
+            total = time.perf_counter() - started
+        llm_s = sum(s.duration_s for s in spans if s.kind == "llm")
+        db_s = sum(s.db_time_s for s in spans if s.kind == "tool")
+        # Czasy równoległych narzędzi się sumują, więc mogą przekroczyć czas tury
+        tool_s = sum(s.duration_s for s in spans if s.kind == "tool") - db_s
+        errors = [s.error for s in spans if s.status == "error"]
+        turns.append({
+            "scenario": scenario,
+            "total_s": total,
+            "llm_s": llm_s,
+            "tool_s": tool_s,
+            "db_s": db_s,
+            "other_s": max(total - llm_s - tool_s - db_s, 0.0),
+            "llm_calls": sum(1 for s in spans if s.kind == "llm"),
+            "error": error or (errors[0] if errors else None),
+        })
+        if args.think_ms:
+            time.sleep(args.think_ms / 1000 * rng.uniform(0.5, 1.5))
+    return turns
+
+
+def percentiles(values):
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": float(p50), "p95": float(p95), "p99": float(p99)}
+
+
+def run_level(sessions, llm, args, mix, vehicles):
+    """Uruchamia `sessions` równoległych sesji i zwraca podsumowanie poziomu."""
+    from async_runtime import db_pool_stats
+    from chart_store import store as chart_store
+    from db_pool import pool_stats
+
+    pool_before = pool_stats()
+    charts_before = chart_store.stats()
+    barrier = threading.Barrier(sessions + 1)
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [pool.submit(run_session, i, llm, args, mix, vehicles, barrier) for i in range(sessions)]
+        barrier.wait()
+        started = time.perf_counter()
+        turns = [turn for future in futures for turn in future.result()]
+        elapsed = time.perf_counter() - started
+
+    pool_after = pool_stats()
+    charts_after = chart_store.stats()
+    checkouts = pool_after.get("checkouts", 0) - pool_before.get("checkouts", 0)
+    wait_total = pool_after.get("wait_time_total_s", 0.0) - pool_before.get("wait_time_total_s", 0.0)
+    return {
+        "sessions": sessions,
+        "turns": len(turns),
+        "elapsed_s": elapsed,
+        "throughput_turns_s": len(turns) / elapsed if elapsed else 0.0,
+        "errors": sum(1 for t in turns if t["error"]),
+        "error_samples": sorted({t["error"] for t in turns if t["error"]})[:3],
+        "llm_calls_per_turn": sum(t["llm_calls"] for t in turns) / max(len(turns), 1),
+        "latency": {part: percentiles([t[part] for t in turns])
+                    for part in ("total_s", "llm_s", "tool_s", "db_s", "other_s")},
+        "by_scenario": {name: percentiles([t["total_s"] for t in turns if t["scenario"] == name])
+                        for name in mix if any(t["scenario"] == name for t in turns)},
+        "pool": {
+            "checkouts": checkouts,
+            "exhausted": pool_after.get("exhausted", 0) - pool_before.get("exhausted", 0),
+            "timeouts": pool_after.get("timeouts", 0) - pool_before.get("timeouts", 0),
+            "wait_avg_s": wait_total / checkouts if checkouts else 0.0,
+            "size": pool_after.get("size", 0),
+            "max_size": pool_after.get("max_size", 0),
+        },
+        "async_pool": db_pool_stats(),
+        "charts": {key: charts_after.get(key, 0) - charts_before.get(key, 0) for key in ("renders", "reuses")},
+    }
+
+
+def print_level(result):
+    print(f"\n=== {result['sessions']} sesji: {result['turns']} tur w {result['elapsed_s']:.1f} s "
+          f"({result['throughput_turns_s']:.2f} tury/s), błędy: {result['errors']}, "
+          f"wywołania modelu na turę: {result['llm_calls_per_turn']:.1f} ===")
+    print(f"{'składnik':<16}{'p50 [ms]':>10}{'p95 [ms]':>10}{'p99 [ms]':>10}")
+    labels = {"total_s": "tura", "llm_s": "model", "tool_s": "narzędzia", "db_s": "baza", "other_s": "reszta"}
+    for part, label in labels.items():
+        p = result["latency"][part]
+        print(f"{label:<16}{p['p50'] * 1000:>10.1f}{p['p95'] * 1000:>10.1f}{p['p99'] * 1000:>10.1f}")
+    for name, p in result["by_scenario"].items():
+        print(f"  {name:<14}{p['p50'] * 1000:>10.1f}{p['p95'] * 1000:>10.1f}{p['p99'] * 1000:>10.1f}")
+    pool = result["pool"]
+    print(f"Pula połączeń: {pool['checkouts']} wypożyczeń, średnie oczekiwanie {pool['wait_avg_s'] * 1000:.1f} ms, "
+          f"brak wolnych: {pool['exhausted']}, timeouty: {pool['timeouts']} "
+          f"(rozmiar {pool['size']}/{pool['max_size']})")
+    if result["async_pool"]:
+        async_pool = result["async_pool"]
+        print(f"Pula asyncpg: {async_pool['size']}/{async_pool['max_size']} połączeń, wolne: {async_pool['idle']}")
+    print(f"Wykresy: {result['charts']['renders']} renderowań, {result['charts']['reuses']} ponownych użyć")
+    for sample in result["error_samples"]:
+        print(f"  błąd: {sample}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", default="1,4,16",
+                        help="Liczby równoległych sesji oddzielone przecinkami (domyślnie 1,4,16).")
+    parser.add_argument("--turns", type=int, default=10, help="Liczba pytań w każdej sesji.")
+    parser.add_argument("--llm-latency-ms", type=float, default=800,
+                        help="Czas odpowiedzi udawanego modelu na jedno wywołanie (domyślnie 800 ms).")
+    parser.add_argument("--think-ms", type=float, default=0, help="Przerwa użytkownika między pytaniami.")
+    parser.add_argument("--window-days", type=int, default=2, help="Długość zakresu dat w pytaniach.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Wagi scenariuszy (domyślnie {DEFAULT_MIX}).")
+    parser.add_argument("--no-memory", action="store_true", help="Sesje bez pamięci rozmowy.")
+    parser.add_argument("--mcp-url", help="Narzędzia z serwera MCP pod tym adresem (domyślnie w procesie testu).")
+    parser.add_argument("--seed", type=int, default=0, help="Ziarno losowania pytań.")
+    parser.add_argument("--output", help="Zapisz wyniki do pliku JSON.")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL"):
+        parser.error("Ustaw DATABASE_URL (test korzysta z prawdziwej bazy).")
+    mix = parse_mix(args.mix)
+    levels = [int(n) for n in args.sessions.split(",") if n.strip()]
+
+    from instrumentation import llm_metrics_handler
+
+    vehicles = discover_vehicles()
+    llm = ScriptedChatModel(latency_s=args.llm_latency_ms / 1000, callbacks=[llm_metrics_handler])
+    print(f"Pojazdy: {', '.join(vehicles)}; model: {args.llm_latency_ms:.0f} ms na wywołanie; "
+          f"scenariusze: {args.mix}")
+
+    results = []
+    for sessions in levels:
+        result = run_level(sessions, llm, args, mix, vehicles)
+        print_level(result)
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2, ensure_ascii=False)
+        print(f"\nZapisano wyniki: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
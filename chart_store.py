@@ -0,0 +1,175 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Konfiguracja magazynu wykresów (można nadpisać zmiennymi środowiskowymi)
+CHART_DIR = os.getenv("CHART_DIR", "/tmp/vehicle_charts")
+CHART_DIR_MAX_MB = float(os.getenv("CHART_DIR_MAX_MB", "200"))
+CHART_MAX_AGE_S = float(os.getenv("CHART_MAX_AGE_S", "86400"))
+CHART_MEMORY_ENTRIES = int(os.getenv("CHART_MEMORY_ENTRIES", "32"))
+
+# Wspólna kopia plotly.js w katalogu wykresów - pliki HTML odwołują się do niej
+# zamiast osadzać ~3.5 MB biblioteki w każdym wykresie.
+PLOTLY_JS_NAME = "plotly.min.js"
+
+# Ścieżki wykresów w odpowiedziach narzędzi (np. '/tmp/vehicle_charts/chart_1a2b3c4d5e6f7a8b.html')
+CHART_PATH_RE = re.compile(r"(?:/[\w.\-]+)*/chart_[0-9a-f]{16}\.html")
+
+
+def chart_key(*parts) -> str:
+    """Klucz wykresu: skrót z identyfikacji danych, rodzaju wykresu, parametrów i opcji."""
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _atomic_write(path: str, content: str):
+    """Zapis przez plik tymczasowy i rename - czytelnik nigdy nie zobaczy połowy pliku."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ChartStore:
+    """
+    Magazyn wykresów adresowany treścią.
+
+    Każdy wykres jest zapisywany raz pod ścieżką wyznaczoną przez `chart_key`, obok
+    pliku HTML (z odwołaniem do wspólnego plotly.min.js) zapisywana jest definicja
+    figury w JSON, a ostatnio wyświetlane figury są trzymane w pamięci. Katalog jest
+    czyszczony ze starych plików i utrzymywany poniżej limitu rozmiaru.
+    """
+
+    def __init__(self, directory=CHART_DIR, max_bytes=int(CHART_DIR_MAX_MB * 1024 * 1024),
+                 max_age_s=CHART_MAX_AGE_S, memory_entries=CHART_MEMORY_ENTRIES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.memory_entries = memory_entries
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._stats = {"renders": 0, "reuses": 0, "memory_hits": 0, "disk_loads": 0, "evicted_files": 0}
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, f"chart_{key}")
+        return f"{base}.html", f"{base}.json"
+
+    def _ensure_plotly_js(self):
+        path = os.path.join(self.directory, PLOTLY_JS_NAME)
+        if not os.path.exists(path):
+            from plotly.offline import get_plotlyjs
+            _atomic_write(path, get_plotlyjs())
+
+    def _remember(self, html_path, figure_json):
+        with self._lock:
+            self._memory[html_path] = figure_json
+            self._memory.move_to_end(html_path)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get_or_render(self, key, render) -> str:
+        """
+        Zwraca ścieżkę pliku HTML wykresu o danym kluczu, renderując go przez
+        `render()` (funkcja zwracająca plotly Figure) tylko wtedy, gdy jeszcze nie istnieje.
+        """
+        html_path, json_path = self._paths(key)
+        if os.path.exists(html_path) and os.path.exists(json_path):
+            # Odświeżenie czasu modyfikacji chroni używany wykres przed usunięciem
+            os.utime(html_path)
+            with self._lock:
+                self._stats["reuses"] += 1
+            return html_path
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._ensure_plotly_js()
+        fig = render()
+        figure_json = fig.to_json()
+        _atomic_write(json_path, figure_json)
+        _atomic_write(html_path, fig.to_html(include_plotlyjs=PLOTLY_JS_NAME, full_html=True))
+        self._remember(html_path, figure_json)
+        with self._lock:
+            self._stats["renders"] += 1
+        self.evict(keep=html_path)
+        return html_path
+
+    def load_figure(self, html_path) -> dict:
+        """
+        Zwraca definicję figury (dict dla st.plotly_chart) dla ścieżki zwróconej przez
+        narzędzie wykresu - z pamięci, a w razie braku z pliku JSON obok HTML.
+        """
+        with self._lock:
+            figure_json = self._memory.get(html_path)
+            if figure_json is not None:
+                self._memory.move_to_end(html_path)
+                self._stats["memory_hits"] += 1
+        if figure_json is None:
+            json_path = html_path[:-len(".html")] + ".json"
+            with open(json_path, "r", encoding="utf-8") as f:
+                figure_json = f.read()
+            self._remember(html_path, figure_json)
+            with self._lock:
+                self._stats["disk_loads"] += 1
+        return json.loads(figure_json)
+
+    def evict(self, keep=None):
+        """
+        Usuwa wykresy starsze niż `max_age_s`, a potem najstarsze ponad limit rozmiaru
+        katalogu. Wykres `keep` (ścieżka HTML właśnie zwracana użytkownikowi) zostaje.
+        """
+        now = time.time()
+        charts = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return 0
+        for entry in entries:
+            if not entry.name.startswith("chart_") or not entry.is_file() or entry.name.endswith(".tmp"):
+                continue
+            stat = entry.stat()
+            base = entry.path.rsplit(".", 1)[0]
+            size, mtime = charts.get(base, (0, 0))
+            charts[base] = (size + stat.st_size, max(mtime, stat.st_mtime))
+
+        if keep is not None:
+            charts.pop(keep[:-len(".html")], None)
+        to_remove = [base for base, (_, mtime) in charts.items() if now - mtime > self.max_age_s]
+        remaining = sorted(
+            ((mtime, size, base) for base, (size, mtime) in charts.items() if base not in to_remove)
+        )
+        total = sum(size for _, size, _ in remaining)
+        for mtime, size, base in remaining:
+            if total <= self.max_bytes:
+                break
+            to_remove.append(base)
+            total -= size
+
+        for base in to_remove:
+            for path in (f"{base}.html", f"{base}.json"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            with self._lock:
+                self._memory.pop(f"{base}.html", None)
+                self._stats["evicted_files"] += 1
+        return len(to_remove)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        return stats
+
+
+# Wspólny magazyn wykresów dla procesu
+store = ChartStore()
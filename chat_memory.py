@@ -0,0 +1,201 @@
+import json
+import os
+from typing import Any, Dict, List
+
+from langchain.memory import ConversationSummaryBufferMemory
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage, SystemMessage
+from langchain_core.prompts import PromptTemplate
+
+from chart_store import CHART_PATH_RE
+
+# Budżet historii rozmowy w tokenach (można nadpisać zmiennymi środowiskowymi).
+# Starsze tury są streszczane, a streszczenie zajmuje co najwyżej MEMORY_SUMMARY_SHARE budżetu.
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "2000"))
+MEMORY_SUMMARY_SHARE = float(os.getenv("MEMORY_SUMMARY_SHARE", "0.25"))
+
+# Maksymalna długość skrótu wyniku narzędzia zapisywanego w historii
+TOOL_DIGEST_MAX_CHARS = int(os.getenv("TOOL_DIGEST_MAX_CHARS", "400"))
+
+# Argumenty narzędzi dłuższe niż tyle znaków (np. surowe dane JSON) są zastępowane długością
+TOOL_ARG_MAX_CHARS = 80
+
+# Przybliżona liczba znaków na token, gdy kodowanie tiktoken jest niedostępne (np. bez sieci)
+CHARS_PER_TOKEN = 4
+
+# Pola podsumowania zbioru danych z fetch_data_for_chart, które warto pamiętać między turami
+DATASET_DIGEST_KEYS = ("dataset", "vehicle_id", "resolution", "rows", "first_timestamp", "last_timestamp")
+
+SUMMARY_PROMPT = PromptTemplate.from_template(
+    """Streść rozmowę z asystentem analizy danych pojazdów, dopisując nowe wypowiedzi do dotychczasowego streszczenia.
+Zachowaj identyfikatory pojazdów, daty, uchwyty zbiorów danych (ds_...), ścieżki wykresów i policzone wartości liczbowe.
+Pisz zwięźle.
+
+Dotychczasowe streszczenie:
+{summary}
+
+Nowe wypowiedzi:
+{new_lines}
+
+Nowe streszczenie:"""
+)
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Liczy tokeny tekstu kodowaniem modelu (tiktoken), a w razie jego braku - przybliżeniem."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def count_message_tokens(messages: List[BaseMessage]) -> int:
+    """Liczy tokeny listy wiadomości (treść + stały narzut na wiadomość, jak w API czatu)."""
+    total = 0
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+        total += count_tokens(content) + 4
+        for call in getattr(message, "tool_calls", None) or []:
+            total += count_tokens(json.dumps(call.get("args", {}), ensure_ascii=False)) + 4
+    return total
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}… (+{len(text) - max_chars} znaków)"
+
+
+def digest_tool_output(output: Any, max_chars: int = TOOL_DIGEST_MAX_CHARS) -> str:
+    """
+    Zwraca zwięzły skrót wyniku narzędzia do zapisania w historii rozmowy.
+
+    Podsumowanie zbioru danych zachowuje uchwyt, pojazd, rozdzielczość, liczbę wierszy
+    i zakres czasu; surowe dane (lista rekordów lub {'rows': [...]}) są zastępowane
+    liczbą wierszy i zakresem czasu; ścieżki wykresów zostają w całości, a pozostałe
+    wyniki są przycinane do `max_chars` znaków.
+    """
+    text = str(output)
+    chart_paths = CHART_PATH_RE.findall(text)
+    if chart_paths:
+        return "Wykres zapisany: " + ", ".join(chart_paths)
+
+    try:
+        data = json.loads(text)
+    except (ValueError, TypeError):
+        return _truncate(text, max_chars)
+
+    if isinstance(data, dict) and "dataset" in data:
+        data = {key: data[key] for key in DATASET_DIGEST_KEYS if key in data}
+    elif isinstance(data, dict) and isinstance(data.get("rows"), list):
+        data = _rows_digest(data["rows"])
+    elif isinstance(data, list):
+        data = _rows_digest(data)
+    return _truncate(json.dumps(data, ensure_ascii=False), max_chars)
+
+
+def _rows_digest(rows: list) -> dict:
+    digest = {"rows": len(rows)}
+    timestamps = [row.get("timestamp") for row in rows if isinstance(row, dict) and "timestamp" in row]
+    if timestamps:
+        digest["first_timestamp"] = timestamps[0]
+        digest["last_timestamp"] = timestamps[-1]
+    return digest
+
+
+def _digest_tool_input(tool_input: Any) -> str:
+    if not isinstance(tool_input, dict):
+        tool_input = {"input": tool_input}
+    args = {}
+    for name, value in tool_input.items():
+        text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+        args[name] = value if len(text) <= TOOL_ARG_MAX_CHARS else f"<{len(text)} znaków>"
+    return json.dumps(args, ensure_ascii=False)
+
+
+def digest_intermediate_steps(steps) -> str:
+    """Zamienia kroki agenta (akcja, wynik narzędzia) na zwięzłe linie 'narzędzie(argumenty) -> skrót'."""
+    lines = []
+    for action, observation in steps:
+        lines.append(f"- {action.tool}({_digest_tool_input(action.tool_input)}) -> {digest_tool_output(observation)}")
+    return "\n".join(lines)
+
+
+class BudgetedConversationMemory(ConversationSummaryBufferMemory):
+    """
+    Pamięć rozmowy z twardym budżetem tokenów.
+
+    Każda tura zapisuje pytanie, skróty wyników narzędzi (zamiast pełnych danych) i
+    odpowiedź. Gdy historia przekroczy `max_token_limit`, najstarsze całe tury są
+    streszczane przez model, a streszczenie jest przycinane do części budżetu - rozmiar
+    promptu nie rośnie wraz z długością sesji.
+
+    Do zapisu skrótów narzędzi AgentExecutor musi mieć `return_intermediate_steps=True`.
+    """
+
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+    input_key: str = "input"
+    output_key: str = "output"
+    max_token_limit: int = MEMORY_MAX_TOKENS
+    summary_share: float = MEMORY_SUMMARY_SHARE
+    prompt: PromptTemplate = SUMMARY_PROMPT
+    # Rozmiar historii (w tokenach) przy ostatnim odczycie - do raportowania rozmiaru promptu
+    last_history_tokens: int = 0
+    summarizations: int = 0
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        variables = super().load_memory_variables(inputs)
+        self.last_history_tokens = count_message_tokens(variables[self.memory_key])
+        return variables
+
+    def save_context(self, inputs: Dict[str, Any], outputs: Dict[str, Any]) -> None:
+        """Zapisuje turę (pytanie, skróty narzędzi, odpowiedź) i przycina historię do budżetu."""
+        messages = [HumanMessage(content=str(inputs[self.input_key]))]
+        steps = outputs.get("intermediate_steps") or []
+        if steps:
+            messages.append(SystemMessage(content=f"Wyniki narzędzi w tej turze:\n{digest_intermediate_steps(steps)}"))
+        messages.append(AIMessage(content=str(outputs[self.output_key])))
+        self.chat_memory.add_messages(messages)
+        self.prune()
+
+    def _history_tokens(self, summary: str) -> int:
+        """Rozmiar historii tak, jak trafia do promptu: wiadomość ze streszczeniem + bufor."""
+        messages = [self.summary_message_cls(content=summary)] if summary else []
+        return count_message_tokens(messages + self.chat_memory.messages)
+
+    def prune(self) -> None:
+        """Streszcza najstarsze tury, aż historia razem ze streszczeniem zmieści się w budżecie tokenów."""
+        if self._history_tokens(self.moving_summary_buffer) <= self.max_token_limit:
+            return
+
+        # Miejsce na streszczenie (z narzutem wiadomości) jest rezerwowane z góry
+        max_summary_tokens = int(self.max_token_limit * self.summary_share)
+        buffer_limit = self.max_token_limit - max_summary_tokens - count_message_tokens([SystemMessage(content="")])
+        buffer = self.chat_memory.messages
+        pruned = []
+        while buffer and count_message_tokens(buffer) > buffer_limit:
+            # Usuwamy całe tury (od pytania użytkownika do następnego pytania)
+            pruned.append(buffer.pop(0))
+            while buffer and not isinstance(buffer[0], HumanMessage):
+                pruned.append(buffer.pop(0))
+
+        summary = self.moving_summary_buffer
+        if pruned:
+            try:
+                summary = self.predict_new_summary(pruned, self.moving_summary_buffer)
+                self.summarizations += 1
+            except Exception as e:
+                # Bez streszczenia usunięte tury przepadają, ale budżet zostaje zachowany
+                print(f"Błąd podczas streszczania historii: {e}")
+
+        while summary and count_tokens(summary) > max_summary_tokens:
+            summary = summary[:int(len(summary) * 0.9)]
+        self.moving_summary_buffer = summary
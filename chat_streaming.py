@@ -0,0 +1,167 @@
+import queue
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from chart_store import CHART_PATH_RE, store as chart_store
+from chat_memory import count_message_tokens
+
+
+class StreamlitChatHandler(BaseCallbackHandler):
+    """
+    Wyświetla przebieg pracy agenta w dymku czatu na bieżąco.
+
+    Tekst modelu jest dopisywany token po tokenie, każde wywołanie narzędzia ma
+    własny wiersz statusu z czasem trwania, a wykresy są pokazywane od razu po
+    zakończeniu narzędzia, które je wygenerowało (bez czekania na odpowiedź modelu).
+    """
+
+    # Aktualizacja podglądu tekstu nie częściej niż co tyle sekund (mniej komunikatów do przeglądarki)
+    RENDER_INTERVAL_S = 0.05
+
+    def __init__(self, container):
+        self.container = container
+        self.started = time.perf_counter()
+        self.first_output_s = None
+        self.chart_paths = []
+        self.tool_timings = []
+        # Rozmiar promptu (w tokenach) każdego wywołania modelu w tej turze
+        self.prompt_tokens = []
+        self._text = ""
+        self._text_placeholder = None
+        self._last_render = 0.0
+        self._tools = {}
+
+    def _mark_output(self):
+        if self.first_output_s is None:
+            self.first_output_s = time.perf_counter() - self.started
+
+    def _flush_text(self, cursor=True):
+        if self._text_placeholder is not None and self._text:
+            self._text_placeholder.markdown(self._text + ("▌" if cursor else ""))
+        self._last_render = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._start_text_segment()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self.prompt_tokens.append(sum(count_message_tokens(batch) for batch in messages))
+        self._start_text_segment()
+
+    def _start_text_segment(self):
+        # Każde wywołanie modelu pisze do nowego miejsca pod wcześniejszymi narzędziami
+        self._flush_text(cursor=False)
+        self._text = ""
+        self._text_placeholder = self.container.empty()
+
+    def on_llm_new_token(self, token, **kwargs):
+        if not token:
+            # Fragmenty wywołań narzędzi nie mają treści tekstowej
+            return
+        self._mark_output()
+        self._text += token
+        if time.perf_counter() - self._last_render >= self.RENDER_INTERVAL_S:
+            self._flush_text()
+
+    def on_llm_end(self, response, **kwargs):
+        self._flush_text(cursor=False)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._mark_output()
+        name = (serialized or {}).get("name", "narzędzie")
+        status = self.container.status(f"🔧 {name}...", state="running")
+        self._tools[run_id] = (name, status, time.perf_counter())
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        name, status, started = self._tools.pop(run_id, ("narzędzie", None, time.perf_counter()))
+        duration = time.perf_counter() - started
+        self.tool_timings.append((name, duration))
+        if status is not None:
+            status.update(label=f"✅ {name} ({duration:.2f} s)", state="complete")
+
+        # Wykres pokazujemy od razu po wygenerowaniu
+        for chart_path in CHART_PATH_RE.findall(str(output)):
+            if chart_path in self.chart_paths:
+                continue
+            try:
+                self.container.plotly_chart(chart_store.load_figure(chart_path), use_container_width=True)
+                self.chart_paths.append(chart_path)
+            except Exception as e:
+                self.container.warning(f"Nie udało się wyświetlić wykresu: {e}")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        name, status, started = self._tools.pop(run_id, ("narzędzie", None, time.perf_counter()))
+        duration = time.perf_counter() - started
+        self.tool_timings.append((name, duration))
+        if status is not None:
+            status.update(label=f"❌ {name} ({duration:.2f} s): {error}", state="error")
+
+    def finish(self, final_text):
+        """Zastępuje podgląd ostatniego wywołania modelu pełną odpowiedzią agenta."""
+        if self._text_placeholder is None:
+            self._text_placeholder = self.container.empty()
+        self._text_placeholder.markdown(final_text)
+        self._mark_output()
+
+
+def _forward(name):
+    def method(self, *args, **kwargs):
+        self._events.put((name, args, kwargs))
+    return method
+
+
+class ScriptThreadCallbacks(BaseCallbackHandler):
+    """
+    Przekazuje zdarzenia agenta wykonywanego w pętli async_runtime do handlera, który
+    działa w wątku skryptu Streamlit - elementy strony można tworzyć tylko w nim.
+    Zdarzenia są kolejkowane, a `pump` obsługuje je w wątku skryptu do końca tury.
+    """
+
+    # Wywołania bezpośrednio w pętli zdarzeń (tylko dopisanie do kolejki)
+    run_inline = True
+
+    def __init__(self, handler):
+        self.handler = handler
+        self._events = queue.Queue()
+
+    on_llm_start = _forward("on_llm_start")
+    on_chat_model_start = _forward("on_chat_model_start")
+    on_llm_new_token = _forward("on_llm_new_token")
+    on_llm_end = _forward("on_llm_end")
+    on_tool_start = _forward("on_tool_start")
+    on_tool_end = _forward("on_tool_end")
+    on_tool_error = _forward("on_tool_error")
+
+    def pump(self, future):
+        """
+        Obsługuje zdarzenia w bieżącym wątku, aż zakończy się `future`
+        (concurrent.futures.Future z async_runtime.submit), i zwraca jego wynik.
+        Wyjątek handlera (np. RerunException/StopException Streamlit przy ponownym
+        uruchomieniu skryptu) anuluje turę - bez tego agent działałby dalej bez odbiorcy.
+        """
+        future.add_done_callback(lambda _: self._events.put(None))
+        try:
+            while True:
+                event = self._events.get()
+                if event is None:
+                    break
+                name, args, kwargs = event
+                getattr(self.handler, name)(*args, **kwargs)
+        except BaseException:
+            future.cancel()
+            raise
+        return future.result()
+
+
+def invoke_streaming(executor, inputs, handler):
+    """
+    Wykonuje turę agenta z handlerem `handler` (StreamlitChatHandler). Przy ASYNC_AGENT
+    tura idzie przez `ainvoke` w pętli async_runtime (narzędzia równolegle), a zdarzenia
+    wracają do wątku skryptu przez ScriptThreadCallbacks.
+    """
+    from async_runtime import ASYNC_AGENT, submit
+
+    if not ASYNC_AGENT:
+        return executor.invoke(inputs, config={"callbacks": [handler]})
+    callbacks = ScriptThreadCallbacks(handler)
+    return callbacks.pump(submit(executor.ainvoke(inputs, config={"callbacks": [callbacks]})))
@@ -0,0 +1,173 @@
+import os
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+except ImportError:  # pragma: no cover - pyarrow jest w requirements.txt
+    pa = None
+
+# Transport kolumnowy (Arrow) wyników zapytań; 0 - dawna ścieżka przez pd.read_sql
+COLUMNAR_TRANSPORT = os.getenv("COLUMNAR_TRANSPORT", "1") == "1"
+# Zbiory większe niż tyle MB trafiają do pliku Arrow mapowanego w pamięć zamiast do RAM
+DATASET_SPILL_MB = float(os.getenv("DATASET_SPILL_MB", "256"))
+DATASET_SPILL_DIR = os.getenv("DATASET_SPILL_DIR", os.path.join(tempfile.gettempdir(), "vehicle_datasets"))
+# Pliki starsze niż tyle sekund zostały po zakończonych procesach i są usuwane
+DATASET_SPILL_MAX_AGE_S = float(os.getenv("DATASET_SPILL_MAX_AGE_S", "86400"))
+
+# Wynik COPY do tego rozmiaru jest buforowany w pamięci, większy - w pliku tymczasowym
+COPY_SPOOL_BYTES = 64 * 1024 * 1024
+# Rozmiar bloku CSV parsowanego naraz przez pyarrow
+CSV_BLOCK_BYTES = 16 * 1024 * 1024
+
+COPY_QUERY = "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)"
+
+# Typy kolumn telemetrii i szeregów z agregatów (NUMERIC z bazy -> float64 zamiast Decimal)
+if pa is not None:
+    COLUMN_TYPES = {
+        "timestamp": pa.timestamp("ns"),
+        "speed_kmh": pa.float64(),
+        "traction_power_kw": pa.float64(),
+        "hvac_power_kw": pa.float64(),
+        "distance_km": pa.float64(),
+        "sample_count": pa.int64(),
+        "speed_count": pa.int64(),
+        "speed_min_kmh": pa.float64(),
+        "speed_max_kmh": pa.float64(),
+    }
+
+
+def columnar_enabled() -> bool:
+    """Czy wyniki zapytań są pobierane kolumnowo (Arrow)."""
+    return COLUMNAR_TRANSPORT and pa is not None
+
+
+def read_frame(conn, query: str, params=None, spill_bytes=int(DATASET_SPILL_MB * 1024 * 1024)):
+    """
+    Wykonuje zapytanie przez COPY ... TO STDOUT i parsuje wynik kolumnowo (pyarrow),
+    bez tworzenia obiektu Pythona na każdą wartość. Kolumny liczbowe są float64,
+    a timestamp - datetime64[ns].
+
+    Wyniki większe niż `spill_bytes` są zapisywane do pliku Arrow w DATASET_SPILL_DIR
+    i mapowane w pamięć: kolumny DataFrame wskazują bezpośrednio na plik, więc zbiór
+    może być większy niż dostępna pamięć RAM.
+
+    :return: Krotka (DataFrame, ścieżka pliku Arrow lub None dla danych w pamięci).
+    """
+    with conn.cursor() as cur:
+        sql = cur.mogrify(query.strip().rstrip(";"), params).decode()
+        with tempfile.SpooledTemporaryFile(max_size=COPY_SPOOL_BYTES) as buffer:
+            cur.copy_expert(COPY_QUERY.format(query=sql), buffer)
+            return parse_csv(buffer, spill_bytes)
+
+
+def parse_csv(buffer, spill_bytes=int(DATASET_SPILL_MB * 1024 * 1024)):
+    """
+    Parsuje wynik COPY ... (FORMAT csv, HEADER true) zapisany w pliku `buffer` tak jak
+    read_frame (wspólne z pobieraniem przez asyncpg w async_tools.py).
+
+    :return: Krotka (DataFrame, ścieżka pliku Arrow lub None dla danych w pamięci).
+    """
+    buffer.seek(0)
+    reader = pa_csv.open_csv(
+        buffer,
+        read_options=pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES),
+        convert_options=pa_csv.ConvertOptions(column_types=COLUMN_TYPES),
+    )
+    return _collect(reader, spill_bytes)
+
+
+def _collect(reader, spill_bytes):
+    batches = []
+    nbytes = 0
+    spill = None
+    for batch in reader:
+        if spill is None and nbytes + batch.nbytes > spill_bytes:
+            spill = _ColumnSpill(reader.schema)
+            for previous in batches:
+                spill.append(previous)
+            batches = []
+        if spill is not None:
+            spill.append(batch)
+        else:
+            batches.append(batch)
+            nbytes += batch.nbytes
+
+    if spill is not None:
+        return spill.finish()
+    table = pa.Table.from_batches(batches, schema=reader.schema)
+    return table.to_pandas(split_blocks=True), None
+
+
+class _ColumnSpill:
+    """
+    Zapisuje kolejne paczki wyniku kolumna po kolumnie do surowych plików, a na końcu
+    składa z nich plik Arrow z jedną paczką rekordów. Jedna ciągła paczka pozwala
+    zamienić zmapowaną tabelę na DataFrame bez kopiowania danych.
+    """
+
+    def __init__(self, schema):
+        os.makedirs(DATASET_SPILL_DIR, exist_ok=True)
+        _remove_stale_spills()
+        self.schema = schema
+        self.path = os.path.join(DATASET_SPILL_DIR, f"ds_{os.getpid()}_{uuid.uuid4().hex[:12]}.arrow")
+        self.rows = 0
+        self.dtypes = {}
+        self._files = {}
+
+    def append(self, batch):
+        for name, column in zip(batch.schema.names, batch.columns):
+            values = column.to_numpy(zero_copy_only=False)
+            if pa.types.is_timestamp(column.type):
+                values = values.astype("datetime64[ns]").view(np.int64)
+            dtype = self.dtypes.setdefault(name, values.dtype)
+            if name not in self._files:
+                self._files[name] = open(f"{self.path}.{len(self._files)}.col", "wb")
+            values.astype(dtype, copy=False).tofile(self._files[name])
+        self.rows += batch.num_rows
+
+    def finish(self):
+        arrays = []
+        column_paths = []
+        for name, field_type in zip(self.schema.names, self.schema.types):
+            handle = self._files[name]
+            handle.close()
+            column_paths.append(handle.name)
+            values = np.memmap(handle.name, dtype=self.dtypes[name], mode="r") if self.rows else \
+                np.empty(0, dtype=self.dtypes[name])
+            arrow_type = field_type if pa.types.is_timestamp(field_type) else pa.from_numpy_dtype(values.dtype)
+            arrays.append(pa.Array.from_buffers(arrow_type, len(values), [None, pa.py_buffer(values)]))
+
+        batch = pa.RecordBatch.from_arrays(arrays, names=self.schema.names)
+        with pa.OSFile(self.path, "wb") as sink, pa_ipc.new_file(sink, batch.schema) as writer:
+            writer.write_batch(batch)
+        del arrays, batch
+        for path in column_paths:
+            os.remove(path)
+
+        table = pa_ipc.open_file(pa.memory_map(self.path)).read_all()
+        return table.to_pandas(split_blocks=True), self.path
+
+
+def remove_spill(path):
+    """Usuwa plik Arrow zbioru (zmapowane kolumny pozostają ważne, dopóki DataFrame istnieje)."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _remove_stale_spills():
+    cutoff = time.time() - DATASET_SPILL_MAX_AGE_S
+    for name in os.listdir(DATASET_SPILL_DIR):
+        path = os.path.join(DATASET_SPILL_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1 @@
+# Katalog główny repozytorium na sys.path - testy z tests/ importują moduły jak aplikacja
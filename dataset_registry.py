@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import pandas as pd
+
+from columnar import remove_spill
+
+# Limity pamięci podręcznej zbiorów danych (można nadpisać zmiennymi środowiskowymi)
+DATASET_CACHE_MAX_ENTRIES = int(os.getenv("DATASET_CACHE_MAX_ENTRIES", "64"))
+DATASET_CACHE_TTL_S = float(os.getenv("DATASET_CACHE_TTL_S", "900"))
+DATASET_CACHE_MAX_MB = float(os.getenv("DATASET_CACHE_MAX_MB", "512"))
+
+HANDLE_PREFIX = "ds_"
+
+
+class DatasetNotFoundError(KeyError):
+    """Uchwyt nie istnieje lub zbiór danych został usunięty z pamięci podręcznej."""
+
+
+class _Entry:
+    def __init__(self, df, key, meta, spill_path=None):
+        self.df = df
+        self.key = key
+        self.meta = meta
+        self.spill_path = spill_path
+        # Zbiór zmapowany z pliku nie zajmuje RAM procesu (strony trzyma pamięć podręczna systemu)
+        self.nbytes = 0 if spill_path else int(df.memory_usage(deep=True).sum())
+        self.created_at = time.monotonic()
+        # Wyniki obliczeń na tym zbiorze (np. metryki analizy), liczone raz
+        self.derived = {}
+
+
+class DatasetRegistry:
+    """
+    Przechowywane w procesie zbiory danych (DataFrame) dostępne przez krótkie uchwyty.
+
+    Zamiast przekazywać pełne dane przez kontekst modelu, narzędzia zwracają uchwyt
+    (np. 'ds_1a2b3c4d5e6f'), a kolejne narzędzia odczytują po nim DataFrame z pamięci.
+    Wpisy są usuwane po czasie `ttl_s`, a przy przekroczeniu limitu liczby wpisów
+    lub pamięci - w kolejności LRU.
+    """
+
+    def __init__(self, max_entries=DATASET_CACHE_MAX_ENTRIES, ttl_s=DATASET_CACHE_TTL_S,
+                 max_bytes=int(DATASET_CACHE_MAX_MB * 1024 * 1024)):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_key = {}
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def _remove(self, handle):
+        entry = self._entries.pop(handle)
+        self._bytes -= entry.nbytes
+        if entry.spill_path:
+            remove_spill(entry.spill_path)
+        if entry.key is not None and self._by_key.get(entry.key) == handle:
+            del self._by_key[entry.key]
+        return entry
+
+    def _is_expired(self, entry):
+        return self.ttl_s is not None and time.monotonic() - entry.created_at > self.ttl_s
+
+    def _purge(self):
+        """Usuwa wpisy przeterminowane, a następnie najdawniej używane ponad limity."""
+        for handle in [h for h, e in self._entries.items() if self._is_expired(e)]:
+            self._remove(handle)
+            self._stats["expirations"] += 1
+        # Najnowszy wpis zostaje nawet wtedy, gdy sam przekracza limit pamięci
+        while len(self._entries) > 1 and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            self._remove(next(iter(self._entries)))
+            self._stats["evictions"] += 1
+
+    def register(self, df, key=None, meta=None, spill_path=None):
+        """
+        Zapisuje DataFrame w rejestrze i zwraca jego uchwyt.
+
+        :param df: Dane do zapamiętania (nie powinny być później modyfikowane).
+        :param key: Opcjonalny klucz zapytania, np. (vehicle_id, start_date, end_date),
+                    pozwalający ponownie użyć danych przez `find`.
+        :param meta: Dodatkowe informacje dołączane do podsumowania.
+        :param spill_path: Plik Arrow, z którego zmapowano kolumny `df` (columnar.read_frame);
+                           nie wlicza się do limitu pamięci i jest usuwany razem z wpisem.
+        :return: Uchwyt zbioru danych.
+        """
+        handle = f"{HANDLE_PREFIX}{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            if key is not None and key in self._by_key:
+                self._remove(self._by_key[key])
+            entry = _Entry(df, key, meta or {}, spill_path)
+            self._entries[handle] = entry
+            self._bytes += entry.nbytes
+            if key is not None:
+                self._by_key[key] = handle
+            self._purge()
+        return handle
+
+    def get(self, handle):
+        """Zwraca DataFrame dla uchwytu lub zgłasza DatasetNotFoundError."""
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None or self._is_expired(entry):
+                if entry is not None:
+                    self._remove(handle)
+                    self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                raise DatasetNotFoundError(handle)
+            self._entries.move_to_end(handle)
+            self._stats["hits"] += 1
+            return entry.df
+
+    def derive(self, handle, name, compute):
+        """
+        Zwraca wynik `compute(df)` dla zbioru danych, zapamiętany pod nazwą `name`,
+        dzięki czemu kolejne narzędzia nie liczą go ponownie.
+        """
+        df = self.get(handle)
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is not None and name in entry.derived:
+                return entry.derived[name]
+        value = compute(df)
+        with self._lock:
+            if entry is not None:
+                entry.derived[name] = value
+        return value
+
+    def find(self, key):
+        """Zwraca uchwyt aktualnego zbioru zarejestrowanego pod kluczem lub None."""
+        with self._lock:
+            handle = self._by_key.get(key)
+            if handle is None:
+                return None
+            if self._is_expired(self._entries[handle]):
+                self._remove(handle)
+                self._stats["expirations"] += 1
+                return None
+            return handle
+
+    def summary(self, handle):
+        """Zwraca zwięzłe podsumowanie zbioru: uchwyt, liczbę wierszy, zakres czasu i kolumny."""
+        df = self.get(handle)
+        with self._lock:
+            meta = dict(self._entries[handle].meta)
+        summary = {"dataset": handle, **meta, "rows": len(df)}
+        if "timestamp" in df.columns and len(df):
+            summary["first_timestamp"] = pd.Timestamp(df["timestamp"].iloc[0]).strftime("%Y-%m-%d %H:%M:%S")
+            summary["last_timestamp"] = pd.Timestamp(df["timestamp"].iloc[-1]).strftime("%Y-%m-%d %H:%M:%S")
+        summary["columns"] = [c for c in df.columns if c != "timestamp"]
+        return summary
+
+    def stats(self):
+        """Zwraca metryki rejestru (trafienia, chybienia, usunięcia, zajęta pamięć)."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["spilled"] = sum(1 for entry in self._entries.values() if entry.spill_path)
+        return stats
+
+    def clear(self):
+        with self._lock:
+            for entry in self._entries.values():
+                if entry.spill_path:
+                    remove_spill(entry.spill_path)
+            self._entries.clear()
+            self._by_key.clear()
+            self._bytes = 0
+
+
+# Wspólny rejestr dla wszystkich narzędzi w procesie
+registry = DatasetRegistry()
+
+
+def is_handle(value):
+    """Sprawdza, czy wartość wygląda na uchwyt zbioru danych."""
+    return isinstance(value, str) and value.strip().startswith(HANDLE_PREFIX)
@@ -1,10 +1,14 @@
+import io
 import os
+import time
 import psycopg2
 from dotenv import load_dotenv
-from faker import Faker
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
+from datetime import datetime
+from analysis import SAMPLE_INTERVAL_H
+from rollups import create_rollup_tables, refresh_rollups
+from vehicle_catalog import create_catalog_table, invalidate_catalog, record_chunk
 
 # Wczytanie zmiennych środowiskowych z pliku .env
 load_dotenv()
@@ -12,6 +16,19 @@ load_dotenv()
 # Konfiguracja połączenia z bazą danych
 DB_URL = os.getenv("DATABASE_URL")
 
+# Domyślny początek danych syntetycznych
+DEFAULT_START_DATE = datetime(2025, 2, 10)
+
+# Odstęp pomiarów, dla którego liczona jest energia (analysis.SAMPLE_INTERVAL_H, agregaty,
+# metryki narzędzi) - odstęp nie jest zapisywany w bazie, więc inne wartości dawałyby
+# błędne kWh i kWh/km
+SAMPLE_INTERVAL_S = round(SAMPLE_INTERVAL_H * 3600)
+
+# Tryb schematu: 'simple' (pojedyncza tabela) lub 'partitioned' (produkcyjny,
+# partycje miesięczne po timestamp i typy zmiennoprzecinkowe zamiast NUMERIC)
+SCHEMA_MODE = os.getenv("VEHICLE_SCHEMA_MODE", "simple")
+SCHEMA_MODES = ("simple", "partitioned")
+
 # Struktura tabeli
 CREATE_TABLE_QUERY = """
 CREATE TABLE IF NOT EXISTS vehicle_data (
@@ -25,112 +42,406 @@ CREATE TABLE IF NOT EXISTS vehicle_data (
 );
 """
 
-def create_table(conn):
-    """Tworzy tabelę vehicle_data, jeśli nie istnieje."""
+# Struktura tabeli w trybie produkcyjnym - partycjonowanie zakresowe po czasie.
+# Klucz partycjonowania musi należeć do klucza głównego, więc tabela nie ma PK na id.
+CREATE_PARTITIONED_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS vehicle_data (
+    id BIGSERIAL,
+    vehicle_id VARCHAR(50) NOT NULL,
+    timestamp TIMESTAMP NOT NULL,
+    speed_kmh DOUBLE PRECISION,
+    traction_power_kw DOUBLE PRECISION,
+    hvac_power_kw DOUBLE PRECISION,
+    distance_km DOUBLE PRECISION
+) PARTITION BY RANGE (timestamp);
+"""
+
+# Indeksy wspólne dla obu trybów: złożony pod zapytania narzędzi
+# (WHERE vehicle_id = %s AND timestamp >= %s) oraz BRIN pod skany zakresów czasu.
+CREATE_INDEXES_QUERY = """
+CREATE INDEX IF NOT EXISTS vehicle_data_vehicle_ts_idx ON vehicle_data (vehicle_id, timestamp);
+CREATE INDEX IF NOT EXISTS vehicle_data_ts_brin ON vehicle_data USING BRIN (timestamp);
+"""
+
+# W trybie partycjonowanym id nie jest kluczem głównym, więc potrzebuje osobnego indeksu
+CREATE_ID_INDEX_QUERY = """
+CREATE INDEX IF NOT EXISTS vehicle_data_id_idx ON vehicle_data (id);
+"""
+
+IS_PARTITIONED_QUERY = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_partitioned_table pt
+    JOIN pg_class c ON c.oid = pt.partrelid
+    WHERE c.relname = 'vehicle_data' AND pg_table_is_visible(c.oid)
+);
+"""
+
+# Kolumny ładowane przez COPY (kolejność musi odpowiadać COPY_QUERY)
+COPY_COLUMNS = ["vehicle_id", "timestamp", "speed_kmh", "traction_power_kw", "hvac_power_kw", "distance_km"]
+
+COPY_QUERY = f"""
+COPY vehicle_data ({', '.join(COPY_COLUMNS)})
+FROM STDIN WITH (FORMAT csv);
+"""
+
+# Domyślna liczba wierszy w jednej paczce COPY - ogranicza zużycie pamięci
+BULK_CHUNK_ROWS = int(os.getenv("BULK_CHUNK_ROWS", "100000"))
+
+def create_table(conn, schema_mode=SCHEMA_MODE):
+    """
+    Tworzy tabelę vehicle_data (jeśli nie istnieje) wraz z indeksami.
+
+    :param schema_mode: 'simple' lub 'partitioned' (partycje miesięczne tworzone
+                        automatycznie przy ładowaniu danych).
+    """
+    if schema_mode not in SCHEMA_MODES:
+        raise ValueError(f"Nieznany tryb schematu: {schema_mode} (dozwolone: {', '.join(SCHEMA_MODES)}).")
     try:
         with conn.cursor() as cur:
-            cur.execute(CREATE_TABLE_QUERY)
+            if schema_mode == "partitioned":
+                cur.execute(CREATE_PARTITIONED_TABLE_QUERY)
+                cur.execute(CREATE_ID_INDEX_QUERY)
+            else:
+                cur.execute(CREATE_TABLE_QUERY)
+            cur.execute(CREATE_INDEXES_QUERY)
             conn.commit()
-        print("Tabela 'vehicle_data' została utworzona lub już istnieje.")
+        create_rollup_tables(conn)
+        create_catalog_table(conn)
+        print(f"Tabela 'vehicle_data' (tryb '{schema_mode}') została utworzona lub już istnieje.")
     except Exception as e:
         print(f"Błąd podczas tworzenia tabeli: {e}")
         raise
 
-def generate_synthetic_data(num_records=1000, num_vehicles=3):
+def is_partitioned(conn):
+    """Sprawdza, czy tabela vehicle_data jest partycjonowana."""
+    with conn.cursor() as cur:
+        cur.execute(IS_PARTITIONED_QUERY)
+        return cur.fetchone()[0]
+
+def _month_start(ts):
+    return datetime(ts.year, ts.month, 1)
+
+def _next_month(month_start):
+    if month_start.month == 12:
+        return datetime(month_start.year + 1, 1, 1)
+    return datetime(month_start.year, month_start.month + 1, 1)
+
+def _create_month_partitions(cur, start, end, skip=()):
+    """Tworzy partycje miesięczne vehicle_data_pYYYYMM dla zakresu [start, end] w bieżącej transakcji."""
+    month = _month_start(pd.Timestamp(start))
+    last_month = _month_start(pd.Timestamp(end))
+    names = []
+    while month <= last_month:
+        name = f"vehicle_data_p{month:%Y%m}"
+        if name not in skip:
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF vehicle_data "
+                f"FOR VALUES FROM (%s) TO (%s);",
+                (month, _next_month(month)),
+            )
+            names.append(name)
+        month = _next_month(month)
+    return names
+
+# Partycje utworzone (lub sprawdzone) w tym procesie - bez ponownego DDL przy każdej paczce
+_known_partitions = set()
+
+def ensure_partitions(conn, start, end):
+    """Tworzy brakujące partycje miesięczne vehicle_data pokrywające zakres [start, end]."""
+    with conn.cursor() as cur:
+        created = _create_month_partitions(cur, start, end, skip=_known_partitions)
+    conn.commit()
+    _known_partitions.update(created)
+    return created
+
+def migrate_to_partitioned(conn, keep_legacy=False):
+    """
+    Przenosi istniejącą tabelę vehicle_data do schematu partycjonowanego.
+
+    Stara tabela zmienia nazwę na vehicle_data_legacy, dane są kopiowane
+    (z konwersją NUMERIC -> DOUBLE PRECISION i zachowaniem id) do nowej tabeli
+    z partycjami miesięcznymi, a sekwencja id jest ustawiana za najwyższym id.
+    Całość wykonuje się w jednej transakcji.
+
+    :param keep_legacy: Jeśli True, tabela vehicle_data_legacy nie jest usuwana.
+    """
+    if is_partitioned(conn):
+        print("Tabela 'vehicle_data' jest już partycjonowana.")
+        create_table(conn, schema_mode="partitioned")
+        return
+
+    try:
+        with conn.cursor() as cur:
+            # Nazwy indeksów muszą być wolne dla nowej tabeli
+            cur.execute("DROP INDEX IF EXISTS vehicle_data_vehicle_ts_idx, vehicle_data_ts_brin;")
+            cur.execute("ALTER TABLE vehicle_data RENAME TO vehicle_data_legacy;")
+            cur.execute(CREATE_PARTITIONED_TABLE_QUERY)
+            cur.execute("SELECT MIN(timestamp), MAX(timestamp), MAX(id) FROM vehicle_data_legacy;")
+            min_ts, max_ts, max_id = cur.fetchone()
+
+            if min_ts is not None:
+                _create_month_partitions(cur, min_ts, max_ts)
+
+            cur.execute("""
+            INSERT INTO vehicle_data (id, vehicle_id, timestamp, speed_kmh, traction_power_kw, hvac_power_kw, distance_km)
+            SELECT id, vehicle_id, timestamp, speed_kmh::float8, traction_power_kw::float8,
+                   hvac_power_kw::float8, distance_km::float8
+            FROM vehicle_data_legacy;
+            """)
+            migrated = cur.rowcount
+            if max_id is not None:
+                cur.execute("SELECT setval(pg_get_serial_sequence('vehicle_data', 'id'), %s);", (max_id,))
+
+            cur.execute(CREATE_ID_INDEX_QUERY)
+            cur.execute(CREATE_INDEXES_QUERY)
+            if not keep_legacy:
+                cur.execute("DROP TABLE vehicle_data_legacy;")
+        conn.commit()
+        _known_partitions.clear()
+        print(f"Migracja zakończona: przeniesiono {migrated} rekordów do tabeli partycjonowanej.")
+    except Exception as e:
+        conn.rollback()
+        print(f"Błąd podczas migracji tabeli: {e}")
+        raise
+
+def generate_vehicle_telemetry(vehicle_id, num_samples, start_date=DEFAULT_START_DATE,
+                               interval_s=60, seed=None):
+    """
+    Generuje dane telemetryczne jednego pojazdu jako całe tablice NumPy.
+
+    Prędkość to błądzenie losowe obcięte w zerze (max(0, v + szum)), liczone
+    wektorowo ze wzoru v_t = S_t - min(0, min_{k<=t} S_k), gdzie S to suma
+    skumulowana zmian prędkości. Moc trakcyjna zależy od prędkości, moc HVAC
+    to stała z szumem, a dystans to prędkość razy czas między pomiarami.
+
+    :param vehicle_id: Identyfikator pojazdu.
+    :param num_samples: Liczba pomiarów.
+    :param start_date: Czas startu (pierwszy pomiar jest o `interval_s` później).
+    :param interval_s: Odstęp między pomiarami w sekundach.
+    :param seed: Ziarno generatora (int lub np.random.SeedSequence).
+    :return: DataFrame z kolumnami COPY_COLUMNS.
+    """
+    rng = np.random.default_rng(seed)
+    interval_h = interval_s / 3600
+
+    # Odchylenie zmian prędkości skalowane tak, by przy 1 minucie wynosiło 5 km/h
+    speed_steps = rng.normal(loc=0, scale=5 * np.sqrt(interval_s / 60), size=num_samples)
+    walk = np.cumsum(speed_steps)
+    speed = walk - np.minimum(np.minimum.accumulate(walk), 0)
+
+    traction_power = np.maximum(0, speed * 0.5 + rng.normal(loc=5, scale=10, size=num_samples))
+    hvac_power = np.maximum(0, 3 + rng.normal(loc=0, scale=1, size=num_samples))
+
+    distance_km = speed * interval_h
+    # Minimalny dystans, aby uniknąć dzielenia przez zero w analizach
+    distance_km[distance_km == 0] = 0.000001
+
+    timestamps = pd.Timestamp(start_date) + pd.to_timedelta(
+        np.arange(1, num_samples + 1) * interval_s, unit="s"
+    )
+
+    return pd.DataFrame({
+        "vehicle_id": vehicle_id,
+        "timestamp": timestamps,
+        "speed_kmh": np.round(speed, 2),
+        "traction_power_kw": np.round(traction_power, 2),
+        "hvac_power_kw": np.round(hvac_power, 2),
+        "distance_km": np.round(distance_km, 4),
+    })
+
+def _generate_vehicle_task(args):
+    """Opakowanie dla ProcessPoolExecutor (funkcja musi być importowalna)."""
+    return generate_vehicle_telemetry(*args)
+
+def iter_fleet_telemetry(num_vehicles=3, samples_per_vehicle=100, start_date=DEFAULT_START_DATE,
+                         interval_s=60, seed=None, workers=1):
+    """
+    Generuje dane floty pojazd po pojeździe, zwracając kolejne DataFrame'y.
+
+    Przy `workers > 1` pojazdy są generowane równolegle w puli procesów. Liczba
+    zadań w locie jest ograniczona, więc w pamięci jest tylko kilka pojazdów naraz.
+    Każdy pojazd dostaje własne ziarno z `SeedSequence(seed)`, więc wynik nie zależy
+    od liczby procesów.
+    """
+    child_seeds = np.random.SeedSequence(seed).spawn(num_vehicles)
+    tasks = (
+        (f"Pojazd_{i+1}", samples_per_vehicle, start_date, interval_s, child_seeds[i])
+        for i in range(num_vehicles)
+    )
+
+    if workers is None or workers <= 1:
+        for task in tasks:
+            yield _generate_vehicle_task(task)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_generate_vehicle_task, task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def generate_synthetic_data(num_records=1000, num_vehicles=3, interval_s=60, seed=None, workers=1):
     """Generuje sztuczne dane telemetryczne pojazdów."""
-    fake = Faker()
-    data = []
-    vehicle_ids = [f"Pojazd_{i+1}" for i in range(num_vehicles)]
-    start_date = datetime(2025, 2, 10)
-    
-    for vehicle_id in vehicle_ids:
-        current_time = start_date
-        last_speed = 0
-        
-        for _ in range(num_records // num_vehicles):
-            # Symulacja upływu czasu (np. co 1 minutę)
-            current_time += timedelta(minutes=1)
-            
-            # Symulacja prędkości (zależna od poprzedniej, z szumem)
-            speed_change = np.random.normal(loc=0, scale=5)
-            new_speed = max(0, last_speed + speed_change)
-            
-            # Symulacja mocy trakcyjnej (zależna od prędkości)
-            traction_power = max(0, new_speed * 0.5 + np.random.normal(loc=5, scale=10))
-            
-            # Symulacja mocy HVAC (stała + szum)
-            hvac_power = max(0, 3 + np.random.normal(loc=0, scale=1))
-            
-            # Obliczenie dystansu (prędkość * czas w godzinach)
-            # Czas między pomiarami to 1 minuta = 1/60 godziny
-            distance_km = new_speed * (1/60)
-            if distance_km == 0:
-                distance_km = 0.000001 # Minimalny dystans, aby uniknąć błędu
-            
-            data.append({
-                "vehicle_id": vehicle_id,
-                "timestamp": current_time,
-                "speed_kmh": round(new_speed, 2),
-                "traction_power_kw": round(traction_power, 2),
-                "hvac_power_kw": round(hvac_power, 2),
-                "distance_km": round(distance_km, 4)
-            })
-            
-            last_speed = new_speed
-
-    df = pd.DataFrame(data)
+    frames = list(iter_fleet_telemetry(
+        num_vehicles=num_vehicles,
+        samples_per_vehicle=num_records // num_vehicles,
+        interval_s=interval_s,
+        seed=seed,
+        workers=workers,
+    ))
+    df = pd.concat(frames, ignore_index=True)
     # Sortowanie danych chronologicznie
     df = df.sort_values(by=['vehicle_id', 'timestamp']).reset_index(drop=True)
     print(f"Wygenerowano {len(df)} rekordów danych.")
     return df
 
-def insert_data(conn, df):
-    """Wstawia dane z DataFrame do tabeli vehicle_data."""
+def _iter_source_chunks(source, chunk_rows):
+    """
+    Dzieli źródło danych na paczki DataFrame o rozmiarze co najwyżej `chunk_rows`.
+    Obsługuje DataFrame, ścieżkę do pliku CSV/Parquet oraz iterator DataFrame'ów.
+    """
+    if isinstance(source, pd.DataFrame):
+        for start in range(0, len(source), chunk_rows):
+            yield source.iloc[start:start + chunk_rows]
+        return
+
+    if isinstance(source, (str, os.PathLike)):
+        path = os.fspath(source)
+        if path.endswith((".parquet", ".pq")):
+            try:
+                import pyarrow.parquet as pq
+            except ImportError as e:
+                raise ImportError("Ładowanie plików Parquet wymaga biblioteki pyarrow.") from e
+            parquet_file = pq.ParquetFile(path)
+            for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=COPY_COLUMNS):
+                yield batch.to_pandas()
+            return
+        if path.endswith((".csv", ".csv.gz")):
+            yield from pd.read_csv(path, usecols=COPY_COLUMNS, chunksize=chunk_rows)
+            return
+        raise ValueError(f"Nieobsługiwany format pliku: {path} (oczekiwano CSV lub Parquet).")
+
+    # Iterator paczek (np. z generatora danych) - dzielimy zbyt duże paczki
+    for frame in source:
+        yield from _iter_source_chunks(frame, chunk_rows)
+
+def _copy_chunk(cur, chunk):
+    """Przesyła jedną paczkę danych do bazy poleceniem COPY FROM STDIN."""
+    buffer = io.StringIO()
+    chunk[COPY_COLUMNS].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+    cur.copy_expert(COPY_QUERY, buffer)
+
+def bulk_load(conn, source, chunk_rows=BULK_CHUNK_ROWS, update_rollups=True, on_chunk=None, verbose=True):
+    """
+    Ładuje dane do tabeli vehicle_data poleceniem COPY FROM STDIN w paczkach
+    po `chunk_rows` wierszy. Każda paczka jest zatwierdzana osobno (razem z wpisem
+    w katalogu pojazdów), więc zużycie pamięci nie zależy od rozmiaru źródła.
+
+    :param conn: Połączenie psycopg2.
+    :param source: DataFrame, ścieżka do pliku CSV/Parquet lub iterator DataFrame'ów.
+    :param chunk_rows: Maksymalna liczba wierszy w jednej paczce.
+    :param update_rollups: Czy po załadowaniu przyrostowo odświeżyć agregaty godzinowe/dzienne.
+    :param on_chunk: Opcjonalna funkcja (kursor, paczka) wywoływana przed zatwierdzeniem każdej
+                     paczki - jej zapisy są atomowe z danymi (np. dziennik ingest_service.py).
+    :param verbose: Czy wypisywać postęp ładowania.
+    :return: Liczba załadowanych wierszy.
+    """
+    total_rows = 0
+    started = time.perf_counter()
     try:
+        partitioned = is_partitioned(conn)
         with conn.cursor() as cur:
-            # Przygotowanie zapytania INSERT
-            insert_query = """
-            INSERT INTO vehicle_data (vehicle_id, timestamp, speed_kmh, traction_power_kw, hvac_power_kw, distance_km)
-            VALUES (%s, %s, %s, %s, %s, %s);
-            """
-            
-            # Iteracja i wstawianie danych
-            for index, row in df.iterrows():
-                cur.execute(insert_query, (
-                    row['vehicle_id'],
-                    row['timestamp'],
-                    row['speed_kmh'],
-                    row['traction_power_kw'],
-                    row['hvac_power_kw'],
-                    row['distance_km']
-                ))
-            
-            conn.commit()
-        print(f"Pomyślnie wstawiono {len(df)} rekordów do bazy danych.")
+            for chunk in _iter_source_chunks(source, chunk_rows):
+                if chunk.empty:
+                    continue
+                if partitioned:
+                    timestamps = pd.to_datetime(chunk["timestamp"])
+                    ensure_partitions(conn, timestamps.min(), timestamps.max())
+                _copy_chunk(cur, chunk)
+                record_chunk(cur, chunk)
+                if on_chunk is not None:
+                    on_chunk(cur, chunk)
+                conn.commit()
+                total_rows += len(chunk)
+                elapsed = time.perf_counter() - started
+                if verbose:
+                    print(f"Załadowano {total_rows} rekordów ({total_rows / max(elapsed, 1e-9):,.0f} rekordów/s).")
     except Exception as e:
-        print(f"Błąd podczas wstawiania danych: {e}")
+        conn.rollback()
+        print(f"Błąd podczas ładowania danych (załadowano {total_rows} rekordów): {e}")
         raise
+    finally:
+        # Zatwierdzone paczki są już widoczne - katalog w pamięci procesu jest nieaktualny
+        if total_rows:
+            invalidate_catalog()
+
+    elapsed = time.perf_counter() - started
+    if verbose:
+        print(f"Pomyślnie załadowano {total_rows} rekordów w {elapsed:.2f} s "
+              f"({total_rows / max(elapsed, 1e-9):,.0f} rekordów/s).")
+    if update_rollups and total_rows:
+        refresh_rollups(conn)
+    return total_rows
+
+def insert_data(conn, df):
+    """Wstawia dane z DataFrame do tabeli vehicle_data (przez COPY)."""
+    return bulk_load(conn, df)
 
-def setup_database():
-    """Główna funkcja do konfiguracji bazy danych i wstawiania danych."""
+def setup_database(num_vehicles=3, samples_per_vehicle=100, start_date=DEFAULT_START_DATE,
+                   interval_s=60, seed=None, workers=1, source=None,
+                   schema_mode=SCHEMA_MODE, migrate=False, load_data=True):
+    """
+    Główna funkcja do konfiguracji bazy danych i wstawiania danych.
+
+    Bez `source` generuje dane syntetyczne floty i strumieniuje je do bazy pojazd
+    po pojeździe, bez trzymania całego zbioru w pamięci. Z `source` (plik CSV/Parquet)
+    ładuje dane z pliku. Przy `migrate=True` istniejąca tabela jest przenoszona
+    do schematu partycjonowanego przed załadowaniem danych.
+    """
     if not DB_URL:
         print("Błąd: Zmienna środowiskowa DATABASE_URL nie jest ustawiona.")
         print("Upewnij się, że plik .env jest poprawnie skonfigurowany.")
         return
+    if source is None and load_data and interval_s != SAMPLE_INTERVAL_S:
+        print(f"Błąd: Odstęp pomiarów {interval_s} s nie jest obsługiwany - energia jest liczona "
+              f"dla stałego odstępu {SAMPLE_INTERVAL_S} s.")
+        return
 
     conn = None
     try:
         # Nawiązanie połączenia z bazą danych
         conn = psycopg2.connect(DB_URL)
         
-        # 1. Tworzenie tabeli
-        create_table(conn)
+        # 1. Tworzenie tabeli (lub migracja istniejącej)
+        if migrate:
+            migrate_to_partitioned(conn)
+        else:
+            create_table(conn, schema_mode=schema_mode)
+        if not load_data:
+            return
         
-        # 2. Generowanie danych
-        data_df = generate_synthetic_data(num_records=300, num_vehicles=3)
+        # 2. Generowanie danych (lub odczyt z pliku)
+        if source is None:
+            print(f"Generowanie danych: {num_vehicles} pojazdów x {samples_per_vehicle} pomiarów "
+                  f"co {interval_s} s.")
+            source = iter_fleet_telemetry(
+                num_vehicles=num_vehicles,
+                samples_per_vehicle=samples_per_vehicle,
+                start_date=start_date,
+                interval_s=interval_s,
+                seed=seed,
+                workers=workers,
+            )
         
-        # 3. Wstawianie danych
-        insert_data(conn, data_df)
+        # 3. Wstawianie danych (COPY w paczkach)
+        bulk_load(conn, source)
         
     except psycopg2.OperationalError as e:
         print("\n" + "="*50)
@@ -145,5 +456,54 @@ def setup_database():
             conn.close()
             print("Połączenie z bazą danych zostało zamknięte.")
 
+def parse_args(argv=None):
+    """Argumenty wiersza poleceń generatora/ładowarki danych."""
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Tworzy tabelę vehicle_data i ładuje do niej dane syntetyczne lub dane z pliku."
+    )
+    parser.add_argument("--vehicles", type=int, default=3, help="Liczba pojazdów (domyślnie 3).")
+    parser.add_argument("--days", type=float, default=None,
+                        help="Liczba dni danych na pojazd (nadpisuje --samples).")
+    parser.add_argument("--samples", type=int, default=100,
+                        help="Liczba pomiarów na pojazd (domyślnie 100).")
+    parser.add_argument("--interval", type=int, default=SAMPLE_INTERVAL_S,
+                        help=f"Odstęp między pomiarami w sekundach (obecnie tylko {SAMPLE_INTERVAL_S} - "
+                             f"energia jest liczona dla stałego odstępu).")
+    parser.add_argument("--start", type=str, default=DEFAULT_START_DATE.strftime("%Y-%m-%d"),
+                        help="Data początkowa w formacie YYYY-MM-DD.")
+    parser.add_argument("--seed", type=int, default=None, help="Ziarno generatora losowego.")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Liczba procesów generujących dane (domyślnie 1).")
+    parser.add_argument("--load", type=str, default=None, metavar="PLIK",
+                        help="Zamiast generować, załaduj dane z pliku CSV lub Parquet.")
+    parser.add_argument("--schema", choices=SCHEMA_MODES, default=SCHEMA_MODE,
+                        help="Tryb schematu tabeli (domyślnie z VEHICLE_SCHEMA_MODE lub 'simple').")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Przenieś istniejącą tabelę do schematu partycjonowanego.")
+    parser.add_argument("--no-data", action="store_true",
+                        help="Tylko utwórz/zmigruj schemat, bez ładowania danych.")
+    args = parser.parse_args(argv)
+    if args.interval != SAMPLE_INTERVAL_S:
+        parser.error(f"--interval {args.interval}: obsługiwany jest tylko odstęp {SAMPLE_INTERVAL_S} s "
+                     f"(energia jest liczona dla stałego odstępu analysis.SAMPLE_INTERVAL_H).")
+    return args
+
 if __name__ == "__main__":
-    setup_database()
+    args = parse_args()
+    samples = args.samples
+    if args.days is not None:
+        samples = int(args.days * 86400 // args.interval)
+    setup_database(
+        num_vehicles=args.vehicles,
+        samples_per_vehicle=samples,
+        start_date=datetime.strptime(args.start, "%Y-%m-%d"),
+        interval_s=args.interval,
+        seed=args.seed,
+        workers=args.workers,
+        source=args.load,
+        schema_mode=args.schema,
+        migrate=args.migrate,
+        load_data=not args.no_data,
+    )
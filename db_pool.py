@@ -0,0 +1,242 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Wczytanie zmiennych środowiskowych
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL")
+
+# Konfiguracja puli połączeń (można nadpisać zmiennymi środowiskowymi)
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+# Maksymalny czas oczekiwania na wolne połączenie (s)
+POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))
+# Po tym czasie (s) połączenie jest zamykane i otwierane na nowo
+POOL_MAX_LIFETIME_S = float(os.getenv("DB_POOL_MAX_LIFETIME_S", "1800"))
+# Połączenie bezczynne dłużej niż ten czas (s) jest sprawdzane przez SELECT 1
+POOL_HEALTH_CHECK_IDLE_S = float(os.getenv("DB_POOL_HEALTH_CHECK_IDLE_S", "30"))
+
+
+class PoolTimeoutError(Exception):
+    """Brak wolnego połączenia w puli w zadanym czasie."""
+
+
+class _PooledConnection:
+    """Połączenie z bazą wraz z informacjami potrzebnymi do recyklingu."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+
+
+class ConnectionPool:
+    """
+    Bezpieczna wątkowo pula połączeń PostgreSQL.
+
+    Połączenia są wypożyczane przez `connection()` i zwracane do puli po użyciu.
+    Przy wypożyczeniu pula odrzuca połączenia zamknięte, zbyt stare
+    (`max_lifetime`) oraz te, które po dłuższej bezczynności nie odpowiadają na `SELECT 1`.
+    """
+
+    def __init__(self, dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout=POOL_TIMEOUT_S, max_lifetime=POOL_MAX_LIFETIME_S,
+                 health_check_idle=POOL_HEALTH_CHECK_IDLE_S):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Niepoprawny rozmiar puli: min={min_size}, max={max_size}.")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0  # liczba otwartych połączeń (wolnych + wypożyczonych)
+        self._closed = False
+        self._stats = {
+            "checkouts": 0,
+            "connections_created": 0,
+            "connections_recycled": 0,
+            "health_check_failures": 0,
+            "exhausted": 0,
+            "timeouts": 0,
+            "wait_time_total_s": 0.0,
+            "wait_time_max_s": 0.0,
+        }
+
+        for _ in range(min_size):
+            with self._cond:
+                self._size += 1
+            self._idle.append(self._open())
+
+    def _open(self):
+        """Otwiera połączenie dla miejsca w puli zarezerwowanego wcześniej przez `_size`."""
+        try:
+            conn = psycopg2.connect(self.dsn)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._stats["connections_created"] += 1
+        return _PooledConnection(conn)
+
+    def _discard(self, pooled):
+        try:
+            pooled.conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _is_healthy(self, pooled):
+        """Sprawdza, czy połączenie nadaje się do ponownego użycia."""
+        if pooled.conn.closed:
+            return False
+        now = time.monotonic()
+        if self.max_lifetime and now - pooled.created_at > self.max_lifetime:
+            with self._cond:
+                self._stats["connections_recycled"] += 1
+            return False
+        if self.health_check_idle is not None and now - pooled.last_used_at > self.health_check_idle:
+            try:
+                with pooled.conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                pooled.conn.rollback()
+            except Exception:
+                with self._cond:
+                    self._stats["health_check_failures"] += 1
+                return False
+        return True
+
+    def _acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                if self._closed:
+                    raise RuntimeError("Pula połączeń została zamknięta.")
+                pooled = self._idle.pop() if self._idle else None
+                can_open = pooled is None and self._size < self.max_size
+                if pooled is None and not can_open:
+                    if not waited:
+                        self._stats["exhausted"] += 1
+                        waited = True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Brak wolnego połączenia w puli (max_size={self.max_size}) "
+                            f"po {self.timeout} s."
+                        )
+                    self._cond.wait(remaining)
+                    continue
+                if can_open:
+                    # Rezerwacja miejsca, zanim połączenie zostanie otwarte poza blokadą
+                    self._size += 1
+
+            # Otwieranie połączenia i health check poza blokadą
+            if pooled is None:
+                pooled = self._open()
+            elif not self._is_healthy(pooled):
+                self._discard(pooled)
+                continue
+
+            wait_s = time.monotonic() - started
+            with self._cond:
+                self._stats["checkouts"] += 1
+                self._stats["wait_time_total_s"] += wait_s
+                self._stats["wait_time_max_s"] = max(self._stats["wait_time_max_s"], wait_s)
+            return pooled
+
+    def _release(self, pooled, broken=False):
+        conn = pooled.conn
+        if not broken and not conn.closed:
+            try:
+                # Zamknięcie ewentualnej otwartej transakcji przed zwrotem do puli
+                conn.rollback()
+            except Exception:
+                broken = True
+        if broken or conn.closed or self._closed:
+            self._discard(pooled)
+            return
+        pooled.last_used_at = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Wypożycza połączenie z puli i zwraca je po wyjściu z bloku `with`."""
+        pooled = self._acquire()
+        try:
+            yield pooled.conn
+        except psycopg2.OperationalError:
+            self._release(pooled, broken=True)
+            raise
+        except BaseException:
+            self._release(pooled)
+            raise
+        else:
+            self._release(pooled)
+
+    def stats(self):
+        """Zwraca bieżące metryki puli."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            stats["min_size"] = self.min_size
+            stats["max_size"] = self.max_size
+        checkouts = stats["checkouts"]
+        stats["wait_time_avg_s"] = stats["wait_time_total_s"] / checkouts if checkouts else 0.0
+        return stats
+
+    def close(self):
+        """Zamyka wszystkie wolne połączenia i blokuje dalsze wypożyczenia."""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._cond.notify_all()
+        for pooled in idle:
+            self._discard(pooled)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Zwraca wspólną dla procesu pulę połączeń (tworzoną przy pierwszym użyciu)."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                if not DB_URL:
+                    raise ValueError("DATABASE_URL nie jest ustawione w zmiennych środowiskowych.")
+                _pool = ConnectionPool(DB_URL)
+    return _pool
+
+
+def close_pool():
+    """Zamyka wspólną pulę połączeń (np. przy zamykaniu aplikacji)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def pool_stats():
+    """Zwraca metryki wspólnej puli lub pusty słownik, jeśli pula nie powstała."""
+    return _pool.stats() if _pool is not None else {}
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Maksymalna liczba punktów na serię na wykresie (można nadpisać zmienną środowiskową)
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", "2000"))
+
+# Sygnały mocy mają krótkie piki, które LTTB może pominąć - dla nich rysujemy
+# dodatkowo obwiednię min/max w każdym kubełku.
+ENVELOPE_COLUMNS = ("traction_power_kw", "hvac_power_kw")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Wybiera indeksy punktów algorytmem Largest-Triangle-Three-Buckets.
+
+    Pierwszy i ostatni punkt zostają zawsze; z każdego z pozostałych `threshold - 2`
+    kubełków wybierany jest punkt tworzący największy trójkąt z punktem wybranym
+    w poprzednim kubełku i średnią następnego kubełka. Kształt serii (piki, doliny)
+    zostaje zachowany przy ograniczonej liczbie punktów.
+
+    :param x: Rosnące współrzędne X (np. czas jako liczby).
+    :param y: Wartości serii (bez NaN).
+    :param threshold: Docelowa liczba punktów.
+    :return: Posortowana tablica indeksów wybranych punktów.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Granice kubełków (bez pierwszego i ostatniego punktu)
+    edges = np.floor(np.arange(threshold - 1) * (n - 2) / (threshold - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Średnia następnego kubełka (dla ostatniego - ostatni punkt)
+        next_start = end
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def minmax_envelope(x: np.ndarray, y: np.ndarray, buckets: int):
+    """
+    Dzieli serię na `buckets` równych kubełków i zwraca dla każdego początek (x),
+    minimum i maksimum wartości.
+    """
+    n = len(x)
+    buckets = max(1, min(buckets, n))
+    starts = np.linspace(0, n, buckets, endpoint=False).astype(np.int64)
+    return x[starts], np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
+
+
+def downsample_series(timestamps: pd.Series, values: pd.Series, max_points: int = CHART_MAX_POINTS,
+                      envelope: bool = False) -> dict:
+    """
+    Przygotowuje serię do wykresu z ograniczoną liczbą punktów.
+
+    :return: Słownik z kluczami 'x', 'y' (punkty LTTB) oraz - przy `envelope=True`
+             i redukcji danych - 'envelope_x', 'lower', 'upper' (obwiednia min/max).
+    """
+    values = pd.to_numeric(values, errors="coerce")
+    known = values.notna().to_numpy()
+    x = pd.to_datetime(timestamps).to_numpy()[known]
+    y = values.to_numpy(dtype=np.float64)[known]
+
+    x_numeric = x.astype("datetime64[ns]").astype(np.int64)
+    idx = lttb_indices(x_numeric, y, max_points)
+    series = {"x": x[idx], "y": y[idx]}
+
+    if envelope and len(idx) < len(y):
+        env_x, lower, upper = minmax_envelope(x, y, max_points // 2)
+        series.update({"envelope_x": env_x, "lower": lower, "upper": upper})
+    return series
@@ -0,0 +1,630 @@
+import argparse
+import asyncio
+import fcntl
+import json
+import math
+import os
+import re
+import socket
+import tempfile
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Iterable, List, Tuple
+
+import pandas as pd
+import psycopg2
+from dotenv import load_dotenv
+from psycopg2.extras import execute_values
+
+from db_manager import BULK_CHUNK_ROWS, COPY_COLUMNS, bulk_load, create_table
+from rollups import refresh_rollups
+
+# Usługa przyjmowania telemetrii na żywo: HTTP (POST /ingest, JSON lub linie CSV) oraz
+# protokół liniowy po TCP. Próbki są najpierw dopisywane do bufora na dysku (spool),
+# a osobny wątek ładuje go do vehicle_data mikropaczkami przez db_manager.bulk_load.
+# Przy niedostępnej bazie dane czekają w buforze; gdy bufor przekroczy limit, usługa
+# wstrzymuje przyjmowanie (HTTP 503, TCP - bez czytania z gniazda) zamiast gubić próbki.
+
+# Wczytanie zmiennych środowiskowych
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL")
+INGEST_HOST = os.getenv("INGEST_HOST", "127.0.0.1")
+INGEST_HTTP_PORT = int(os.getenv("INGEST_HTTP_PORT", "8100"))
+# Port protokołu liniowego TCP (0 wyłącza)
+INGEST_TCP_PORT = int(os.getenv("INGEST_TCP_PORT", "8101"))
+# Mikropaczka jest zamykana po tylu próbkach albo po INGEST_FLUSH_INTERVAL_S od pierwszej próbki
+INGEST_BATCH_ROWS = int(os.getenv("INGEST_BATCH_ROWS", "20000"))
+INGEST_FLUSH_INTERVAL_S = float(os.getenv("INGEST_FLUSH_INTERVAL_S", "1"))
+INGEST_SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "vehicle_ingest_spool"))
+# Ile danych może czekać na zapis do bazy, zanim usługa wstrzyma przyjmowanie
+INGEST_SPOOL_MAX_MB = float(os.getenv("INGEST_SPOOL_MAX_MB", "1024"))
+# fsync po każdym dopisaniu (odporność na awarię zasilania kosztem przepustowości);
+# bez tego fsync następuje przy zamknięciu mikropaczki
+INGEST_SPOOL_FSYNC = os.getenv("INGEST_SPOOL_FSYNC", "0") == "1"
+# Jak często odświeżać agregaty godzinowe/dzienne, gdy napływają nowe dane
+INGEST_ROLLUP_INTERVAL_S = float(os.getenv("INGEST_ROLLUP_INTERVAL_S", "30"))
+# Maks. odstęp między próbami połączenia z niedostępną bazą
+INGEST_RETRY_MAX_S = float(os.getenv("INGEST_RETRY_MAX_S", "30"))
+
+# Po zaległościach (np. restarcie bazy) kilka mikropaczek jest ładowanych jednym COPY
+INGEST_COPY_MAX_ROWS = BULK_CHUNK_ROWS
+TCP_READ_BYTES = 256 * 1024
+# Dłuższa linia TCP (np. nadawca bez znaków końca linii) jest odrzucana zamiast buforowana
+TCP_MAX_LINE_BYTES = 64 * 1024
+SPOOL_HEADER = ",".join(COPY_COLUMNS) + "\n"
+
+# Dziennik załadowanych mikropaczek - zapisywany w transakcji z danymi, więc mikropaczka
+# ponowiona po awarii (np. między COMMIT a usunięciem pliku) nie zostanie zdublowana
+CREATE_INGEST_LOG_QUERY = """
+CREATE TABLE IF NOT EXISTS ingest_log (
+    segment VARCHAR(200) PRIMARY KEY,
+    row_count INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now()
+);
+"""
+
+LOADED_SEGMENTS_QUERY = "SELECT segment FROM ingest_log WHERE segment = ANY(%s);"
+
+LOG_SEGMENTS_QUERY = "INSERT INTO ingest_log (segment, row_count) VALUES %s;"
+
+# Pliki starszych mikropaczek już nie istnieją - wpisy służą tylko do wykrycia powtórzeń
+PRUNE_INGEST_LOG_QUERY = "DELETE FROM ingest_log WHERE loaded_at < now() - interval '7 days';"
+
+VEHICLE_ID_RE = re.compile(r"[\w.:\-]{1,50}")
+NUMERIC_COLUMNS = COPY_COLUMNS[2:]
+
+
+class SampleError(ValueError):
+    """Nieprawidłowa próbka (odrzucana bez wpływu na pozostałe)."""
+
+
+class SpoolFull(Exception):
+    """Bufor na dysku przekroczył INGEST_SPOOL_MAX_MB - baza nie nadąża z zapisem."""
+
+
+def _timestamp(value) -> str:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # Sekundy od epoki (UTC)
+        ts = datetime.fromtimestamp(value, timezone.utc).replace(tzinfo=None)
+    else:
+        try:
+            ts = datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise SampleError(f"nieprawidłowy timestamp: {value!r}")
+        if ts.tzinfo is not None:
+            # Kolumna jest bez strefy czasowej - czas ze strefą zapisujemy jako UTC
+            ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    # Jeden format w całym buforze (pd.to_datetime w bulk_load nie musi zgadywać)
+    return ts.isoformat(sep=" ", timespec="microseconds")
+
+
+def _number(name, value) -> str:
+    if value is None or value == "":
+        return ""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise SampleError(f"{name}: nieprawidłowa liczba {value!r}")
+    if not math.isfinite(number):
+        raise SampleError(f"{name}: wartość {value!r} nie jest skończona")
+    return repr(number)
+
+
+def format_sample(vehicle_id, timestamp, speed_kmh=None, traction_power_kw=None, hvac_power_kw=None,
+                  distance_km=None) -> str:
+    """
+    Sprawdza próbkę i zwraca ją jako wiersz CSV w kolejności COPY_COLUMNS (bez znaku nowej linii).
+    Timestamp: ISO 8601 (ze strefą - zamieniany na UTC) lub sekundy od epoki; liczby mogą być puste.
+    """
+    vehicle_id = str(vehicle_id).strip() if vehicle_id is not None else ""
+    if not VEHICLE_ID_RE.fullmatch(vehicle_id):
+        raise SampleError(f"nieprawidłowy vehicle_id: {vehicle_id!r}")
+    values = (speed_kmh, traction_power_kw, hvac_power_kw, distance_km)
+    return ",".join([vehicle_id, _timestamp(timestamp)] +
+                    [_number(name, value) for name, value in zip(NUMERIC_COLUMNS, values)])
+
+
+def parse_lines(text: str) -> Tuple[List[str], List[str]]:
+    """
+    Protokół liniowy: jedna próbka na linię, pola jak COPY_COLUMNS oddzielone przecinkami
+    (vehicle_id,timestamp,speed_kmh,traction_power_kw,hvac_power_kw,distance_km).
+    Puste linie i komentarze (#) są pomijane.
+
+    :return: Krotka (poprawne wiersze CSV, opisy błędów odrzuconych linii).
+    """
+    rows, errors = [], []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(",")
+        try:
+            if len(fields) != len(COPY_COLUMNS):
+                raise SampleError(f"oczekiwano {len(COPY_COLUMNS)} pól, jest {len(fields)}")
+            rows.append(format_sample(*fields))
+        except SampleError as e:
+            errors.append(f"linia {number}: {e}")
+    return rows, errors
+
+
+def _json_samples(payload) -> Iterable[Tuple[int, dict]]:
+    items = payload if isinstance(payload, list) else [payload]
+    for index, item in enumerate(items):
+        if isinstance(item, dict) and isinstance(item.get("samples"), list):
+            # Paczka jednego pojazdu: {"vehicle_id": ..., "samples": [{...}, ...]}
+            for sample in item["samples"]:
+                if isinstance(sample, dict):
+                    yield index, {"vehicle_id": item.get("vehicle_id"), **sample}
+                else:
+                    yield index, sample
+        else:
+            yield index, item
+
+
+def parse_json(payload) -> Tuple[List[str], List[str]]:
+    """
+    Próbki w JSON: obiekt lub lista obiektów z polami COPY_COLUMNS, albo paczki jednego
+    pojazdu {"vehicle_id": "Pojazd_1", "samples": [{"timestamp": ..., "speed_kmh": ...}, ...]}.
+
+    :return: Krotka (poprawne wiersze CSV, opisy błędów odrzuconych próbek).
+    """
+    rows, errors = [], []
+    for index, sample in _json_samples(payload):
+        try:
+            if not isinstance(sample, dict):
+                raise SampleError("próbka musi być obiektem")
+            rows.append(format_sample(**{name: sample.get(name) for name in COPY_COLUMNS}))
+        except SampleError as e:
+            errors.append(f"element {index}: {e}")
+    return rows, errors
+
+
+class Spool:
+    """
+    Bufor próbek na dysku (dziennik z wyprzedzeniem). Przyjęte próbki są dopisywane do
+    otwartej mikropaczki (plik .part), która po INGEST_BATCH_ROWS próbkach lub po
+    INGEST_FLUSH_INTERVAL_S jest zamykana (.csv) i czeka na załadowanie do bazy. Plik jest
+    usuwany dopiero po zatwierdzeniu danych, więc restart bazy ani usługi ich nie gubi.
+    """
+
+    def __init__(self, directory=INGEST_SPOOL_DIR, batch_rows=INGEST_BATCH_ROWS,
+                 flush_interval_s=INGEST_FLUSH_INTERVAL_S, max_bytes=int(INGEST_SPOOL_MAX_MB * 1024 * 1024),
+                 fsync=INGEST_SPOOL_FSYNC):
+        self.directory = directory
+        self.failed_directory = os.path.join(directory, "failed")
+        self.batch_rows = batch_rows
+        self.flush_interval_s = flush_interval_s
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._node = re.sub(r"[^\w.\-]", "_", socket.gethostname())[:40]
+        self._counter = 0
+        self._active = None
+        self._active_path = None
+        self._active_rows = 0
+        self._active_since = 0.0
+        # Zamknięte mikropaczki od najstarszej: (ścieżka, liczba wierszy, rozmiar, czas zamknięcia)
+        self._sealed = deque()
+        self.pending_bytes = 0
+        self._lock_file = None
+
+    def open(self):
+        """
+        Blokuje katalog bufora dla tego procesu i odtwarza mikropaczki pozostawione przez
+        poprzednie uruchomienie (otwarte pliki są przycinane do ostatniej pełnej linii).
+        """
+        os.makedirs(self.failed_directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "spool.lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            raise RuntimeError(f"Katalog bufora {self.directory} jest używany przez inny proces.")
+
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if name.endswith(".part"):
+                path = self._recover_part(path)
+            if path is None or not path.endswith(".csv"):
+                continue
+            with open(path, "rb") as f:
+                rows = max(sum(1 for _ in f) - 1, 0)
+            size = os.path.getsize(path)
+            self._sealed.append((path, rows, size, os.path.getmtime(path)))
+            self.pending_bytes += size
+        if self._sealed:
+            print(f"Bufor: {len(self._sealed)} mikropaczek z poprzedniego uruchomienia czeka na zapis.")
+
+    @staticmethod
+    def _recover_part(path):
+        with open(path, "rb+") as f:
+            data = f.read()
+            f.truncate(data.rfind(b"\n") + 1)
+        if data.count(b"\n") <= 1:
+            os.remove(path)
+            return None
+        sealed = path[:-len(".part")] + ".csv"
+        os.replace(path, sealed)
+        return sealed
+
+    def overloaded(self) -> bool:
+        """Czy bufor przekroczył limit (baza nie nadąża) - nowe próbki należy wstrzymać."""
+        return self.pending_bytes >= self.max_bytes
+
+    def append(self, rows: List[str]):
+        """Dopisuje wiersze CSV (z format_sample) do otwartej mikropaczki."""
+        if not rows:
+            return
+        if self.overloaded():
+            raise SpoolFull(f"Bufor przekroczył {self.max_bytes / 1024 / 1024:.0f} MB - baza nie nadąża z zapisem.")
+        data = ("\n".join(rows) + "\n").encode("utf-8")
+        with self._lock:
+            if self._active is None:
+                self._counter += 1
+                name = f"seg-{time.time_ns():020d}-{self._node}-{os.getpid()}-{self._counter}.part"
+                self._active_path = os.path.join(self.directory, name)
+                self._active = open(self._active_path, "ab")
+                self._active.write(SPOOL_HEADER.encode("utf-8"))
+                self._active_since = time.monotonic()
+                self.pending_bytes += len(SPOOL_HEADER)
+            self._active.write(data)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self._active_rows += len(rows)
+            self.pending_bytes += len(data)
+            if self._active_rows >= self.batch_rows:
+                self._seal()
+
+    def seal_if_due(self, force=False):
+        """Zamyka otwartą mikropaczkę, jeśli minął INGEST_FLUSH_INTERVAL_S (lub zawsze przy `force`)."""
+        with self._lock:
+            if self._active is not None and (force or time.monotonic() - self._active_since >= self.flush_interval_s):
+                self._seal()
+
+    def _seal(self):
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._active.close()
+        sealed = self._active_path[:-len(".part")] + ".csv"
+        os.replace(self._active_path, sealed)
+        self._sealed.append((sealed, self._active_rows, os.path.getsize(sealed), time.time()))
+        self._active, self._active_path, self._active_rows = None, None, 0
+
+    def take(self, max_rows: int) -> List[Tuple[str, int]]:
+        """Najstarsze zamknięte mikropaczki (co najmniej jedna) o łącznie co najwyżej `max_rows` wierszach."""
+        batch, total = [], 0
+        with self._lock:
+            for path, rows, _, _ in self._sealed:
+                if batch and total + rows > max_rows:
+                    break
+                batch.append((path, rows))
+                total += rows
+        return batch
+
+    def done(self, paths: Iterable[str], failed=False):
+        """Usuwa mikropaczki zapisane w bazie (lub przenosi odrzucone przez bazę do katalogu failed/)."""
+        paths = set(paths)
+        with self._lock:
+            for entry in [e for e in self._sealed if e[0] in paths]:
+                self._sealed.remove(entry)
+                self.pending_bytes -= entry[2]
+                if failed:
+                    os.replace(entry[0], os.path.join(self.failed_directory, os.path.basename(entry[0])))
+                else:
+                    os.remove(entry[0])
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = self._sealed[0][3] if self._sealed else None
+            return {
+                "pending_segments": len(self._sealed) + (self._active is not None),
+                "pending_rows": sum(e[1] for e in self._sealed) + self._active_rows,
+                "pending_bytes": self.pending_bytes,
+                "max_bytes": self.max_bytes,
+                "lag_s": time.time() - oldest if oldest else 0.0,
+                "overloaded": self.overloaded(),
+            }
+
+
+class IngestWriter(threading.Thread):
+    """
+    Wątek ładujący zamknięte mikropaczki do bazy przez bulk_load (COPY, katalog pojazdów).
+    Nazwy mikropaczek trafiają do ingest_log w tej samej transakcji co dane. Przy błędzie
+    połączenia próbuje ponownie z rosnącym odstępem (dane czekają w buforze); mikropaczki
+    odrzucone przez bazę (błędne dane) trafiają do katalogu failed/ bufora.
+    """
+
+    def __init__(self, spool: Spool, db_url=DB_URL, rollup_interval_s=INGEST_ROLLUP_INTERVAL_S):
+        super().__init__(name="ingest-writer", daemon=True)
+        self.spool = spool
+        self.db_url = db_url
+        self.rollup_interval_s = rollup_interval_s
+        self._conn = None
+        self._stop_event = threading.Event()
+        self._retry_s = 0.0
+        # Ile kolejnych mikropaczek ładować pojedynczo (po błędzie danych w paczce zbiorczej)
+        self._isolate = 0
+        self._rows_since_rollup = 0
+        self._last_rollup = time.monotonic()
+        self._stats = {"written_rows": 0, "written_segments": 0, "duplicate_segments": 0,
+                       "failed_segments": 0, "db_errors": 0, "last_error": None, "db_ok": False}
+
+    def _connection(self):
+        if self._conn is None or self._conn.closed:
+            if not self.db_url:
+                raise psycopg2.OperationalError("DATABASE_URL nie jest ustawione w zmiennych środowiskowych.")
+            conn = psycopg2.connect(self.db_url)
+            create_table(conn)
+            with conn.cursor() as cur:
+                cur.execute(CREATE_INGEST_LOG_QUERY)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _disconnect(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except psycopg2.Error:
+                pass
+        self._conn = None
+
+    def run(self):
+        while True:
+            self.spool.seal_if_due(force=self._stop_event.is_set())
+            batch = self.spool.take(0 if self._isolate else INGEST_COPY_MAX_ROWS)
+            if not batch:
+                if self._stop_event.is_set():
+                    break
+                self._maybe_refresh_rollups()
+                self._stop_event.wait(min(self.spool.flush_interval_s / 4, 0.25))
+                continue
+            try:
+                self._load(batch)
+                self._retry_s = 0.0
+                self._isolate = max(self._isolate - 1, 0)
+                self._stats["db_ok"] = True
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                # Baza niedostępna - dane zostają w buforze
+                self._on_error(e)
+                self._stats["db_ok"] = False
+                self._disconnect()
+                if self._stop_event.is_set():
+                    break
+                self._retry_s = min(max(self._retry_s * 2, 0.5), INGEST_RETRY_MAX_S)
+                self._stop_event.wait(self._retry_s)
+            except (psycopg2.DataError, psycopg2.IntegrityError, ValueError) as e:
+                self._on_error(e)
+                self._rollback()
+                if len(batch) > 1:
+                    # Błędna może być jedna z mikropaczek - kolejne ładujemy pojedynczo
+                    self._isolate = len(batch)
+                else:
+                    self.spool.done([batch[0][0]], failed=True)
+                    self._isolate = max(self._isolate - 1, 0)
+                    self._stats["failed_segments"] += 1
+            except psycopg2.Error as e:
+                self._on_error(e)
+                self._rollback()
+                self._stop_event.wait(1.0)
+        self._maybe_refresh_rollups(force=True)
+        self._disconnect()
+
+    def _on_error(self, e):
+        self._stats["db_errors"] += 1
+        self._stats["last_error"] = str(e).strip()[:300]
+        print(f"Błąd zapisu telemetrii: {self._stats['last_error']}")
+
+    def _rollback(self):
+        if self._conn is not None and not self._conn.closed:
+            self._conn.rollback()
+
+    def _load(self, batch):
+        conn = self._connection()
+        names = {os.path.basename(path): (path, rows) for path, rows in batch}
+        with conn.cursor() as cur:
+            cur.execute(LOADED_SEGMENTS_QUERY, (list(names),))
+            loaded = {row[0] for row in cur.fetchall()}
+        conn.rollback()
+        if loaded:
+            # Załadowane przed awarią, ale plik nie został usunięty
+            self.spool.done(names[name][0] for name in loaded)
+            self._stats["duplicate_segments"] += len(loaded)
+        pending = {name: entry for name, entry in names.items() if name not in loaded}
+        if not pending:
+            return
+
+        frame = pd.concat(
+            [pd.read_csv(path, dtype=str, keep_default_na=False) for path, _ in pending.values()],
+            ignore_index=True,
+        )
+
+        def log_segments(cur, chunk):
+            execute_values(cur, LOG_SEGMENTS_QUERY, [(name, rows) for name, (_, rows) in pending.items()])
+
+        # Jedna paczka = jedna transakcja: dane, katalog pojazdów i dziennik razem
+        rows = bulk_load(conn, frame, chunk_rows=max(len(frame), 1), update_rollups=False,
+                         on_chunk=log_segments, verbose=False)
+        self.spool.done(path for path, _ in pending.values())
+        self._stats["written_rows"] += rows
+        self._stats["written_segments"] += len(pending)
+        self._rows_since_rollup += rows
+
+    def _maybe_refresh_rollups(self, force=False):
+        if not self._rows_since_rollup:
+            return
+        if not force and time.monotonic() - self._last_rollup < self.rollup_interval_s:
+            return
+        try:
+            conn = self._connection()
+            refresh_rollups(conn)
+            with conn.cursor() as cur:
+                cur.execute(PRUNE_INGEST_LOG_QUERY)
+            conn.commit()
+            self._rows_since_rollup = 0
+        except psycopg2.Error as e:
+            self._on_error(e)
+            self._disconnect()
+        self._last_rollup = time.monotonic()
+
+    def stop(self, timeout=None):
+        """Zamyka otwartą mikropaczkę i czeka (do `timeout` s) na zapis bufora do bazy."""
+        self._stop_event.set()
+        self.join(timeout)
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+
+class IngestService:
+    """Wspólny stan usługi: bufor, wątek zapisu i liczniki przyjętych/odrzuconych próbek."""
+
+    def __init__(self, spool: Spool = None, db_url=DB_URL):
+        self.spool = spool or Spool()
+        self.spool.open()
+        self.writer = IngestWriter(self.spool, db_url=db_url)
+        self._stats = {"accepted": 0, "rejected": 0, "throttled": 0, "tcp_connections": 0}
+
+    def start(self):
+        self.writer.start()
+
+    def stop(self, timeout=None):
+        self.writer.stop(timeout)
+
+    def accept(self, rows: List[str], errors: List[str]):
+        """Dopisuje poprawne próbki do bufora (SpoolFull, gdy bufor jest pełny)."""
+        self.spool.append(rows)
+        self._stats["accepted"] += len(rows)
+        self._stats["rejected"] += len(errors)
+
+    def stats(self) -> dict:
+        return {**self._stats, **self.spool.stats(), **self.writer.stats()}
+
+    async def handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        Połączenie protokołu liniowego. Przy pełnym buforze odczytane dane czekają na miejsce
+        (nie są gubione), a usługa nie czyta dalej z gniazda, więc nadawca zostaje spowolniony
+        przez kontrolę przepływu TCP. Linie dłuższe niż TCP_MAX_LINE_BYTES są odrzucane.
+        """
+        self._stats["tcp_connections"] += 1
+        remainder, skipping = b"", False
+        try:
+            while True:
+                data = await reader.read(TCP_READ_BYTES)
+                if not data:
+                    break
+                if skipping:
+                    # Dalsza część zbyt długiej linii - pomijana do najbliższego końca linii
+                    newline = data.find(b"\n")
+                    if newline < 0:
+                        continue
+                    data, skipping = data[newline + 1:], False
+                data = remainder + data
+                cut = data.rfind(b"\n") + 1
+                remainder = data[cut:]
+                if len(remainder) > TCP_MAX_LINE_BYTES:
+                    self._stats["rejected"] += 1
+                    print(f"Odrzucono linię TCP dłuższą niż {TCP_MAX_LINE_BYTES} B.")
+                    remainder, skipping = b"", True
+                if cut:
+                    await self._wait_for_room()
+                    self._accept_text(data[:cut])
+            if remainder.strip():
+                await self._wait_for_room()
+                self._accept_text(remainder)
+        except ConnectionError as e:
+            print(f"Połączenie TCP przerwane: {e}")
+        finally:
+            self._stats["tcp_connections"] -= 1
+            writer.close()
+
+    async def _wait_for_room(self):
+        # Po odczekaniu dopisanie następuje bez await, więc inne połączenia nie zapełnią
+        # bufora w międzyczasie - przekroczenie limitu to najwyżej jeden odczyt
+        while self.spool.overloaded():
+            await asyncio.sleep(0.05)
+
+    def _accept_text(self, data: bytes):
+        rows, errors = parse_lines(data.decode("utf-8", errors="replace"))
+        self.accept(rows, errors)
+        if errors:
+            print(f"Odrzucono {len(errors)} linii TCP (pierwsza: {errors[0]})")
+
+
+def create_app(service: IngestService, tcp_port=INGEST_TCP_PORT, tcp_host=INGEST_HOST):
+    """
+    Aplikacja FastAPI: POST /ingest (JSON lub text/plain z liniami CSV), GET /health.
+    Przy starcie uruchamia też serwer protokołu liniowego TCP (gdy `tcp_port` > 0).
+    """
+    from contextlib import asynccontextmanager
+
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse
+
+    @asynccontextmanager
+    async def lifespan(app):
+        service.start()
+        tcp_server = None
+        if tcp_port:
+            tcp_server = await asyncio.start_server(service.handle_tcp, tcp_host, tcp_port)
+            print(f"Protokół liniowy TCP na {tcp_host}:{tcp_port}.")
+        try:
+            yield
+        finally:
+            if tcp_server is not None:
+                tcp_server.close()
+            await asyncio.get_running_loop().run_in_executor(None, service.stop, INGEST_RETRY_MAX_S)
+
+    app = FastAPI(title="Vehicle telemetry ingestion", lifespan=lifespan)
+
+    def throttled(message):
+        service._stats["throttled"] += 1
+        return JSONResponse({"error": message}, status_code=503, headers={"Retry-After": "1"})
+
+    @app.post("/ingest")
+    async def ingest(request: Request):
+        if service.spool.overloaded():
+            return throttled("Bufor jest pełny - baza nie nadąża z zapisem. Spróbuj ponownie.")
+        body = await request.body()
+        if request.headers.get("content-type", "").startswith("application/json"):
+            try:
+                rows, errors = parse_json(json.loads(body))
+            except ValueError:
+                return JSONResponse({"error": "Nieprawidłowy JSON."}, status_code=400)
+        else:
+            rows, errors = parse_lines(body.decode("utf-8", errors="replace"))
+        try:
+            service.accept(rows, errors)
+        except SpoolFull as e:
+            return throttled(str(e))
+        status = 400 if errors and not rows else 200
+        return JSONResponse({"accepted": len(rows), "rejected": len(errors), "errors": errors[:10]},
+                            status_code=status)
+
+    @app.get("/health")
+    async def health():
+        return service.stats()
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Usługa przyjmowania telemetrii pojazdów (HTTP i TCP).")
+    parser.add_argument("--host", default=INGEST_HOST, help=f"Adres nasłuchu (domyślnie {INGEST_HOST}).")
+    parser.add_argument("--http-port", type=int, default=INGEST_HTTP_PORT,
+                        help=f"Port HTTP (domyślnie {INGEST_HTTP_PORT}).")
+    parser.add_argument("--tcp-port", type=int, default=INGEST_TCP_PORT,
+                        help=f"Port protokołu liniowego TCP, 0 wyłącza (domyślnie {INGEST_TCP_PORT}).")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    service = IngestService()
+    uvicorn.run(create_app(service, tcp_port=args.tcp_port, tcp_host=args.host), host=args.host,
+                port=args.http_port)
+
+
+if __name__ == "__main__":
+    main()
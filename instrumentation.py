@@ -0,0 +1,362 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Port endpointu metryk w formacie Prometheus (0 - wyłączony)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+# Adres endpointu /metrics (bez uwierzytelniania) - domyślnie tylko lokalnie
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Liczba ostatnich zakończonych spanów trzymanych do podglądu w panelu debugowania
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+
+# Granice kubełków histogramów
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BYTES_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+TOKENS_BUCKETS = (100, 500, 1_000, 2_000, 4_000, 8_000, 16_000, 32_000, 128_000)
+
+# Prefiks komunikatów o błędach zwracanych przez narzędzia (tools.py zwraca błędy jako tekst)
+TOOL_ERROR_PREFIX = "Błąd"
+
+
+@dataclass
+class Span:
+    """Pomiar jednego wywołania narzędzia lub modelu."""
+    name: str
+    kind: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started_at: float = field(default_factory=time.time)
+    duration_s: float = 0.0
+    db_time_s: float = 0.0
+    db_calls: int = 0
+    rows: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+    status: str = "ok"
+    error: Optional[str] = None
+
+
+class Histogram:
+    """Histogram skumulowany w stylu Prometheus (kubełki 'le', suma, liczba)."""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histogramy i liczniki z etykietami, eksportowane w formacie tekstowym Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+        self._spans = deque(maxlen=TRACE_BUFFER_SIZE)
+
+    def observe(self, name, value, buckets, help_text, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+                self._help[name] = ("histogram", help_text)
+            histogram.observe(value)
+
+    def inc(self, name, help_text, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+            self._help[name] = ("counter", help_text)
+
+    def record_span(self, span: Span):
+        """Zapisuje zakończony span: histogramy według rodzaju i bufor ostatnich spanów."""
+        if span.kind == "tool":
+            labels = {"tool": span.name}
+            self.inc("vehicle_tool_calls_total", "Wywołania narzędzi.", status=span.status, **labels)
+            self.observe("vehicle_tool_duration_seconds", span.duration_s, LATENCY_BUCKETS,
+                         "Czas wykonania narzędzia.", **labels)
+            self.observe("vehicle_tool_db_seconds", span.db_time_s, LATENCY_BUCKETS,
+                         "Czas zapytań do bazy w narzędziu.", **labels)
+            self.observe("vehicle_tool_rows", span.rows, ROWS_BUCKETS,
+                         "Liczba wierszy pobranych z bazy przez narzędzie.", **labels)
+            self.observe("vehicle_tool_input_bytes", span.bytes_in, BYTES_BUCKETS,
+                         "Rozmiar argumentów narzędzia (np. data_json).", **labels)
+            self.observe("vehicle_tool_output_bytes", span.bytes_out, BYTES_BUCKETS,
+                         "Rozmiar wyniku narzędzia.", **labels)
+        elif span.kind == "llm":
+            labels = {"model": span.name}
+            self.inc("vehicle_llm_calls_total", "Wywołania modelu językowego.", status=span.status, **labels)
+            self.observe("vehicle_llm_duration_seconds", span.duration_s, LATENCY_BUCKETS,
+                         "Czas wywołania modelu językowego.", **labels)
+            self.observe("vehicle_llm_prompt_tokens", span.tokens_in, TOKENS_BUCKETS,
+                         "Tokeny promptu.", **labels)
+            self.observe("vehicle_llm_completion_tokens", span.tokens_out, TOKENS_BUCKETS,
+                         "Tokeny odpowiedzi.", **labels)
+        with self._lock:
+            self._spans.append(span)
+        collector = _span_collector.get()
+        if collector is not None:
+            collector.append(span)
+
+    def recent_spans(self):
+        with self._lock:
+            return [asdict(span) for span in self._spans]
+
+    def summary(self) -> Dict[str, dict]:
+        """Podsumowanie ostatnich spanów według nazwy: liczba, p50/p95 czasu, średnie DB/wiersze/bajty."""
+        groups = {}
+        for span in self.recent_spans():
+            groups.setdefault((span["kind"], span["name"]), []).append(span)
+        result = {}
+        for (kind, name), spans in sorted(groups.items()):
+            durations = sorted(s["duration_s"] for s in spans)
+            count = len(spans)
+            result[name] = {
+                "kind": kind,
+                "calls": count,
+                "errors": sum(1 for s in spans if s["status"] != "ok"),
+                "p50_s": durations[int(0.5 * (count - 1))],
+                "p95_s": durations[int(0.95 * (count - 1))],
+                "avg_db_s": sum(s["db_time_s"] for s in spans) / count,
+                "avg_rows": sum(s["rows"] for s in spans) / count,
+                "avg_bytes_out": sum(s["bytes_out"] for s in spans) / count,
+                "avg_tokens_in": sum(s["tokens_in"] for s in spans) / count,
+            }
+        return result
+
+    def render_prometheus(self) -> str:
+        """Zwraca wszystkie metryki w formacie tekstowym Prometheus."""
+        def fmt_labels(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape_label(v)}"' for k, v in items) + "}"
+
+        with self._lock:
+            lines = []
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for (metric, labels), value in sorted(self._counters.items()):
+                        if metric == name:
+                            lines.append(f"{name}{fmt_labels(labels)} {value}")
+                    continue
+                for (metric, labels), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{fmt_labels(labels, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_bucket{fmt_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                    lines.append(f"{name}_sum{fmt_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{fmt_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Wspólny rejestr metryk dla procesu
+metrics = MetricsRegistry()
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+# Lista, do której trafiają spany zakończone w bieżącym kontekście (zob. collect_spans)
+_span_collector = contextvars.ContextVar("span_collector", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+@contextmanager
+def collect_spans():
+    """
+    Zbiera spany (narzędzia i modelu) zakończone wewnątrz bloku w bieżącym kontekście,
+    np. w jednej turze rozmowy, również gdy równolegle działa wiele sesji.
+    """
+    spans = []
+    token = _span_collector.set(spans)
+    try:
+        yield spans
+    finally:
+        _span_collector.reset(token)
+
+
+@contextmanager
+def db_call():
+    """
+    Mierzy zapytanie do bazy w bieżącym spanie narzędzia.
+    Liczbę pobranych wierszy ustawia się przez `call.rows` wewnątrz bloku.
+    """
+    call = _DbCall()
+    started = time.perf_counter()
+    try:
+        yield call
+    finally:
+        span = _current_span.get()
+        if span is not None:
+            span.db_time_s += time.perf_counter() - started
+            span.db_calls += 1
+            span.rows += call.rows
+
+
+class _DbCall:
+    rows = 0
+
+
+def _payload_size(value) -> int:
+    return len(value.encode("utf-8")) if isinstance(value, str) else len(str(value).encode("utf-8"))
+
+
+def traced_tool(func):
+    """
+    Dekorator funkcji narzędzia (pod @tool): każde wywołanie tworzy span z czasem,
+    czasem zapytań do bazy, liczbą wierszy oraz rozmiarem argumentów i wyniku.
+    Obsługuje też funkcje asynchroniczne (wersje narzędzi z async_tools.py).
+    """
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with _tool_span(func.__name__, args, kwargs) as span:
+                result = await func(*args, **kwargs)
+                _finish_tool_span(span, result)
+                return result
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with _tool_span(func.__name__, args, kwargs) as span:
+            result = func(*args, **kwargs)
+            _finish_tool_span(span, result)
+            return result
+    return wrapper
+
+
+@contextmanager
+def _tool_span(name, args, kwargs):
+    span = Span(name=name, kind="tool")
+    span.bytes_in = sum(_payload_size(v) for v in args) + sum(_payload_size(v) for v in kwargs.values())
+    token = _current_span.set(span)
+    started = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        span.status, span.error = "error", str(e)[:200]
+        raise
+    finally:
+        span.duration_s = time.perf_counter() - started
+        _current_span.reset(token)
+        metrics.record_span(span)
+
+
+def _finish_tool_span(span, result):
+    span.bytes_out = _payload_size(result)
+    if isinstance(result, str) and result.startswith(TOOL_ERROR_PREFIX):
+        span.status, span.error = "error", result[:200]
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Callback mierzący wywołania modelu: czas oraz tokeny promptu i odpowiedzi."""
+
+    def __init__(self):
+        self._runs = {}
+        self._lock = threading.Lock()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        from chat_memory import count_message_tokens
+
+        model = (kwargs.get("invocation_params") or {}).get("model_name") \
+            or (kwargs.get("invocation_params") or {}).get("model") \
+            or (serialized or {}).get("name", "llm")
+        span = Span(name=str(model), kind="llm")
+        span.tokens_in = sum(count_message_tokens(batch) for batch in messages)
+        with self._lock:
+            self._runs[run_id] = (span, time.perf_counter())
+
+    def _finish(self, run_id, status="ok", error=None, response=None):
+        with self._lock:
+            entry = self._runs.pop(run_id, None)
+        if entry is None:
+            return
+        span, started = entry
+        span.duration_s = time.perf_counter() - started
+        span.status, span.error = status, error
+        if response is not None:
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            if usage.get("prompt_tokens"):
+                span.tokens_in = usage["prompt_tokens"]
+            if usage.get("completion_tokens"):
+                span.tokens_out = usage["completion_tokens"]
+            else:
+                from chat_memory import count_message_tokens, count_tokens
+                for generations in response.generations:
+                    for generation in generations:
+                        message = getattr(generation, "message", None)
+                        span.tokens_out += (count_message_tokens([message]) if message is not None
+                                            else count_tokens(generation.text))
+        metrics.record_span(span)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, response=response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, status="error", error=str(error)[:200])
+
+
+# Wspólny callback dla modeli w procesie
+llm_metrics_handler = LLMMetricsHandler()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = METRICS_HOST):
+    """Uruchamia w tle endpoint HTTP /metrics (Prometheus). Zwraca serwer lub None."""
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    except OSError as e:
+        print(f"Nie udało się uruchomić endpointu metryk na {host}:{port}: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"Metryki dostępne pod http://{host}:{port}/metrics")
+    return server
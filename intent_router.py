@@ -0,0 +1,296 @@
+import json
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Optional
+
+from langchain_core.agents import AgentAction
+
+from chart_store import CHART_PATH_RE
+
+# Szybka ścieżka przed agentem (można wyłączyć zmienną środowiskową)
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1") != "0"
+
+# Dłuższe pytania zwykle wymagają rozumowania - kierujemy je do agenta
+MAX_ROUTED_QUERY_CHARS = 200
+
+# Waga nowej obserwacji w średniej kroczącej czasu odpowiedzi agenta
+AGENT_LATENCY_EMA_ALPHA = 0.2
+
+DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+VEHICLE_NUMBER_RE = re.compile(r"\bpojazd(?:u|em|zie)?[ _]?(\d+)\b", re.IGNORECASE)
+DATA_RANGE_RE = re.compile(r"od (\d{4}-\d{2}-\d{2}) do (\d{4}-\d{2}-\d{2})")
+
+# Określenia czasu, których DATE_RE nie rozumie (miesiące, dni tygodnia, pory dnia, lata,
+# pory roku) - z nimi cały zakres danych byłby błędną odpowiedzią, więc odpowiada agent
+TIME_EXPRESSION_RE = re.compile(
+    r"styczn|\blut(?:y|ego|ym)\b|\bmar(?:zec|ca|cu)\b|kwie(?:cie|tni)|\bmaj(?:a|u|em)?\b|czerw(?:iec|c)|"
+    r"\blip(?:iec|ca|cu)\b|sierp|wrze[sś]|pa[zź]dziernik|listopad|grud(?:zie|ni)|"
+    r"poniedział|\bwtor|\bśrod(?:a|ę|y|zie|ach)?\b|czwart|\bpiąt(?:ek|ku|ki|ków)\b|sobot|niedziel|weekend|"
+    r"\bran(?:o|kiem|ka|ek)\b|poran|wiecz[oó]r|południ|\bnoc|"
+    r"\bdni\b|\bdob[aęy]\b|robocz|\brok\w*|kwartał|sezon|\blat(?:o|em|a)\b|\bzim|wiosn|jesie",
+    re.IGNORECASE,
+)
+
+# Pytania, na które szybka ścieżka nie odpowie poprawnie (porównania, wyjaśnienia, wiele pojazdów)
+UNSUPPORTED_RE = re.compile(
+    r"porówn|różni|dlaczego|czemu|wszystki|każd|najwię|najmniej|najszyb|trend|maksymal|minimaln|"
+    r"godzin|tydzie|miesiąc|wczoraj|dzisiaj|ostatni",
+    re.IGNORECASE,
+)
+
+LIST_VEHICLES_RE = re.compile(r"jakie pojazdy|dostępne pojazdy|lista pojazdów|list[aę] pojazdów", re.IGNORECASE)
+DATA_RANGE_QUESTION_RE = re.compile(r"zakres (?:dat|danych)|od kiedy|jakie daty|za jaki okres", re.IGNORECASE)
+CHART_RE = re.compile(r"wykres", re.IGNORECASE)
+REPORT_RE = re.compile(r"raport|analiz", re.IGNORECASE)
+
+# Metryki z calculate_range_metrics: klucz -> (wzorzec w pytaniu, etykieta, jednostka)
+METRIC_PATTERNS = {
+    "avg_speed_kmh": (re.compile(r"średni\w* prędko|prędkoś\w* średni", re.IGNORECASE), "Średnia prędkość", "km/h"),
+    "total_distance_km": (re.compile(r"dystans|odległoś|przejecha|kilometr", re.IGNORECASE), "Całkowity dystans", "km"),
+}
+ENERGY_RE = re.compile(r"energi|zużyci", re.IGNORECASE)
+ENERGY_TYPES = [
+    ("traction_energy_per_km", re.compile(r"trakc", re.IGNORECASE), "Zużycie energii trakcyjnej"),
+    ("hvac_energy_per_km", re.compile(r"hvac|klimaty|ogrzew", re.IGNORECASE), "Zużycie energii HVAC"),
+]
+TOTAL_ENERGY = ("total_energy_per_km", "Całkowite zużycie energii")
+
+# Parametry wykresów: wzorzec w pytaniu -> kolumny danych
+CHART_PARAMETERS = [
+    (re.compile(r"prędko", re.IGNORECASE), ["speed_kmh"]),
+    (re.compile(r"trakc|\bmoc", re.IGNORECASE), ["traction_power_kw"]),
+    (re.compile(r"hvac|klimaty|ogrzew", re.IGNORECASE), ["hvac_power_kw"]),
+    (re.compile(r"dystans|odległoś", re.IGNORECASE), ["distance_km"]),
+    (re.compile(r"energi|zużyci", re.IGNORECASE), ["traction_power_kw", "hvac_power_kw"]),
+]
+
+
+@dataclass
+class RoutedAnswer:
+    """Odpowiedź szybkiej ścieżki: tekst, wykresy i wykonane kroki (do zapisu w pamięci rozmowy)."""
+    intent: str
+    answer: str
+    chart_paths: List[str] = field(default_factory=list)
+    steps: list = field(default_factory=list)
+    elapsed_s: float = 0.0
+
+
+class _Unsure(Exception):
+    """Zapytanie nie pasuje jednoznacznie do obsługiwanego wzorca - odpowiada agent."""
+
+
+class IntentRouter:
+    """
+    Odpowiada na typowe pytania bez modelu językowego.
+
+    Z pytania wyciągane są identyfikator pojazdu, daty i nazwy metryk, po czym
+    wykonywany jest bezpośrednio odpowiedni ciąg narzędzi z tools.py (lub podanych przez
+    `use_tools`, np. zdalnych z serwera MCP). Gdy pytanie nie pasuje jednoznacznie
+    (kilka pojazdów, porównanie, nieznany pojazd, brak metryki), `route` zwraca None
+    i pytanie trafia do agenta.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"queries": 0, "hits": 0, "fallbacks": 0, "errors": 0,
+                       "routed_time_s": 0.0, "saved_time_s": 0.0, "by_intent": {}}
+        self._agent_latency_s = None
+        self._tools = {}
+
+    def use_tools(self, tool_list):
+        """Ustawia narzędzia używane zamiast tych z tools.py (dopasowanie po nazwie)."""
+        self._tools = {tool.name: tool for tool in tool_list}
+
+    def _tool(self, name):
+        tool = self._tools.get(name)
+        if tool is None:
+            import tools
+            tool = getattr(tools, name)
+        return tool
+
+    def _call(self, steps, name, args):
+        """Wywołuje narzędzie i zapisuje krok jak AgentExecutor (akcja, wynik)."""
+        tool = self._tool(name)
+        observation = tool.invoke(args)
+        steps.append((AgentAction(tool=tool.name, tool_input=args, log=""), str(observation)))
+        return observation
+
+    def _vehicle(self, query, steps):
+        vehicles = self._call(steps, "get_available_vehicles", {})
+        known = {v.lower(): v for v in vehicles}
+        found = {known[f"pojazd_{n}"] for n in VEHICLE_NUMBER_RE.findall(query) if f"pojazd_{n}" in known}
+        lowered = query.lower()
+        found.update(v for key, v in known.items() if re.search(rf"\b{re.escape(key)}\b", lowered))
+        if len(found) != 1:
+            raise _Unsure()
+        return found.pop()
+
+    def _dates(self, query, vehicle_id, steps):
+        dates = DATE_RE.findall(query)
+        if len(dates) > 2:
+            raise _Unsure()
+        # Poza datami ISO i numerem pojazdu pytanie nie może zawierać innych określeń czasu
+        # (np. '10.02.2025', '10 lutego', 'w 2024 roku', 'rano')
+        residue = DATE_RE.sub(" ", query)
+        residue = VEHICLE_NUMBER_RE.sub(" ", residue)
+        residue = re.sub(rf"\b{re.escape(vehicle_id)}\b", " ", residue, flags=re.IGNORECASE)
+        if re.search(r"\d", residue) or TIME_EXPRESSION_RE.search(residue):
+            raise _Unsure()
+        if dates:
+            return min(dates), max(dates)
+        # Bez żadnego określenia czasu - cały zakres danych pojazdu
+        match = DATA_RANGE_RE.search(self._call(steps, "get_data_range", {"vehicle_id": vehicle_id}))
+        if not match:
+            raise _Unsure()
+        return match.group(1), match.group(2)
+
+    @staticmethod
+    def _period(start_date, end_date):
+        return f"w dniu {start_date}" if start_date == end_date else f"w okresie {start_date} – {end_date}"
+
+    def _answer_metrics(self, query, steps):
+        requested = [(key, label, unit) for key, (pattern, label, unit) in METRIC_PATTERNS.items()
+                     if pattern.search(query)]
+        if ENERGY_RE.search(query):
+            energy = [(key, label, "kWh/km") for key, pattern, label in ENERGY_TYPES if pattern.search(query)]
+            requested.extend(energy or [(TOTAL_ENERGY[0], TOTAL_ENERGY[1], "kWh/km")])
+        if not requested:
+            raise _Unsure()
+
+        vehicle_id = self._vehicle(query, steps)
+        start_date, end_date = self._dates(query, vehicle_id, steps)
+        output = self._call(steps, "calculate_range_metrics",
+                            {"vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date})
+        try:
+            metrics = json.loads(output)
+        except ValueError:
+            raise _Unsure()
+        period = self._period(start_date, end_date)
+        if not metrics["samples"]:
+            return f"Brak danych dla {vehicle_id} {period}."
+        lines = [f"- {label}: **{metrics[key]} {unit}**" for key, label, unit in requested]
+        return f"Wyniki dla {vehicle_id} {period}:\n" + "\n".join(lines)
+
+    def _fetch(self, vehicle_id, start_date, end_date, steps):
+        output = self._call(steps, "fetch_data_for_chart",
+                            {"vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date})
+        try:
+            summary = json.loads(output)
+        except ValueError:
+            raise _Unsure()
+        return summary["dataset"] if summary.get("rows") else None
+
+    def _answer_chart(self, query, steps, chart_paths):
+        parameters = []
+        for pattern, columns in CHART_PARAMETERS:
+            if pattern.search(query):
+                parameters.extend(c for c in columns if c not in parameters)
+        if not parameters:
+            raise _Unsure()
+
+        vehicle_id = self._vehicle(query, steps)
+        start_date, end_date = self._dates(query, vehicle_id, steps)
+        period = self._period(start_date, end_date)
+        dataset = self._fetch(vehicle_id, start_date, end_date, steps)
+        if dataset is None:
+            return f"Brak danych dla {vehicle_id} {period}."
+        if len(parameters) == 1:
+            output = self._call(steps, "generate_single_chart", {"data_json": dataset, "parameter": parameters[0]})
+        else:
+            output = self._call(steps, "generate_multi_chart", {"data_json": dataset, "parameters": parameters})
+        paths = CHART_PATH_RE.findall(str(output))
+        if not paths:
+            raise _Unsure()
+        chart_paths.extend(paths)
+        return f"Wykres dla {vehicle_id} {period}:"
+
+    def _answer_report(self, query, steps):
+        from rollups import FETCH_RAW_MAX_DAYS
+
+        vehicle_id = self._vehicle(query, steps)
+        start_date, end_date = self._dates(query, vehicle_id, steps)
+        days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+        if days > FETCH_RAW_MAX_DAYS:
+            # Dłuższe zakresy fetch_data_for_chart zwraca z agregatów - raport strumieniowy jest dokładny
+            return self._call(steps, "generate_range_report",
+                              {"vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date})
+        dataset = self._fetch(vehicle_id, start_date, end_date, steps)
+        if dataset is None:
+            return f"Brak danych dla {vehicle_id} {self._period(start_date, end_date)}."
+        return self._call(steps, "format_analysis_report", {
+            "vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date, "data_json": dataset,
+        })
+
+    def _dispatch(self, query, steps, chart_paths):
+        if LIST_VEHICLES_RE.search(query) and not VEHICLE_NUMBER_RE.search(query):
+            vehicles = self._call(steps, "get_available_vehicles", {})
+            return "list_vehicles", f"Dostępne pojazdy: {', '.join(vehicles)}."
+        if CHART_RE.search(query):
+            return "chart", self._answer_chart(query, steps, chart_paths)
+        if REPORT_RE.search(query):
+            return "report", self._answer_report(query, steps)
+        if DATA_RANGE_QUESTION_RE.search(query):
+            vehicle_id = self._vehicle(query, steps)
+            return "data_range", self._call(steps, "get_data_range", {"vehicle_id": vehicle_id})
+        return "metrics", self._answer_metrics(query, steps)
+
+    def route(self, query: str) -> Optional[RoutedAnswer]:
+        """
+        Próbuje odpowiedzieć na pytanie bez agenta.
+
+        :param query: Pytanie użytkownika.
+        :return: RoutedAnswer lub None, gdy pytanie powinno trafić do agenta.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._stats["queries"] += 1
+
+        steps, chart_paths = [], []
+        try:
+            if len(query) > MAX_ROUTED_QUERY_CHARS or UNSUPPORTED_RE.search(query):
+                raise _Unsure()
+            intent, answer = self._dispatch(query, steps, chart_paths)
+        except _Unsure:
+            with self._lock:
+                self._stats["fallbacks"] += 1
+            return None
+        except Exception as e:
+            print(f"Błąd szybkiej ścieżki, pytanie trafia do agenta: {e}")
+            with self._lock:
+                self._stats["errors"] += 1
+                self._stats["fallbacks"] += 1
+            return None
+
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._stats["hits"] += 1
+            self._stats["routed_time_s"] += elapsed
+            self._stats["by_intent"][intent] = self._stats["by_intent"].get(intent, 0) + 1
+            if self._agent_latency_s is not None:
+                self._stats["saved_time_s"] += max(self._agent_latency_s - elapsed, 0.0)
+        return RoutedAnswer(intent=intent, answer=answer, chart_paths=chart_paths, steps=steps, elapsed_s=elapsed)
+
+    def record_agent_latency(self, seconds: float):
+        """Zapisuje czas odpowiedzi agenta - podstawa szacowania zaoszczędzonego czasu."""
+        with self._lock:
+            if self._agent_latency_s is None:
+                self._agent_latency_s = seconds
+            else:
+                self._agent_latency_s += AGENT_LATENCY_EMA_ALPHA * (seconds - self._agent_latency_s)
+
+    def stats(self):
+        """Zwraca metryki: trafienia, odsetek trafień, średni czas szybkiej ścieżki i zaoszczędzony czas."""
+        with self._lock:
+            stats = dict(self._stats, by_intent=dict(self._stats["by_intent"]))
+            stats["agent_latency_s"] = self._agent_latency_s
+        stats["hit_rate"] = stats["hits"] / stats["queries"] if stats["queries"] else 0.0
+        stats["avg_routed_time_s"] = stats["routed_time_s"] / stats["hits"] if stats["hits"] else 0.0
+        return stats
+
+
+# Wspólny router dla procesu
+router = IntentRouter()
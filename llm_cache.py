@@ -0,0 +1,335 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.runnables import RunnableBinding
+from langchain_core.runnables.config import run_in_executor
+
+# Konfiguracja pamięci podręcznej odpowiedzi modelu (można nadpisać zmiennymi środowiskowymi)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/tmp/vehicle_llm_cache.sqlite")
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", "100"))
+LLM_CACHE_MAX_AGE_S = float(os.getenv("LLM_CACHE_MAX_AGE_S", "86400"))
+
+# Jak długo (w sekundach) używać odczytanej wersji danych przed ponownym zapytaniem bazy
+DATA_VERSION_TTL_S = float(os.getenv("DATA_VERSION_TTL_S", "5"))
+
+# Co ile zapisów sprawdzać limity wieku i rozmiaru
+EVICT_EVERY_WRITES = 50
+
+# Wersja danych: najwyższe id w vehicle_data rośnie przy każdym nowym pomiarze
+DATA_VERSION_QUERY = "SELECT COALESCE(MAX(id), 0) FROM vehicle_data;"
+
+CREATE_CACHE_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    namespace TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used_idx ON responses (last_used_at);
+"""
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizuje tekst do klucza: pojedyncze spacje, bez końcowej interpunkcji. Wielkość liter
+    zostaje - vehicle_id w bazie ją rozróżnia ('Pojazd_1' i 'pojazd_1' to różne pojazdy).
+    """
+    return _WHITESPACE_RE.sub(" ", text).strip().rstrip("?!.").strip()
+
+
+_data_version = {"value": None, "read_at": 0.0}
+_data_version_lock = threading.Lock()
+
+
+def data_version() -> Optional[int]:
+    """
+    Zwraca znacznik wersji danych telemetrycznych (MAX(id) z vehicle_data), odczytywany
+    z bazy nie częściej niż co DATA_VERSION_TTL_S sekund. None, gdy baza jest niedostępna -
+    wtedy odpowiedzi nie są ani odczytywane, ani zapisywane.
+    """
+    with _data_version_lock:
+        if time.monotonic() - _data_version["read_at"] < DATA_VERSION_TTL_S:
+            return _data_version["value"]
+    try:
+        from db_pool import get_pool
+        with get_pool().connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(DATA_VERSION_QUERY)
+                value = int(cur.fetchone()[0])
+    except Exception as e:
+        print(f"Błąd podczas odczytu wersji danych: {e}")
+        value = None
+    with _data_version_lock:
+        _data_version.update(value=value, read_at=time.monotonic())
+    return value
+
+
+def _record_to_chunk(record: dict) -> ChatGenerationChunk:
+    """Zamienia zapisaną odpowiedź na jeden fragment strumienia (tekst i wywołania narzędzi)."""
+    return ChatGenerationChunk(message=AIMessageChunk(
+        content=record["content"],
+        tool_call_chunks=[
+            {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+            for i, call in enumerate(record["tool_calls"])
+        ],
+    ))
+
+
+def _message_to_record(message: BaseMessage) -> dict:
+    return {
+        "content": message.content,
+        "tool_calls": [
+            {"name": call["name"], "args": call["args"], "id": call["id"]}
+            for call in getattr(message, "tool_calls", None) or []
+        ],
+    }
+
+
+class ResponseCache:
+    """
+    Trwała pamięć podręczna odpowiedzi w SQLite.
+
+    Przechowuje odpowiedzi modelu (przestrzeń 'llm') i końcowe odpowiedzi agenta
+    ('answer'). Klucz to skrót z przestrzeni, znormalizowanej treści, modelu i wersji
+    danych - po dopisaniu nowych pomiarów stare wpisy przestają być trafiane i są
+    usuwane po czasie `max_age_s` lub jako najdawniej używane ponad limit rozmiaru.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=int(LLM_CACHE_MAX_MB * 1024 * 1024),
+                 max_age_s=LLM_CACHE_MAX_AGE_S, version_source=data_version):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.version_source = version_source
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes = 0
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "bypassed": 0}
+
+    def _connection(self):
+        if self._conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL;")
+            self._conn.executescript(CREATE_CACHE_TABLE_QUERY)
+        return self._conn
+
+    def make_key(self, namespace: str, *parts) -> Optional[str]:
+        """Zwraca klucz wpisu lub None, gdy wersja danych jest nieznana (pamięć jest wtedy pomijana)."""
+        version = self.version_source()
+        if version is None:
+            with self._lock:
+                self._stats["bypassed"] += 1
+            return None
+        payload = json.dumps([namespace, version, *parts], sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: Optional[str]):
+        """Zwraca zapisaną wartość (obiekt JSON) lub None."""
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?;", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.max_age_s:
+                self._stats["misses"] += 1
+                return None
+            conn.execute("UPDATE responses SET last_used_at = ? WHERE key = ?;", (now, key))
+            self._stats["hits"] += 1
+        return json.loads(row[0])
+
+    def put(self, key: Optional[str], namespace: str, value):
+        """Zapisuje wartość (serializowalną do JSON) pod kluczem."""
+        if key is None:
+            return
+        text = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO responses (key, namespace, value, size, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?);",
+                (key, namespace, text, len(key) + len(text.encode("utf-8")), now, now),
+            )
+            self._stats["writes"] += 1
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY_WRITES == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Usuwa wpisy starsze niż `max_age_s`, a potem najdawniej używane ponad limit rozmiaru."""
+        with self._lock:
+            conn = self._connection()
+            removed = conn.execute(
+                "DELETE FROM responses WHERE created_at < ?;", (time.time() - self.max_age_s,)
+            ).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses;").fetchone()[0]
+            if total > self.max_bytes:
+                # Usuwamy najstarsze wpisy, aż zajętość spadnie poniżej limitu
+                cutoff = conn.execute(
+                    "SELECT last_used_at FROM (SELECT last_used_at, SUM(size) OVER (ORDER BY last_used_at DESC) "
+                    "AS newer_size FROM responses) WHERE newer_size > ? ORDER BY last_used_at DESC LIMIT 1;",
+                    (self.max_bytes,),
+                ).fetchone()
+                if cutoff is not None:
+                    removed += conn.execute(
+                        "DELETE FROM responses WHERE last_used_at <= ?;", (cutoff[0],)
+                    ).rowcount
+            self._stats["evictions"] += removed
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._connection().execute("DELETE FROM responses;")
+
+    def stats(self):
+        """Zwraca metryki: trafienia, chybienia, zapisy, usunięcia, liczba i rozmiar wpisów."""
+        with self._lock:
+            stats = dict(self._stats)
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses;"
+            ).fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(entries=entries, bytes=size, hit_rate=stats["hits"] / lookups if lookups else 0.0)
+        return stats
+
+    # Końcowe odpowiedzi agenta
+
+    def get_answer(self, question: str, model: str, history: str = ""):
+        """Zwraca zapisaną odpowiedź agenta ({'output', 'chart_paths'}) na pytanie przy tej samej historii."""
+        key = self.make_key("answer", normalize_text(question), model, history)
+        return self.get(key)
+
+    def put_answer(self, question: str, model: str, answer: dict, history: str = ""):
+        key = self.make_key("answer", normalize_text(question), model, history)
+        self.put(key, "answer", answer)
+
+
+class CachedChatModel(BaseChatModel):
+    """
+    Model czatu z pamięcią podręczną odpowiedzi.
+
+    Opakowuje dowolny model (ChatOpenAI lub model testowy) i przed wywołaniem
+    sprawdza ResponseCache. Wbudowana pamięć LangChain nie działa z AgentExecutor,
+    który zawsze wywołuje `stream` - tutaj obsługiwane są oba tryby, a przy trafieniu
+    zapisana odpowiedź (tekst i wywołania narzędzi) jest zwracana jako jeden fragment.
+    Narzędzia przekazane przez `bind_tools` są częścią klucza. Wersje asynchroniczne
+    (`ainvoke`, `astream`) wywołują asynchroniczne metody opakowanego modelu, a odczyt
+    i zapis pamięci wykonują w puli wątków.
+    """
+
+    model: BaseChatModel
+    response_cache: Any
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    @property
+    def _llm_type(self) -> str:
+        return f"cached-{self.model._llm_type}"
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.model, "model_name", self.model._llm_type)
+
+    def bind_tools(self, tools, **kwargs):
+        # Formatowanie narzędzi zgodne z opakowanym modelem, wywołanie przez to opakowanie
+        binding = self.model.bind_tools(tools, **kwargs)
+        if not isinstance(binding, RunnableBinding):
+            return self
+        return RunnableBinding(bound=self, kwargs=binding.kwargs, config=binding.config)
+
+    def _key(self, messages: List[BaseMessage], stop, kwargs) -> Optional[str]:
+        prompt = []
+        for message in messages:
+            record = _message_to_record(message)
+            if isinstance(record["content"], str):
+                record["content"] = normalize_text(record["content"])
+            prompt.append({"type": message.type, **record})
+        return self.response_cache.make_key("llm", prompt, self.model._get_llm_string(stop=stop, **kwargs))
+
+    def _lookup(self, messages, stop, kwargs):
+        key = self._key(messages, stop, kwargs)
+        return key, self.response_cache.get(key)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key, cached = self._lookup(messages, stop, kwargs)
+        if cached is not None:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(**cached))])
+        result = self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        self.response_cache.put(key, "llm", _message_to_record(result.generations[0].message))
+        return result
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        key, cached = self._lookup(messages, stop, kwargs)
+        if cached is not None:
+            yield _record_to_chunk(cached)
+            return
+
+        if type(self.model)._stream == BaseChatModel._stream:
+            # Model bez strumieniowania (np. testowy) - cała odpowiedź jako jeden fragment
+            result = self.model._generate(messages, stop=stop, **kwargs)
+            record = _message_to_record(result.generations[0].message)
+            self.response_cache.put(key, "llm", record)
+            yield _record_to_chunk(record)
+            return
+
+        # Tokeny przekazuje do callbacków BaseChatModel.stream - bez run_manager nie są dublowane
+        generation = None
+        for chunk in self.model._stream(messages, stop=stop, **kwargs):
+            generation = chunk if generation is None else generation + chunk
+            yield chunk
+        if generation is not None:
+            self.response_cache.put(key, "llm", _message_to_record(generation.message))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        key, cached = await run_in_executor(None, self._lookup, messages, stop, kwargs)
+        if cached is not None:
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(**cached))])
+        result = await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        await run_in_executor(None, self.response_cache.put, key, "llm",
+                              _message_to_record(result.generations[0].message))
+        return result
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        key, cached = await run_in_executor(None, self._lookup, messages, stop, kwargs)
+        if cached is not None:
+            yield _record_to_chunk(cached)
+            return
+
+        model_type = type(self.model)
+        if model_type._astream == BaseChatModel._astream and model_type._stream == BaseChatModel._stream:
+            result = await self.model._agenerate(messages, stop=stop, **kwargs)
+            record = _message_to_record(result.generations[0].message)
+            await run_in_executor(None, self.response_cache.put, key, "llm", record)
+            yield _record_to_chunk(record)
+            return
+
+        generation = None
+        async for chunk in self.model._astream(messages, stop=stop, **kwargs):
+            generation = chunk if generation is None else generation + chunk
+            yield chunk
+        if generation is not None:
+            await run_in_executor(None, self.response_cache.put, key, "llm", _message_to_record(generation.message))
+
+
+# Wspólna pamięć odpowiedzi dla procesu
+response_cache = ResponseCache()
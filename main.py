@@ -9,6 +9,11 @@ from langchain.agents import AgentExecutor, create_tool_calling_agent # Wracamy
 
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage
+from llm_cache import LLM_CACHE_ENABLED, CachedChatModel, response_cache
+from instrumentation import llm_metrics_handler, start_metrics_server
+from async_runtime import ASYNC_AGENT, invoke
+from async_tools import with_async
+from mcp_client import MCP_SERVER_URL, remote_tools
 from tools import (
     get_available_vehicles,
     fetch_data_for_chart,
@@ -18,7 +23,13 @@ from tools import (
     calculate_traction_energy_per_km,
     calculate_hvac_energy_per_km,
     calculate_total_energy_per_km,
+    calculate_range_metrics,
+    compare_vehicles,
+    calculate_average_speed_in_range,
+    calculate_total_distance_in_range,
+    calculate_energy_per_km_in_range,
     format_analysis_report,
+    generate_range_report,
     generate_single_chart,
     generate_multi_chart
 )
@@ -26,13 +37,10 @@ from tools import (
 # Wczytanie zmiennych środowiskowych
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-if not OPENAI_API_KEY or OPENAI_API_KEY == "TWOJ_KLUCZ_API_GPT":
-    print("BŁĄD: Uzupełnij klucz OPENAI_API_KEY w pliku .env!")
-    exit()
+LLM_MODEL = "gpt-4.1-mini"
 
 # 1. Definicja narzędzi (Tools)
-tools = [
+TOOLS = [
     get_available_vehicles,
     fetch_data_for_chart,
     get_data_range,
@@ -41,50 +49,81 @@ tools = [
     calculate_traction_energy_per_km,
     calculate_hvac_energy_per_km,
     calculate_total_energy_per_km,
+    calculate_range_metrics,
+    compare_vehicles,
+    calculate_average_speed_in_range,
+    calculate_total_distance_in_range,
+    calculate_energy_per_km_in_range,
     format_analysis_report,
+    generate_range_report,
     generate_single_chart,
     generate_multi_chart
 ]
 
-# 2. Inicjalizacja modelu LLM
-# Używamy modelu zdolnego do wywoływania narzędzi (tool calling)
-llm = ChatOpenAI(model="gpt-4.1-mini", temperature=0, api_key=OPENAI_API_KEY)
-
-# 3. Definicja promptu systemowego
-system_prompt = """
+# 2. Definicja promptu systemowego
+SYSTEM_PROMPT = """
 Jesteś zaawansowanym asystentem do analizy danych telemetrycznych pojazdów. 
 Twoim zadaniem jest odpowiadanie na pytania użytkownika dotyczące prędkości, 
 dystansu i zużycia energii pojazdów w określonych zakresach dat.
 
 **Zasady działania (MUSISZ ich przestrzegać):**
 1. Zawsze zaczynaj od użycia `get_available_vehicles` i `get_data_range` (jeśli nie znasz zakresu dat).
-2. Aby wykonać analizę lub wygenerować wykres, MUSISZ najpierw użyć `fetch_data_for_chart` z poprawnym `vehicle_id`, `start_date` i `end_date`.
-3. Wynik z `fetch_data_for_chart` (string JSON z danymi) przekaż jako argument `data_json` do kolejnych narzędzi.
-4. **NIGDY** nie zwracaj surowego JSON-a z danymi do użytkownika. Użyj go tylko jako wejścia do innych narzędzi.
+2. Jeśli użytkownik pyta tylko o liczby (średnia prędkość, dystans, zużycie energii), użyj `calculate_range_metrics` lub `calculate_*_in_range` - liczą wynik w bazie bez pobierania danych.
+   Aby wygenerować raport lub wykres, MUSISZ najpierw użyć `fetch_data_for_chart` z poprawnym `vehicle_id`, `start_date` i `end_date`.
+   Pytania o porównanie wielu pojazdów lub całej floty obsłuż jednym wywołaniem `compare_vehicles` (lista pojazdów lub ['all']).
+3. `fetch_data_for_chart` zwraca uchwyt zbioru danych (pole `dataset`, np. `ds_1a2b3c4d5e6f`) i krótkie podsumowanie. Przekaż sam uchwyt jako argument `data_json` do kolejnych narzędzi.
+4. **NIGDY** nie zwracaj uchwytu ani surowych danych do użytkownika. Używaj ich tylko jako wejścia do innych narzędzi.
 5. Jeśli użytkownik prosi o analizę, użyj narzędzi obliczeniowych, a następnie `format_analysis_report`, aby podsumować wyniki.
+   Raport z długiego okresu (np. kilka miesięcy lub rok) bez wykresu wygeneruj od razu przez `generate_range_report` - nie wymaga `fetch_data_for_chart`.
 6. Jeśli użytkownik prosi o wykres, użyj `generate_single_chart` lub `generate_multi_chart`. 
    **MUSISZ ZAWSZE ZWRÓCIĆ CAŁY WYNIK Z TEGO NARZĘDZIA (JSON PLOTLY) BEZ ŻADNYCH DODATKOWYCH KOMENTARZY** 
    lub sformatuj go w specjalny blok kodu.
 7. Zawsze podawaj daty w formacie 'YYYY-MM-DD'.
 """
 
-prompt = ChatPromptTemplate.from_messages(
-    [
-        ("system", system_prompt),
-        MessagesPlaceholder(variable_name="chat_history", optional=True),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ]
-)
+def build_llm(api_key=OPENAI_API_KEY):
+    """
+    Tworzy model LLM zdolny do wywoływania narzędzi (tool calling). Odpowiedzi są
+    zapisywane w trwałej pamięci podręcznej (llm_cache.py), a czas i tokeny w metrykach.
+    """
+    llm = ChatOpenAI(model=LLM_MODEL, temperature=0, api_key=api_key, callbacks=[llm_metrics_handler])
+    if LLM_CACHE_ENABLED:
+        llm = CachedChatModel(model=llm, response_cache=response_cache, callbacks=[llm_metrics_handler])
+    return llm
 
-# 4. Tworzenie agenta
-agent = create_tool_calling_agent(llm, tools, prompt)
+def build_agent_executor(llm, tools=TOOLS, memory=None, verbose=True):
+    """
+    Składa agenta (prompt systemowy + narzędzia) i AgentExecutor dla podanego modelu.
+    Z `memory` (np. chat_memory.BudgetedConversationMemory) executor zwraca też kroki
+    pośrednie, z których pamięć zapisuje skróty wyników narzędzi.
 
-# 5. Tworzenie Agent Executor
-agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=True)
+    Przy ASYNC_AGENT narzędzia dostają wersje asynchroniczne (async_tools.py) - turę
+    wykonuje wtedy async_runtime.invoke, a niezależne wywołania narzędzi idą równolegle.
+    """
+    if ASYNC_AGENT:
+        tools = with_async(tools)
+    prompt = ChatPromptTemplate.from_messages(
+        [
+            ("system", SYSTEM_PROMPT),
+            MessagesPlaceholder(variable_name="chat_history", optional=True),
+            ("human", "{input}"),
+            MessagesPlaceholder(variable_name="agent_scratchpad"),
+        ]
+    )
+    agent = create_tool_calling_agent(llm, tools, prompt)
+    return AgentExecutor(agent=agent, tools=tools, memory=memory, verbose=verbose,
+                         return_intermediate_steps=memory is not None)
 
 def run_chatbot():
     """Główna pętla interakcji z użytkownikiem."""
+    if not OPENAI_API_KEY or OPENAI_API_KEY == "TWOJ_KLUCZ_API_GPT":
+        print("BŁĄD: Uzupełnij klucz OPENAI_API_KEY w pliku .env!")
+        return
+
+    # Z MCP_SERVER_URL narzędzia wykonuje serwer MCP (wspólny dla wszystkich frontendów)
+    tools = remote_tools(MCP_SERVER_URL, [tool.name for tool in TOOLS]) if MCP_SERVER_URL else TOOLS
+    agent_executor = build_agent_executor(build_llm(), tools=tools)
+    start_metrics_server()
     print("--- Chatbot do Analizy Danych Pojazdów ---")
     print("Wpisz 'exit' lub 'quit' aby zakończyć.")
     
@@ -93,7 +132,7 @@ def run_chatbot():
     print(f"\nChatbot: {initial_query}")
     
     try:
-        response = agent_executor.invoke({"input": initial_query})
+        response = invoke(agent_executor, {"input": initial_query})
         print(f"Odpowiedź: {response['output']}")
     except Exception as e:
         print(f"Wystąpił błąd podczas inicjalizacji: {e}")
@@ -107,7 +146,7 @@ def run_chatbot():
         
         try:
             # Uruchomienie agenta z zapytaniem użytkownika
-            response = agent_executor.invoke({"input": user_input})
+            response = invoke(agent_executor, {"input": user_input})
             
             # Jeśli agent zwrócił JSON wykresu, informujemy o tym użytkownika
             if "chart" in response['output'].lower() and "json" in response['output'].lower():
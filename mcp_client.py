@@ -0,0 +1,184 @@
+import itertools
+import os
+import threading
+from typing import Any, Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.pydantic_v1 import Field, create_model
+from langchain_core.tools import StructuredTool
+
+# Klient serwera narzędzi MCP (mcp_server.py) przez HTTP. Narzędzia z serwera są
+# zwracane jako StructuredTool o tych samych nazwach, opisach i argumentach co w
+# tools.py, więc agent (main.py, app.py) nie rozróżnia narzędzi lokalnych i zdalnych.
+
+# Wczytanie zmiennych środowiskowych
+load_dotenv()
+# Adres serwera narzędzi; puste - narzędzia wykonywane w procesie frontendu
+MCP_SERVER_URL = os.getenv("MCP_SERVER_URL", "")
+MCP_CLIENT_TIMEOUT_S = float(os.getenv("MCP_CLIENT_TIMEOUT_S", "300"))
+# Połączenia HTTP do serwera utrzymywane między wywołaniami (wspólne dla procesu)
+MCP_CLIENT_MAX_CONNECTIONS = int(os.getenv("MCP_CLIENT_MAX_CONNECTIONS", "20"))
+
+PROTOCOL_VERSION = "2025-06-18"
+CLIENT_INFO = {"name": "vehicle-chatbot", "version": "1.0.0"}
+
+# Typy JSON Schema argumentów -> typy pól modelu argumentów
+_JSON_TYPES = {"string": str, "integer": int, "number": float, "boolean": bool, "object": dict}
+
+
+class McpError(Exception):
+    """Błąd protokołu zwrócony przez serwer (obiekt 'error' odpowiedzi JSON-RPC)."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"{message} (kod {code})")
+        self.code = code
+
+
+class McpClient:
+    """
+    Klient JSON-RPC serwera MCP z pulą połączeń keep-alive. Wersja synchroniczna
+    (`call_tool`) korzysta z httpx.Client, asynchroniczna (`acall_tool`) - z klienta
+    httpx.AsyncClient żyjącego we wspólnej pętli async_runtime.
+    """
+
+    def __init__(self, url: str, timeout_s: float = MCP_CLIENT_TIMEOUT_S,
+                 max_connections: int = MCP_CLIENT_MAX_CONNECTIONS):
+        url = url.rstrip("/")
+        self.endpoint = url if url.endswith("/mcp") else f"{url}/mcp"
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._timeout_s = timeout_s
+        self._client = httpx.Client(timeout=timeout_s, limits=self._limits)
+        self._async_client = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.server_info = None
+
+    def _message(self, method: str, params: Optional[dict]) -> dict:
+        return {"jsonrpc": "2.0", "id": next(self._ids), "method": method, "params": params or {}}
+
+    @staticmethod
+    def _result(response: httpx.Response):
+        response.raise_for_status()
+        body = response.json()
+        if "error" in body:
+            raise McpError(body["error"].get("code", 0), body["error"].get("message", ""))
+        return body["result"]
+
+    def _ensure_initialized(self):
+        if self.server_info is not None:
+            return
+        with self._lock:
+            if self.server_info is None:
+                result = self._result(self._client.post(self.endpoint, json=self._message("initialize", {
+                    "protocolVersion": PROTOCOL_VERSION, "capabilities": {}, "clientInfo": CLIENT_INFO,
+                })))
+                self._client.post(self.endpoint, json={"jsonrpc": "2.0", "method": "notifications/initialized"})
+                self.server_info = result.get("serverInfo", {})
+
+    def request(self, method: str, params: Optional[dict] = None):
+        """Wysyła żądanie JSON-RPC i zwraca pole 'result' odpowiedzi."""
+        self._ensure_initialized()
+        return self._result(self._client.post(self.endpoint, json=self._message(method, params)))
+
+    async def arequest(self, method: str, params: Optional[dict] = None):
+        """Wersja asynchroniczna `request` (wykonywana we wspólnej pętli async_runtime)."""
+        from async_runtime import on_runtime, to_worker
+
+        if self.server_info is None:
+            await to_worker(self._ensure_initialized)
+        return await on_runtime(self._apost(self._message(method, params)))
+
+    async def _apost(self, message: dict):
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(timeout=self._timeout_s, limits=self._limits)
+        return self._result(await self._async_client.post(self.endpoint, json=message))
+
+    def list_tools(self) -> List[Dict[str, Any]]:
+        """Opisy narzędzi serwera (name, description, inputSchema)."""
+        return self.request("tools/list")["tools"]
+
+    def call_tool(self, name: str, arguments: Dict[str, Any]):
+        """Wywołuje narzędzie na serwerze i zwraca jego wynik (napis, lista lub liczba jak w tools.py)."""
+        return _tool_output(self.request("tools/call", {"name": name, "arguments": arguments}))
+
+    async def acall_tool(self, name: str, arguments: Dict[str, Any]):
+        """Wersja asynchroniczna `call_tool`."""
+        return _tool_output(await self.arequest("tools/call", {"name": name, "arguments": arguments}))
+
+
+def _tool_output(result: dict):
+    structured = result.get("structuredContent")
+    if isinstance(structured, dict) and "result" in structured:
+        return structured["result"]
+    return "".join(item.get("text", "") for item in result.get("content", []) if item.get("type") == "text")
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(url: str = MCP_SERVER_URL) -> McpClient:
+    """Zwraca klienta dla adresu `url` (jeden na proces - wspólna pula połączeń HTTP)."""
+    with _clients_lock:
+        if url not in _clients:
+            _clients[url] = McpClient(url)
+        return _clients[url]
+
+
+def _json_type(schema: dict):
+    if schema.get("type") == "array":
+        return List[_json_type(schema.get("items") or {})]
+    return _JSON_TYPES.get(schema.get("type"), Any)
+
+
+def _args_model(name: str, schema: dict):
+    """Model argumentów narzędzia (pydantic) zbudowany z jego inputSchema."""
+    required = set(schema.get("required", []))
+    fields = {
+        key: (_json_type(prop), Field(... if key in required else prop.get("default"),
+                                      description=prop.get("description")))
+        for key, prop in schema.get("properties", {}).items()
+    }
+    return create_model(f"{name}_schema", **fields)
+
+
+def _remote_tool(client: McpClient, spec: Dict[str, Any]) -> StructuredTool:
+    name = spec["name"]
+
+    def call(**kwargs):
+        try:
+            return client.call_tool(name, kwargs)
+        except (McpError, httpx.HTTPError) as e:
+            return f"Błąd serwera narzędzi ({name}): {e}"
+
+    async def acall(**kwargs):
+        try:
+            return await client.acall_tool(name, kwargs)
+        except (McpError, httpx.HTTPError) as e:
+            return f"Błąd serwera narzędzi ({name}): {e}"
+
+    return StructuredTool(name=name, description=spec.get("description", ""),
+                          args_schema=_args_model(name, spec.get("inputSchema") or {}),
+                          func=call, coroutine=acall)
+
+
+def remote_tools(url: str = MCP_SERVER_URL, names: Optional[List[str]] = None) -> List[StructuredTool]:
+    """
+    Zwraca narzędzia serwera MCP jako StructuredTool (wszystkie lub `names`, w tej kolejności).
+    Wywołania idą do serwera, więc zbiory danych, wykresy i połączenia z bazą są wspólne
+    dla wszystkich frontendów.
+
+    :param url: Adres serwera (np. http://localhost:8000).
+    :param names: Nazwy narzędzi do pobrania; brak - wszystkie narzędzia serwera.
+    """
+    client = get_client(url)
+    try:
+        available = {spec["name"]: spec for spec in client.list_tools()}
+    except httpx.HTTPError as e:
+        raise ConnectionError(f"Serwer narzędzi {url} jest niedostępny: {e}") from e
+    names = list(available) if names is None else names
+    missing = [name for name in names if name not in available]
+    if missing:
+        raise ValueError(f"Serwer narzędzi {url} nie udostępnia: {', '.join(missing)}.")
+    return [_remote_tool(client, available[name]) for name in names]
@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from dotenv import load_dotenv
+from langchain_core.pydantic_v1 import ValidationError
+
+import tools
+from async_tools import with_async
+from instrumentation import TOOL_ERROR_PREFIX, start_metrics_server
+
+# Serwer narzędzi z tools.py w protokole MCP (JSON-RPC 2.0): HTTP (POST /mcp) lub stdio.
+# Jeden proces serwera obsługuje wszystkie frontendy (main.py, app.py), więc rejestr
+# zbiorów danych, katalog pojazdów, magazyn wykresów i pule połączeń z bazą są wspólne -
+# kolejne instancje interfejsu nie zwiększają obciążenia bazy.
+
+# Wczytanie zmiennych środowiskowych
+load_dotenv()
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+# Maks. liczba jednocześnie wykonywanych narzędzi; kolejne wywołania czekają w kolejce
+MCP_MAX_CONCURRENCY = int(os.getenv("MCP_MAX_CONCURRENCY", "16"))
+# Maks. czas oczekiwania w kolejce - potem serwer odpowiada błędem "zajęty" (klient może ponowić)
+MCP_QUEUE_TIMEOUT_S = float(os.getenv("MCP_QUEUE_TIMEOUT_S", "30"))
+# Maks. czas wykonania jednego narzędzia
+MCP_TOOL_TIMEOUT_S = float(os.getenv("MCP_TOOL_TIMEOUT_S", "300"))
+
+# Obsługiwane wersje protokołu MCP (pierwsza - preferowana)
+PROTOCOL_VERSIONS = ("2025-06-18", "2025-03-26", "2024-11-05")
+SERVER_INFO = {"name": "vehicle-telemetry-tools", "version": "1.0.0"}
+
+# Kody błędów JSON-RPC
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_BUSY = -32000
+
+# Narzędzia udostępniane przez serwer
+SERVER_TOOLS = [
+    tools.get_available_vehicles,
+    tools.get_data_range,
+    tools.fetch_data_for_chart,
+    tools.calculate_average_speed,
+    tools.calculate_total_distance,
+    tools.calculate_traction_energy_per_km,
+    tools.calculate_hvac_energy_per_km,
+    tools.calculate_total_energy_per_km,
+    tools.calculate_range_metrics,
+    tools.compare_vehicles,
+    tools.calculate_average_speed_in_range,
+    tools.calculate_total_distance_in_range,
+    tools.calculate_energy_per_km_in_range,
+    tools.format_analysis_report,
+    tools.generate_range_report,
+    tools.generate_single_chart,
+    tools.generate_multi_chart,
+]
+
+
+class JsonRpcError(Exception):
+    """Błąd protokołu zwracany klientowi jako obiekt 'error' odpowiedzi JSON-RPC."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def _error(request_id, code: int, message: str) -> dict:
+    return {"jsonrpc": "2.0", "id": request_id, "error": {"code": code, "message": message}}
+
+
+def _tool_result(result) -> dict:
+    """
+    Wynik tools/call: tekst (napis lub JSON) oraz - dla wyników innych niż napis -
+    `structuredContent`, z którego klient odtwarza oryginalny typ (lista, liczba).
+    Komunikaty błędów narzędzi (zaczynające się od "Błąd") mają `isError`.
+    """
+    if isinstance(result, str):
+        return {"content": [{"type": "text", "text": result}], "isError": result.startswith(TOOL_ERROR_PREFIX)}
+    return {
+        "content": [{"type": "text", "text": json.dumps(result, ensure_ascii=False)}],
+        "structuredContent": {"result": result},
+        "isError": False,
+    }
+
+
+class McpServer:
+    """
+    Obsługa wiadomości MCP (initialize, ping, tools/list, tools/call) niezależna od
+    transportu. Narzędzia wykonują się w wersjach asynchronicznych (async_tools.py):
+    zapytania przez pulę asyncpg, obliczenia w puli wątków TOOL_WORKERS. Liczbę
+    jednoczesnych wywołań ogranicza `max_concurrency`; wywołanie czekające dłużej niż
+    `queue_timeout_s` dostaje błąd SERVER_BUSY zamiast dokładać pracy przeciążonej bazie.
+    """
+
+    def __init__(self, tool_list=SERVER_TOOLS, max_concurrency=MCP_MAX_CONCURRENCY,
+                 queue_timeout_s=MCP_QUEUE_TIMEOUT_S, tool_timeout_s=MCP_TOOL_TIMEOUT_S):
+        self.tools = {tool.name: tool for tool in with_async(tool_list)}
+        self.max_concurrency = max_concurrency
+        self.queue_timeout_s = queue_timeout_s
+        self.tool_timeout_s = tool_timeout_s
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._descriptions = [
+            {"name": tool.name, "description": tool.description, "inputSchema": self._input_schema(tool)}
+            for tool in self.tools.values()
+        ]
+        self._methods = {
+            "initialize": self._initialize,
+            "ping": self._ping,
+            "tools/list": self._list_tools,
+            "tools/call": self._call_tool,
+        }
+        # Liczniki zmieniane tylko w pętli zdarzeń serwera (bez blokady)
+        self._stats = {"calls": 0, "tool_errors": 0, "rejected": 0, "timeouts": 0, "in_flight": 0, "queued": 0}
+
+    @staticmethod
+    def _input_schema(tool) -> dict:
+        schema = tool.args_schema.schema()
+        return {"type": "object", "properties": schema.get("properties", {}), "required": schema.get("required", [])}
+
+    async def handle(self, message):
+        """
+        Obsługuje wiadomość JSON-RPC lub paczkę wiadomości (listę, wykonywaną równolegle).
+        Zwraca odpowiedź (lub listę odpowiedzi), albo None, gdy były to same powiadomienia.
+        """
+        if isinstance(message, list):
+            if not message:
+                return _error(None, INVALID_REQUEST, "Pusta paczka żądań.")
+            responses = await asyncio.gather(*(self._handle_one(item) for item in message))
+            return [response for response in responses if response is not None] or None
+        return await self._handle_one(message)
+
+    async def _handle_one(self, message):
+        if not isinstance(message, dict) or message.get("jsonrpc") != "2.0" \
+                or not isinstance(message.get("method"), str):
+            request_id = message.get("id") if isinstance(message, dict) else None
+            return _error(request_id, INVALID_REQUEST, "Nieprawidłowe żądanie JSON-RPC.")
+
+        method = message["method"]
+        notification = "id" not in message
+        if method.startswith("notifications/"):
+            # Powiadomienia klienta (initialized, cancelled) nie wymagają odpowiedzi
+            return None
+        try:
+            handler = self._methods.get(method)
+            if handler is None:
+                raise JsonRpcError(METHOD_NOT_FOUND, f"Nieznana metoda: {method}")
+            params = message.get("params") or {}
+            if not isinstance(params, dict):
+                raise JsonRpcError(INVALID_PARAMS, "Parametry muszą być obiektem.")
+            result = await handler(params)
+        except JsonRpcError as e:
+            return None if notification else _error(message.get("id"), e.code, e.message)
+        except Exception as e:
+            return None if notification else _error(message.get("id"), INTERNAL_ERROR, f"Błąd serwera: {e}")
+        return None if notification else {"jsonrpc": "2.0", "id": message["id"], "result": result}
+
+    async def _initialize(self, params):
+        requested = params.get("protocolVersion")
+        return {
+            "protocolVersion": requested if requested in PROTOCOL_VERSIONS else PROTOCOL_VERSIONS[0],
+            "capabilities": {"tools": {"listChanged": False}},
+            "serverInfo": SERVER_INFO,
+        }
+
+    async def _ping(self, params):
+        return {}
+
+    async def _list_tools(self, params):
+        return {"tools": self._descriptions}
+
+    async def _call_tool(self, params):
+        name = params.get("name")
+        arguments = params.get("arguments") or {}
+        tool = self.tools.get(name)
+        if tool is None:
+            raise JsonRpcError(INVALID_PARAMS, f"Nieznane narzędzie: {name}")
+        if not isinstance(arguments, dict):
+            raise JsonRpcError(INVALID_PARAMS, "Argumenty narzędzia muszą być obiektem.")
+        try:
+            tool.args_schema(**arguments)
+        except ValidationError as e:
+            raise JsonRpcError(INVALID_PARAMS, f"Nieprawidłowe argumenty narzędzia {name}: {e}")
+
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            self._stats["rejected"] += 1
+            raise JsonRpcError(SERVER_BUSY, f"Serwer narzędzi jest zajęty ({self.max_concurrency} wywołań w toku) "
+                                            f"- spróbuj ponownie.")
+        finally:
+            self._stats["queued"] -= 1
+
+        self._stats["calls"] += 1
+        self._stats["in_flight"] += 1
+        # Miejsce zwalnia dopiero zakończenie zadania - po przekroczeniu czasu klient dostaje
+        # odpowiedź od razu, ale anulowana praca (zapytanie, wątek obliczeń) nadal się liczy
+        task = asyncio.ensure_future(tool.ainvoke(arguments))
+        task.add_done_callback(self._release_slot)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.tool_timeout_s)
+        except asyncio.TimeoutError:
+            task.cancel()
+            self._stats["timeouts"] += 1
+            result = f"Błąd: narzędzie {name} nie zakończyło się w {self.tool_timeout_s:.0f} s."
+        except asyncio.CancelledError:
+            # Klient się rozłączył
+            task.cancel()
+            raise
+        response = _tool_result(result)
+        if response["isError"]:
+            self._stats["tool_errors"] += 1
+        return response
+
+    def _release_slot(self, task):
+        self._stats["in_flight"] -= 1
+        self._slots.release()
+        if not task.cancelled():
+            # Odczyt wyjątku zadania, na którego wynik nikt już nie czeka (bez ostrzeżenia w logu)
+            task.exception()
+
+    def stats(self) -> dict:
+        """Liczniki wywołań oraz stan wspólnych pul i pamięci podręcznych procesu serwera."""
+        from async_runtime import db_pool_stats
+        from chart_store import store as chart_store
+        from db_pool import pool_stats
+
+        return {
+            **self._stats,
+            "max_concurrency": self.max_concurrency,
+            "db_pool": pool_stats(),
+            "async_db_pool": db_pool_stats(),
+            "charts": chart_store.stats(),
+        }
+
+
+def create_app(server: McpServer = None):
+    """
+    Aplikacja FastAPI z transportem HTTP: żądania JSON-RPC przez POST /mcp (odpowiedź
+    JSON, samym powiadomieniom - 202) oraz GET /health ze stanem serwera.
+    """
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, Response
+
+    server = server or McpServer()
+    app = FastAPI(title="Vehicle telemetry MCP server")
+
+    @app.post("/mcp")
+    async def mcp(request: Request):
+        try:
+            message = json.loads(await request.body())
+        except ValueError:
+            return JSONResponse(_error(None, PARSE_ERROR, "Nieprawidłowy JSON."), status_code=400)
+        response = await server.handle(message)
+        if response is None:
+            return Response(status_code=202)
+        return JSONResponse(response)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "ok", **server.stats()}
+
+    return app
+
+
+async def serve_stdio(server: McpServer, output=None):
+    """
+    Transport stdio: jedna wiadomość JSON-RPC na linię na stdin, odpowiedzi na `output`
+    (domyślnie stdout). Żądania są obsługiwane równolegle, odpowiedzi - w kolejności zakończenia.
+    """
+    output = output or sys.stdout.buffer
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=16 * 1024 * 1024)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async def answer(line):
+        try:
+            response = await server.handle(json.loads(line))
+        except ValueError:
+            response = _error(None, PARSE_ERROR, "Nieprawidłowy JSON.")
+        if response is not None:
+            output.write((json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8"))
+            output.flush()
+
+    pending = set()
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        if line.strip():
+            task = asyncio.ensure_future(answer(line))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    if pending:
+        await asyncio.gather(*pending)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serwer narzędzi MCP dla danych telemetrycznych pojazdów.")
+    parser.add_argument("--stdio", action="store_true", help="Transport stdio zamiast HTTP.")
+    parser.add_argument("--host", default=MCP_HOST, help=f"Adres HTTP (domyślnie {MCP_HOST}).")
+    parser.add_argument("--port", type=int, default=MCP_PORT, help=f"Port HTTP (domyślnie {MCP_PORT}).")
+    args = parser.parse_args()
+
+    start_metrics_server()
+    if args.stdio:
+        # stdout należy do protokołu - komunikaty narzędzi (print) trafiają na stderr
+        output = sys.stdout.buffer
+        sys.stdout = sys.stderr
+        asyncio.run(serve_stdio(McpServer(), output))
+    else:
+        import uvicorn
+
+        # Jeden proces (bez --workers): pamięci podręczne i pule są wspólne dla wszystkich klientów
+        uvicorn.run(create_app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
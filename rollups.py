@@ -0,0 +1,325 @@
+import os
+import time
+from datetime import datetime
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Wczytanie zmiennych środowiskowych
+load_dotenv()
+DB_URL = os.getenv("DATABASE_URL")
+
+# Rozdzielczości agregatów: nazwa -> (tabela, jednostka date_trunc)
+ROLLUP_TABLES = {
+    "hour": ("vehicle_data_hourly", "hour"),
+    "day": ("vehicle_data_daily", "day"),
+}
+
+# Zakresy (w dniach), do których fetch_data_for_chart w trybie 'auto' zwraca
+# odpowiednio surowe pomiary i agregaty godzinowe; dłuższe zakresy - dzienne.
+FETCH_RAW_MAX_DAYS = int(os.getenv("FETCH_RAW_MAX_DAYS", "7"))
+FETCH_HOURLY_MAX_DAYS = int(os.getenv("FETCH_HOURLY_MAX_DAYS", "92"))
+# Maks. liczba wierszy czekających na odświeżenie, dla których sprawdzamy zakres czasu;
+# przy większych zaległościach (np. agregaty nigdy nie liczone) zapytania idą do surowych danych
+ROLLUP_PENDING_MAX_ROWS = int(os.getenv("ROLLUP_PENDING_MAX_ROWS", "2000000"))
+
+# Agregaty są addytywne (sumy, liczniki, min/max), więc dopisanie nowych danych
+# to scalenie z istniejącym wierszem kubełka. Całki energii przechowujemy jako
+# sumy mocy: energia [kWh] = suma mocy [kW] * SAMPLE_INTERVAL_H.
+CREATE_ROLLUP_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS {table} (
+    vehicle_id VARCHAR(50) NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    sample_count BIGINT NOT NULL,
+    speed_count BIGINT NOT NULL,
+    speed_sum DOUBLE PRECISION,
+    speed_min DOUBLE PRECISION,
+    speed_max DOUBLE PRECISION,
+    distance_sum DOUBLE PRECISION,
+    traction_power_sum DOUBLE PRECISION,
+    traction_power_min DOUBLE PRECISION,
+    traction_power_max DOUBLE PRECISION,
+    hvac_power_sum DOUBLE PRECISION,
+    hvac_power_min DOUBLE PRECISION,
+    hvac_power_max DOUBLE PRECISION,
+    total_power_sum DOUBLE PRECISION,
+    PRIMARY KEY (vehicle_id, bucket)
+);
+"""
+
+# Próg przyrostowego odświeżania: najwyższe id z vehicle_data ujęte w agregatach
+CREATE_ROLLUP_STATE_QUERY = """
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name VARCHAR(50) PRIMARY KEY,
+    high_water_id BIGINT NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL
+);
+INSERT INTO rollup_state (name, high_water_id, refreshed_at)
+VALUES ('vehicle_data', 0, now())
+ON CONFLICT (name) DO NOTHING;
+"""
+
+# Agregaty godzinowe nowych wierszy (id w przedziale (od, do]) - jeden skan surowych danych
+DELTA_QUERY = """
+CREATE TEMP TABLE rollup_delta ON COMMIT DROP AS
+SELECT vehicle_id,
+       date_trunc('hour', timestamp) AS bucket,
+       COUNT(*) AS sample_count,
+       COUNT(speed_kmh) AS speed_count,
+       SUM(speed_kmh)::float8 AS speed_sum,
+       MIN(speed_kmh)::float8 AS speed_min,
+       MAX(speed_kmh)::float8 AS speed_max,
+       SUM(distance_km)::float8 AS distance_sum,
+       SUM(traction_power_kw)::float8 AS traction_power_sum,
+       MIN(traction_power_kw)::float8 AS traction_power_min,
+       MAX(traction_power_kw)::float8 AS traction_power_max,
+       SUM(hvac_power_kw)::float8 AS hvac_power_sum,
+       MIN(hvac_power_kw)::float8 AS hvac_power_min,
+       MAX(hvac_power_kw)::float8 AS hvac_power_max,
+       SUM(traction_power_kw + hvac_power_kw)::float8 AS total_power_sum
+FROM vehicle_data
+WHERE id > %s AND id <= %s
+GROUP BY vehicle_id, date_trunc('hour', timestamp);
+"""
+
+MERGE_DELTA_QUERY = """
+INSERT INTO {table} AS t
+SELECT vehicle_id,
+       date_trunc('{unit}', bucket) AS bucket,
+       SUM(sample_count), SUM(speed_count),
+       SUM(speed_sum), MIN(speed_min), MAX(speed_max),
+       SUM(distance_sum),
+       SUM(traction_power_sum), MIN(traction_power_min), MAX(traction_power_max),
+       SUM(hvac_power_sum), MIN(hvac_power_min), MAX(hvac_power_max),
+       SUM(total_power_sum)
+FROM rollup_delta
+GROUP BY vehicle_id, date_trunc('{unit}', bucket)
+ON CONFLICT (vehicle_id, bucket) DO UPDATE SET
+    sample_count = t.sample_count + EXCLUDED.sample_count,
+    speed_count = t.speed_count + EXCLUDED.speed_count,
+    speed_sum = COALESCE(t.speed_sum, 0) + COALESCE(EXCLUDED.speed_sum, 0),
+    speed_min = LEAST(t.speed_min, EXCLUDED.speed_min),
+    speed_max = GREATEST(t.speed_max, EXCLUDED.speed_max),
+    distance_sum = COALESCE(t.distance_sum, 0) + COALESCE(EXCLUDED.distance_sum, 0),
+    traction_power_sum = COALESCE(t.traction_power_sum, 0) + COALESCE(EXCLUDED.traction_power_sum, 0),
+    traction_power_min = LEAST(t.traction_power_min, EXCLUDED.traction_power_min),
+    traction_power_max = GREATEST(t.traction_power_max, EXCLUDED.traction_power_max),
+    hvac_power_sum = COALESCE(t.hvac_power_sum, 0) + COALESCE(EXCLUDED.hvac_power_sum, 0),
+    hvac_power_min = LEAST(t.hvac_power_min, EXCLUDED.hvac_power_min),
+    hvac_power_max = GREATEST(t.hvac_power_max, EXCLUDED.hvac_power_max),
+    total_power_sum = COALESCE(t.total_power_sum, 0) + COALESCE(EXCLUDED.total_power_sum, 0);
+"""
+
+ROLLUP_PROGRESS_QUERY = """
+SELECT (SELECT high_water_id FROM rollup_state WHERE name = 'vehicle_data'),
+       (SELECT COALESCE(MAX(id), 0) FROM vehicle_data);
+"""
+
+# Najwcześniejszy pomiar pojazdów spośród wierszy jeszcze nieujętych w agregatach. Próg jest
+# wstawiany w tekst zapytania (liczba całkowita), aby planista znał go i użył indeksu po id
+# (skan samego ogona) zamiast planu ogólnego dla parametru.
+PENDING_FROM_QUERY = """
+SELECT MIN(timestamp) FROM vehicle_data
+WHERE id > {high_water_id} AND vehicle_id = ANY(%s);
+"""
+
+# Metryki zakresu dat z agregatów dziennych (te same wielkości co AGGREGATE_METRICS_QUERY w tools.py)
+ROLLUP_METRICS_QUERY = """
+SELECT COALESCE(SUM(sample_count), 0) AS samples,
+       SUM(speed_sum) / NULLIF(SUM(speed_count), 0) AS avg_speed_kmh,
+       SUM(distance_sum) AS total_distance_km,
+       SUM(traction_power_sum) AS traction_power_sum,
+       SUM(hvac_power_sum) AS hvac_power_sum,
+       SUM(total_power_sum) AS total_power_sum
+FROM vehicle_data_daily
+WHERE vehicle_id = %s AND bucket >= %s AND bucket < %s;
+"""
+
+# Te same metryki dla wielu pojazdów naraz (compare_vehicles w tools.py)
+ROLLUP_FLEET_METRICS_QUERY = """
+SELECT vehicle_id,
+       SUM(sample_count) AS samples,
+       SUM(speed_sum) / NULLIF(SUM(speed_count), 0) AS avg_speed_kmh,
+       SUM(distance_sum) AS total_distance_km,
+       SUM(traction_power_sum) AS traction_power_sum,
+       SUM(hvac_power_sum) AS hvac_power_sum,
+       SUM(total_power_sum) AS total_power_sum
+FROM vehicle_data_daily
+WHERE vehicle_id = ANY(%s) AND bucket >= %s AND bucket < %s
+GROUP BY vehicle_id;
+"""
+
+# Szereg czasowy z agregatów w układzie kolumn fetch_data_for_chart: wartości mocy to
+# średnie na pomiar (suma / liczba pomiarów), więc suma(moc * sample_count) daje dokładną energię.
+ROLLUP_SERIES_QUERY = """
+SELECT bucket AS timestamp,
+       speed_sum / NULLIF(speed_count, 0) AS speed_kmh,
+       traction_power_sum / sample_count AS traction_power_kw,
+       hvac_power_sum / sample_count AS hvac_power_kw,
+       distance_sum AS distance_km,
+       sample_count,
+       speed_count,
+       speed_min AS speed_min_kmh,
+       speed_max AS speed_max_kmh
+FROM {table}
+WHERE vehicle_id = %s AND bucket >= %s AND bucket < %s
+ORDER BY bucket;
+"""
+
+
+def create_rollup_tables(conn):
+    """Tworzy tabele agregatów i stan odświeżania, jeśli nie istnieją."""
+    with conn.cursor() as cur:
+        for table, _ in ROLLUP_TABLES.values():
+            cur.execute(CREATE_ROLLUP_TABLE_QUERY.format(table=table))
+        cur.execute(CREATE_ROLLUP_STATE_QUERY)
+    conn.commit()
+
+
+def refresh_rollups(conn):
+    """
+    Przyrostowo odświeża agregaty godzinowe i dzienne od zapisanego progu id.
+
+    Nowe wiersze vehicle_data (id powyżej progu) są agregowane jednym skanem do
+    kubełków godzinowych, a następnie scalane z tabelami agregatów. Blokada wiersza
+    w rollup_state serializuje równoległe odświeżania. Zakłada, że dane są tylko
+    dopisywane (bez UPDATE/DELETE) - po zmianie historii użyj `rebuild_rollups`.
+
+    Id z sekwencji są nadawane przy zapisie, a nie przy zatwierdzeniu - transakcja
+    ładująca (np. równoległy bulk_load lub ingest_service.py) może zatwierdzić niższe id
+    już po odczycie MAX(id). Dlatego próg jest czytany pod blokadą SHARE tabeli
+    vehicle_data: czeka ona na zatwierdzenie trwających zapisów (każdy INSERT/COPY trzyma
+    ROW EXCLUSIVE do końca transakcji) i wstrzymuje nowe do końca odświeżania.
+
+    :return: Liczba nowych wierszy ujętych w agregatach.
+    """
+    started = time.perf_counter()
+    create_rollup_tables(conn)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT high_water_id FROM rollup_state WHERE name = 'vehicle_data' FOR UPDATE;")
+            low = cur.fetchone()[0]
+            cur.execute("LOCK TABLE vehicle_data IN SHARE MODE;")
+            cur.execute("SELECT COALESCE(MAX(id), 0) FROM vehicle_data;")
+            high = cur.fetchone()[0]
+            if high <= low:
+                conn.rollback()
+                return 0
+
+            cur.execute(DELTA_QUERY, (low, high))
+            cur.execute("SELECT COALESCE(SUM(sample_count), 0) FROM rollup_delta;")
+            new_rows = int(cur.fetchone()[0])
+            for table, unit in ROLLUP_TABLES.values():
+                cur.execute(MERGE_DELTA_QUERY.format(table=table, unit=unit))
+            cur.execute(
+                "UPDATE rollup_state SET high_water_id = %s, refreshed_at = now() WHERE name = 'vehicle_data';",
+                (high,),
+            )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"Błąd podczas odświeżania agregatów: {e}")
+        raise
+
+    print(f"Odświeżono agregaty: {new_rows} nowych rekordów w {time.perf_counter() - started:.2f} s.")
+    return new_rows
+
+
+def rebuild_rollups(conn):
+    """Przelicza agregaty od zera (np. po usunięciu lub poprawieniu danych)."""
+    create_rollup_tables(conn)
+    with conn.cursor() as cur:
+        for table, _ in ROLLUP_TABLES.values():
+            cur.execute(f"TRUNCATE {table};")
+        cur.execute("UPDATE rollup_state SET high_water_id = 0 WHERE name = 'vehicle_data';")
+    conn.commit()
+    return refresh_rollups(conn)
+
+
+def pending_check(high_water_id, max_id):
+    """
+    Ocena aktualności z samych progów: True - agregaty obejmują wszystkie wiersze, False -
+    brak agregatów lub zbyt duże zaległości, None - trzeba sprawdzić PENDING_FROM_QUERY.
+    """
+    if high_water_id is None:
+        return False
+    if high_water_id >= max_id:
+        return True
+    if max_id - high_water_id > ROLLUP_PENDING_MAX_ROWS:
+        return False
+    return None
+
+
+def range_covered(pending_from, range_end):
+    """
+    Czy zakres kończący się na `range_end` (wyłącznie) leży przed najwcześniejszym
+    nieujętym pomiarem `pending_from` (None - brak takich pomiarów).
+    """
+    if pending_from is None:
+        return True
+    if isinstance(range_end, str):
+        range_end = datetime.strptime(range_end, "%Y-%m-%d")
+    return range_end <= pending_from
+
+
+def rollups_fresh(conn, vehicle_ids, range_end):
+    """
+    Sprawdza, czy agregaty obejmują wszystkie wiersze pojazdów `vehicle_ids` przed `range_end`.
+    Przy ciągłym napływie danych zawsze są wiersze dopisane po ostatnim odświeżeniu, ale
+    zwykle są to najnowsze pomiary - zakresy kończące się przed nimi liczymy z agregatów.
+    Spóźnione pomiary (ze starszym czasem) wyłączają agregaty tylko dla obejmujących je zakresów.
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(ROLLUP_PROGRESS_QUERY)
+            high_water_id, max_id = cur.fetchone()
+            fresh = pending_check(high_water_id, max_id)
+            if fresh is not None:
+                return fresh
+            cur.execute(PENDING_FROM_QUERY.format(high_water_id=int(high_water_id)), (list(vehicle_ids),))
+            return range_covered(cur.fetchone()[0], range_end)
+    except psycopg2.Error:
+        # Brak tabel agregatów - zapytania idą do surowych danych
+        conn.rollback()
+        return False
+
+
+def choose_resolution(range_start, range_end, fresh):
+    """
+    Wybiera najgrubszą rozdzielczość dla szeregu czasowego w zakresie [range_start, range_end).
+    Krótkie zakresy zostają surowe; przy nieaktualnych agregatach zawsze 'raw'.
+    """
+    if not fresh:
+        return "raw"
+    days = (datetime.strptime(range_end, "%Y-%m-%d") - datetime.strptime(range_start, "%Y-%m-%d")).days
+    if days <= FETCH_RAW_MAX_DAYS:
+        return "raw"
+    if days <= FETCH_HOURLY_MAX_DAYS:
+        return "hour"
+    return "day"
+
+
+def series_query(resolution):
+    """Zwraca zapytanie o szereg czasowy z tabeli agregatów danej rozdzielczości."""
+    table, _ = ROLLUP_TABLES[resolution]
+    return ROLLUP_SERIES_QUERY.format(table=table)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Odświeża agregaty godzinowe/dzienne vehicle_data.")
+    parser.add_argument("--rebuild", action="store_true", help="Przelicz agregaty od zera.")
+    args = parser.parse_args()
+
+    if not DB_URL:
+        print("Błąd: Zmienna środowiskowa DATABASE_URL nie jest ustawiona.")
+    else:
+        conn = psycopg2.connect(DB_URL)
+        try:
+            if args.rebuild:
+                rebuild_rollups(conn)
+            else:
+                refresh_rollups(conn)
+        finally:
+            conn.close()
@@ -0,0 +1,60 @@
+import os
+import uuid
+
+import pandas as pd
+import psycopg2.extensions
+
+# Liczba wierszy w jednej paczce przy strumieniowym czytaniu dużych zakresów
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", "100000"))
+# Typ kolumn liczbowych w paczkach: float32 (połowa pamięci, ok. 7 cyfr znaczących) lub float64
+STREAM_FLOAT_DTYPE = os.getenv("STREAM_FLOAT_DTYPE", "float32")
+
+# Surowe pomiary pojazdu w zakresie czasu, w kolejności indeksu (vehicle_id, timestamp)
+RAW_SERIES_QUERY = """
+SELECT timestamp, speed_kmh, traction_power_kw, hvac_power_kw, distance_km
+FROM vehicle_data
+WHERE vehicle_id = %s AND timestamp >= %s AND timestamp < %s
+ORDER BY timestamp;
+"""
+
+# NUMERIC jako float zamiast Decimal - rejestrowane tylko na kursorze strumienia
+_NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values, "NUMERIC_AS_FLOAT",
+    lambda value, cur: float(value) if value is not None else None,
+)
+
+
+def compact_frame(rows, columns, float_dtype=STREAM_FLOAT_DTYPE) -> pd.DataFrame:
+    """
+    Buduje DataFrame paczki w zwartych typach: liczby jako `float_dtype`, timestamp
+    jako datetime64[ns], a vehicle_id jako kategoria (jedna kopia napisu na pojazd).
+    """
+    df = pd.DataFrame.from_records(rows, columns=columns)
+    for name in columns:
+        if name == "timestamp":
+            df[name] = pd.to_datetime(df[name])
+        elif name == "vehicle_id":
+            df[name] = df[name].astype("category")
+        else:
+            df[name] = df[name].astype(float_dtype)
+    return df
+
+
+def iter_frames(conn, query: str, params=None, chunk_rows=STREAM_CHUNK_ROWS, float_dtype=STREAM_FLOAT_DTYPE):
+    """
+    Wykonuje zapytanie kursorem po stronie serwera (nazwanym) i zwraca kolejne paczki
+    po co najwyżej `chunk_rows` wierszy jako DataFrame w zwartych typach. W pamięci
+    jest naraz tylko jedna paczka, niezależnie od długości zakresu.
+
+    Połączenie musi być w trybie transakcyjnym (domyślnym w puli), bo kursor
+    nazwany istnieje tylko do końca transakcji.
+    """
+    with conn.cursor(name=f"stream_{uuid.uuid4().hex[:12]}") as cur:
+        psycopg2.extensions.register_type(_NUMERIC_AS_FLOAT, cur)
+        cur.itersize = chunk_rows
+        cur.execute(query, params)
+        while True:
+            rows = cur.fetchmany(chunk_rows)
+            if not rows:
+                return
+            yield compact_frame(rows, [column[0] for column in cur.description], float_dtype)
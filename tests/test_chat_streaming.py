@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+import pytest
+
+import async_runtime
+from chat_streaming import ScriptThreadCallbacks
+
+
+class RerunException(Exception):
+    """Jak wyjątek Streamlit zgłaszany z st.* przy ponownym uruchomieniu skryptu."""
+
+
+class RerunningHandler:
+    def on_llm_new_token(self, token, **kwargs):
+        raise RerunException()
+
+
+def test_handler_exception_cancels_agent_turn():
+    cancelled = threading.Event()
+    callbacks = ScriptThreadCallbacks(RerunningHandler())
+
+    async def turn():
+        callbacks.on_llm_new_token("Wynik")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    future = async_runtime.submit(turn())
+    with pytest.raises(RerunException):
+        callbacks.pump(future)
+
+    assert future.cancelled()
+    assert cancelled.wait(5)
@@ -0,0 +1,235 @@
+import asyncio
+import os
+import time
+
+import psycopg2
+import pytest
+
+import ingest_service
+from ingest_service import (LOADED_SEGMENTS_QUERY, SPOOL_HEADER, IngestService, IngestWriter, Spool, SpoolFull,
+                            format_sample)
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        if query == LOADED_SEGMENTS_QUERY:
+            self._result = [(name,) for name in params[0] if name in self.db.ingest_log]
+
+    def fetchall(self):
+        return self._result
+
+
+class FakeDatabase:
+    """Połączenie zastępujące psycopg2: dziennik ingest_log i załadowane wiersze w pamięci."""
+
+    def __init__(self):
+        self.ingest_log = {}
+        self.rows = []
+        self.loads = 0
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def fake_bulk_load(conn, frame, chunk_rows, update_rollups, on_chunk, verbose):
+    # Mikropaczki z pojazdem 'BAD' baza odrzuca jak błędne dane
+    if (frame["vehicle_id"] == "BAD").any():
+        raise psycopg2.DataError("nieprawidłowe dane")
+    with conn.cursor() as cur:
+        on_chunk(cur, frame)
+    conn.loads += 1
+    conn.rows.extend(frame["vehicle_id"])
+    return len(frame)
+
+
+def fake_execute_values(cur, query, rows):
+    cur.db.ingest_log.update(rows)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(ingest_service, "bulk_load", fake_bulk_load)
+    monkeypatch.setattr(ingest_service, "execute_values", fake_execute_values)
+    monkeypatch.setattr(ingest_service, "refresh_rollups", lambda conn: 0)
+    return FakeDatabase()
+
+
+def _spool(directory, **kwargs):
+    return Spool(str(directory), **{"batch_rows": 1000, "flush_interval_s": 60, "max_bytes": 10 ** 9, **kwargs})
+
+
+def _open_spool(directory, **kwargs):
+    spool = _spool(directory, **kwargs)
+    spool.open()
+    return spool
+
+
+def _rows(vehicle_id, count):
+    return [format_sample(vehicle_id, 1893456000 + i, 40, 15, 2.5, 0.011) for i in range(count)]
+
+
+def _segment(spool, vehicle_id, count):
+    spool.append(_rows(vehicle_id, count))
+    spool.seal_if_due(force=True)
+    return spool.take(10 ** 6)[-1][0]
+
+
+def _writer(spool, db):
+    writer = IngestWriter(spool, db_url="postgresql://unused", rollup_interval_s=0)
+    writer._conn = db
+    return writer
+
+
+def _drain(writer, timeout=10):
+    writer.start()
+    deadline = time.monotonic() + timeout
+    while writer.spool.stats()["pending_segments"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    writer.stop(timeout)
+
+
+def test_open_truncates_part_file_to_last_full_line(tmp_path):
+    rows = _rows("Pojazd_1", 2)
+    (tmp_path / "seg-1.part").write_text(SPOOL_HEADER + "\n".join(rows) + "\nPojazd_1,2030-01-01 00:0")
+    (tmp_path / "seg-2.part").write_text(SPOOL_HEADER + "Pojazd_1,2030")
+
+    spool = _open_spool(tmp_path)
+
+    assert not (tmp_path / "seg-1.part").exists()
+    assert (tmp_path / "seg-1.csv").read_text() == SPOOL_HEADER + "\n".join(rows) + "\n"
+    assert not (tmp_path / "seg-2.part").exists() and not (tmp_path / "seg-2.csv").exists()
+    assert spool.take(10 ** 6) == [(str(tmp_path / "seg-1.csv"), 2)]
+
+
+def test_segment_already_in_ingest_log_is_not_loaded_again(tmp_path, db):
+    spool = _open_spool(tmp_path)
+    path = _segment(spool, "Pojazd_1", 3)
+    # Awaria po COMMIT, a przed usunięciem pliku - nazwa jest już w ingest_log
+    db.ingest_log[os.path.basename(path)] = 3
+    writer = _writer(spool, db)
+
+    writer._load(spool.take(10 ** 6))
+
+    assert db.loads == 0 and db.rows == []
+    assert not os.path.exists(path)
+    assert writer.stats()["duplicate_segments"] == 1
+
+
+def test_loaded_segments_are_logged_and_removed(tmp_path, db):
+    spool = _open_spool(tmp_path)
+    paths = [_segment(spool, "Pojazd_1", 3), _segment(spool, "Pojazd_2", 2)]
+    writer = _writer(spool, db)
+
+    writer._load(spool.take(10 ** 6))
+
+    assert db.loads == 1 and len(db.rows) == 5
+    assert db.ingest_log == {os.path.basename(paths[0]): 3, os.path.basename(paths[1]): 2}
+    assert not any(os.path.exists(path) for path in paths)
+    assert spool.stats()["pending_bytes"] == 0
+
+
+def test_bad_segment_is_isolated_into_failed_directory(tmp_path, db):
+    spool = _open_spool(tmp_path)
+    good_1 = _segment(spool, "Pojazd_1", 3)
+    bad = _segment(spool, "BAD", 2)
+    good_2 = _segment(spool, "Pojazd_2", 4)
+    writer = _writer(spool, db)
+
+    _drain(writer)
+
+    assert sorted(db.rows) == ["Pojazd_1"] * 3 + ["Pojazd_2"] * 4
+    assert set(db.ingest_log) == {os.path.basename(good_1), os.path.basename(good_2)}
+    assert os.listdir(tmp_path / "failed") == [os.path.basename(bad)]
+    assert writer.stats()["failed_segments"] == 1
+    assert spool.stats()["pending_segments"] == 0
+
+
+def test_full_spool_rejects_append_until_drained(tmp_path):
+    spool = _open_spool(tmp_path, max_bytes=200)
+    _segment(spool, "Pojazd_1", 5)
+
+    assert spool.overloaded()
+    with pytest.raises(SpoolFull):
+        spool.append(_rows("Pojazd_1", 1))
+
+    spool.done(path for path, _ in spool.take(10 ** 6))
+    assert not spool.overloaded()
+    spool.append(_rows("Pojazd_1", 1))
+
+
+class _Writer:
+    def close(self):
+        pass
+
+
+def test_tcp_waits_for_room_without_dropping_data(tmp_path):
+    spool = _spool(tmp_path, max_bytes=400)
+    service = IngestService(spool, db_url=None)
+
+    async def scenario():
+        reader = asyncio.StreamReader()
+        task = asyncio.create_task(service.handle_tcp(reader, _Writer()))
+        await asyncio.sleep(0.05)
+        # Bufor zapełnia się (np. przez inne połączenia), gdy to połączenie czeka na dane
+        _segment(spool, "Pojazd_1", 10)
+        reader.feed_data(("\n".join(_rows("Pojazd_2", 3)) + "\n").encode())
+        reader.feed_data(_rows("Pojazd_2", 1)[0].encode())
+        reader.feed_eof()
+        await asyncio.sleep(0.2)
+        accepted_while_full = service.stats()["accepted"]
+        spool.done(path for path, _ in spool.take(10 ** 6))
+        await asyncio.wait_for(task, 5)
+        return accepted_while_full
+
+    assert asyncio.run(scenario()) == 0
+    assert service.stats()["accepted"] == 4
+    assert service.stats()["tcp_connections"] == 0
+
+
+def test_tcp_rejects_overlong_line(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_service, "TCP_MAX_LINE_BYTES", 100)
+    monkeypatch.setattr(ingest_service, "TCP_READ_BYTES", 64)
+    service = IngestService(_spool(tmp_path), db_url=None)
+
+    async def scenario():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"x" * 300 + b"\n" + ("\n".join(_rows("Pojazd_1", 2)) + "\n").encode())
+        reader.feed_eof()
+        await service.handle_tcp(reader, _Writer())
+
+    asyncio.run(scenario())
+    assert service.stats()["accepted"] == 2
+    assert service.stats()["rejected"] == 1
+
+
+def test_http_returns_503_when_spool_is_full(tmp_path):
+    from fastapi.testclient import TestClient
+
+    spool = _spool(tmp_path, max_bytes=200)
+    client = TestClient(ingest_service.create_app(IngestService(spool, db_url=None), tcp_port=0))
+    _segment(spool, "Pojazd_1", 5)
+
+    response = client.post("/ingest", content=_rows("Pojazd_2", 1)[0], headers={"content-type": "text/plain"})
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+from intent_router import IntentRouter
+
+
+class StubTool:
+    """Narzędzie o nazwie i interfejsie `invoke` jak StructuredTool - zapisuje wywołania."""
+
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+        self.calls = []
+
+    def invoke(self, args):
+        self.calls.append(args)
+        return self.func(**args)
+
+
+def _metrics(vehicle_id, start_date, end_date):
+    return json.dumps({"samples": 100, "avg_speed_kmh": 42.0, "total_distance_km": 12.5,
+                       "total_energy_per_km": 0.2})
+
+
+@pytest.fixture
+def stub_tools():
+    return {tool.name: tool for tool in [
+        StubTool("get_available_vehicles", lambda: ["Pojazd_1", "Pojazd_2"]),
+        StubTool("get_data_range", lambda vehicle_id: f"Dane dla {vehicle_id} od 2025-02-10 do 2025-06-30."),
+        StubTool("calculate_range_metrics", _metrics),
+    ]}
+
+
+@pytest.fixture
+def router(stub_tools):
+    router = IntentRouter()
+    router.use_tools(list(stub_tools.values()))
+    return router
+
+
+@pytest.mark.parametrize("query", [
+    "średnia prędkość pojazdu 1 w lutym",
+    "średnia prędkość pojazdu 1 10.02.2025",
+    "średnia prędkość pojazdu 1 10 lutego 2025",
+    "średnia prędkość pojazdu 1 w marcu",
+    "dystans pojazdu 1 w 2024 roku",
+    "dystans pojazdu 1 w zeszłym roku",
+    "średnia prędkość pojazdu 1 rano",
+    "średnia prędkość pojazdu 1 wieczorem",
+    "dystans pojazdu 1 w weekend",
+    "dystans pojazdu 1 w sobotę",
+    "dystans pojazdu 1 w dni robocze",
+    "zużycie energii pojazdu 1 zimą",
+    "dystans pojazdu 1 2025-02-10 od 8:00",
+    "raport pojazdu 1 za weekend",
+    "raport dla Pojazd_1 za maj",
+])
+def test_unparsed_time_expression_goes_to_agent(router, stub_tools, query):
+    assert router.route(query) is None
+    assert router.stats()["errors"] == 0
+    assert not stub_tools["calculate_range_metrics"].calls
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("średnia prędkość pojazdu 1", ("2025-02-10", "2025-06-30")),
+    ("dystans Pojazd_2", ("2025-02-10", "2025-06-30")),
+    ("średnia prędkość pojazdu 1 2025-03-01", ("2025-03-01", "2025-03-01")),
+    ("dystans pojazdu 1 od 2025-03-10 do 2025-03-01", ("2025-03-01", "2025-03-10")),
+])
+def test_dates_resolved_without_agent(router, stub_tools, query, expected):
+    routed = router.route(query)
+    assert routed is not None and routed.intent == "metrics"
+    call = stub_tools["calculate_range_metrics"].calls[-1]
+    assert (call["start_date"], call["end_date"]) == expected
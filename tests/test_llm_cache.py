@@ -0,0 +1,26 @@
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from llm_cache import CachedChatModel, ResponseCache
+
+
+def _cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "cache.sqlite"), version_source=lambda: 1)
+
+
+def test_answer_key_keeps_case_of_vehicle_id(tmp_path):
+    cache = _cache(tmp_path)
+    cache.put_answer("Zakres dat dla pojazd_1?", "model", {"output": "Brak danych dla pojazdu pojazd_1."})
+
+    assert cache.get_answer("Zakres dat dla Pojazd_1", "model") is None
+    assert cache.get_answer("  Zakres dat   dla pojazd_1 ", "model") == {
+        "output": "Brak danych dla pojazdu pojazd_1."}
+
+
+def test_model_key_keeps_case_and_ignores_whitespace(tmp_path):
+    model = CachedChatModel(model=FakeListChatModel(responses=["pierwsza", "druga"]),
+                            response_cache=_cache(tmp_path))
+
+    assert model.invoke("Zakres dat dla pojazd_1?").content == "pierwsza"
+    assert model.invoke("Zakres dat dla Pojazd_1").content == "druga"
+    assert model.invoke("Zakres  dat dla pojazd_1").content == "pierwsza"
+    assert model.response_cache.stats()["hits"] == 1
@@ -1,64 +1,81 @@
-import os
-import psycopg2
-from dotenv import load_dotenv
 import pandas as pd
 from datetime import datetime, timedelta
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Union
 import plotly.express as px
+import plotly.graph_objects as go
 import plotly.io as pio
+import io
 import json
+import hashlib
 from langchain.tools import tool
+from db_pool import get_pool
+from dataset_registry import registry, is_handle, DatasetNotFoundError
+from analysis import AnalysisResult, analyze_chunks, analyze_frame, SAMPLE_INTERVAL_H
+import rollups
+from downsampling import CHART_MAX_POINTS, ENVELOPE_COLUMNS, downsample_series
+from chart_store import chart_key, store as chart_store
+from instrumentation import db_call, traced_tool
+from columnar import columnar_enabled, read_frame
+from streaming import RAW_SERIES_QUERY, iter_frames
+from vehicle_catalog import get_catalog
 
 # Ustawienie renderera Plotly na 'json' do zwracania wykresów jako JSON
 # W normalnym środowisku użyłbym 'png' lub 'jpeg', ale w tym przypadku JSON jest bezpieczniejszy
 # do przekazania przez narzędzie.
 pio.templates.default = "plotly_white"
 
-# Wczytanie zmiennych środowiskowych
-load_dotenv()
-DB_URL = os.getenv("DATABASE_URL")
-
 def get_db_connection():
-    """Ustanawia połączenie z bazą danych PostgreSQL."""
-    if not DB_URL:
-        raise ValueError("DATABASE_URL nie jest ustawione w zmiennych środowiskowych.")
-    return psycopg2.connect(DB_URL)
+    """
+    Wypożycza połączenie z bazą PostgreSQL ze wspólnej puli procesu.
+    Należy używać jako context managera: `with get_db_connection() as conn: ...`,
+    dzięki czemu połączenie wraca do puli zamiast być zamykane.
+    """
+    return get_pool().connection()
+
+def _read_sql(query: str, conn, params=None) -> pd.DataFrame:
+    """pd.read_sql z pomiarem czasu zapytania i liczby wierszy w bieżącym spanie narzędzia."""
+    with db_call() as call:
+        df = pd.read_sql(query, conn, params=params)
+        call.rows = len(df)
+    return df
+
+def _read_series(query: str, conn, params=None) -> tuple:
+    """
+    Pobiera szereg czasowy kolumnowo (Arrow, columnar.read_frame), a gdy transport
+    kolumnowy jest wyłączony lub brak pyarrow - przez pd.read_sql.
+
+    :return: Krotka (DataFrame, ścieżka pliku Arrow dla zbiorów zmapowanych z dysku lub None).
+    """
+    if not columnar_enabled():
+        return _read_sql(query, conn, params=params), None
+    with db_call() as call:
+        df, spill_path = read_frame(conn, query, params=params)
+        call.rows = len(df)
+    return df, spill_path
 
 @tool
+@traced_tool
 def get_available_vehicles() -> List[str]:
     """
     Zwraca listę unikalnych identyfikatorów pojazdów dostępnych w bazie danych.
     
     :return: Lista identyfikatorów pojazdów (np. ['Pojazd_1', 'Pojazd_2']).
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        query = "SELECT DISTINCT vehicle_id FROM vehicle_data ORDER BY vehicle_id;"
-        df = pd.read_sql(query, conn)
-        return df['vehicle_id'].tolist()
+        return list(get_catalog(get_db_connection))
     except Exception as e:
         return [f"Błąd podczas pobierania listy pojazdów: {e}"]
-    finally:
-        if conn:
-            conn.close()
 
 
 def get_available_vehicles_simple() -> list:
     """Zwraca listę dostępnych pojazdów (bez dekoratora @tool)."""
-    conn = None
     try:
-        conn = get_db_connection()
-        query = "SELECT DISTINCT vehicle_id FROM vehicle_data ORDER BY vehicle_id;"
-        df = pd.read_sql(query, conn)
-        return df['vehicle_id'].tolist()
+        return list(get_catalog(get_db_connection))
     except Exception as e:
         return [f"Błąd: {e}"]
-    finally:
-        if conn:
-            conn.close()
 
 @tool
+@traced_tool
 def get_data_range(vehicle_id: str) -> str:
     """
     Zwraca minimalną i maksymalną datę (zakres) dostępnych danych dla danego pojazdu.
@@ -66,181 +83,548 @@ def get_data_range(vehicle_id: str) -> str:
     :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
     :return: String z zakresem dat (np. '2025-02-10 do 2025-02-14').
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        query = f"""
-        SELECT MIN(timestamp) as min_date, MAX(timestamp) as max_date
-        FROM vehicle_data
-        WHERE vehicle_id = %s;
-        """
-        df = pd.read_sql(query, conn, params=(vehicle_id,))
+        info = get_catalog(get_db_connection).get(vehicle_id)
+        if info is None:
+            return f"Brak danych dla pojazdu {vehicle_id}."
         
-        min_date = df['min_date'].iloc[0].strftime('%Y-%m-%d')
-        max_date = df['max_date'].iloc[0].strftime('%Y-%m-%d')
+        min_date = info.first_ts.strftime('%Y-%m-%d')
+        max_date = info.last_ts.strftime('%Y-%m-%d')
         
         return f"Zakres dat dla {vehicle_id}: od {min_date} do {max_date}."
     except Exception as e:
         return f"Błąd podczas pobierania zakresu dat: {e}"
-    finally:
-        if conn:
-            conn.close()
 
 
+def _date_bounds(start_date: str, end_date: str) -> tuple:
+    """Zamienia zakres dat 'YYYY-MM-DD' (włącznie) na półotwarty przedział [start, koniec + 1 dzień)."""
+    start_dt = datetime.strptime(start_date, '%Y-%m-%d')
+    # Dodajemy jeden dzień do end_date, aby uwzględnić cały dzień końcowy
+    end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    return start_dt.strftime('%Y-%m-%d'), end_dt.strftime('%Y-%m-%d')
+
+# Rozdzielczości szeregu zwracanego przez fetch_data_for_chart
+RESOLUTIONS = ("auto", "raw", "hour", "day")
+
 @tool
-def fetch_data_for_chart(vehicle_id: str, start_date: str, end_date: str) -> str:
+@traced_tool
+def fetch_data_for_chart(vehicle_id: str, start_date: str, end_date: str, resolution: str = "auto") -> str:
     """
-    Pobiera surowe dane telemetryczne (prędkość, moce, dystans) dla danego pojazdu 
-    w określonym zakresie dat. Dane są zwracane jako string w formacie JSON, 
-    gotowe do użycia przez narzędzia do generowania wykresów.
+    Pobiera dane telemetryczne (prędkość, moce, dystans) dla danego pojazdu 
+    w określonym zakresie dat. Dane zostają po stronie serwera - narzędzie zwraca
+    krótki uchwyt zbioru danych (pole 'dataset', np. 'ds_1a2b3c4d5e6f') wraz z
+    podsumowaniem (liczba wierszy, zakres czasu, kolumny, rozdzielczość). Uchwyt należy
+    przekazać jako `data_json` do narzędzi analitycznych i do generowania wykresów.
 
     :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
     :param start_date: Data początkowa w formacie 'YYYY-MM-DD' (np. '2025-02-13').
     :param end_date: Data końcowa w formacie 'YYYY-MM-DD' (np. '2025-02-15').
-    :return: String JSON z danymi lub komunikat o błędzie/braku danych.
+    :param resolution: 'auto' (domyślnie - długie zakresy z agregatów godzinowych lub
+                       dziennych), 'raw', 'hour' lub 'day'.
+    :return: String JSON z uchwytem i podsumowaniem lub komunikat o błędzie/braku danych.
     """
-    conn = None
+    if resolution not in RESOLUTIONS:
+        return f"Nieznana rozdzielczość: {resolution} (dozwolone: 'auto', 'raw', 'hour', 'day')."
     try:
-        conn = get_db_connection()
-        query = f"""
-        SELECT timestamp, speed_kmh, traction_power_kw, hvac_power_kw, distance_km
-        FROM vehicle_data
-        WHERE vehicle_id = %s AND timestamp >= %s AND timestamp < %s
-        ORDER BY timestamp;
-        """
-        # Dodajemy jeden dzień do end_date, aby uwzględnić cały dzień końcowy
-        end_dt = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-        
-        df = pd.read_sql(query, conn, params=(vehicle_id, start_date, end_dt.strftime('%Y-%m-%d')))
-        
-        if df.empty:
-            return f"Brak danych dla pojazdu {vehicle_id} w zakresie od {start_date} do {end_date}."
-        
-        # Konwersja timestamp na string dla łatwiejszego przekazania w JSON
-        df['timestamp'] = df['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+        cache_key = (vehicle_id, start_date, end_date, resolution)
+        closed = _range_closed(vehicle_id, end_date, get_catalog(get_db_connection))
+        handle = registry.find(cache_key) if closed else None
+        if handle is not None:
+            return json.dumps(registry.summary(handle), ensure_ascii=False)
+
+        query = RAW_SERIES_QUERY
+        range_start, range_end = _date_bounds(start_date, end_date)
         
-        # Zwracamy dane jako string JSON
-        return df.to_json(orient='records')
+        with get_db_connection() as conn:
+            if resolution == "auto":
+                with db_call():
+                    fresh = rollups.rollups_fresh(conn, [vehicle_id], range_end)
+                resolution = rollups.choose_resolution(range_start, range_end, fresh)
+            if resolution != "raw":
+                query = rollups.series_query(resolution)
+            df, spill_path = _read_series(query, conn, params=(vehicle_id, range_start, range_end))
+        return _register_series(df, spill_path, cache_key, resolution)
     except Exception as e:
         return f"Błąd podczas pobierania danych: {e}"
-    finally:
-        if conn:
-            conn.close()
 
-def _calculate_energy_consumption(df: pd.DataFrame, power_col: str) -> float:
-    """Wewnętrzna funkcja do obliczania zużycia energii w kWh/km."""
+def _range_closed(vehicle_id: str, end_date: str, catalog) -> bool:
+    """
+    Czy zakres kończy się przed ostatnim pomiarem pojazdu w katalogu. Tylko taki wynik
+    można ponownie wziąć z rejestru - zakres sięgający końca danych obejmuje próbki, które
+    wciąż napływają (ingest_service.py), więc jest pobierany od nowa (nowy zbiór zastępuje
+    poprzedni pod tym samym kluczem).
+    """
+    info = catalog.get(vehicle_id)
+    range_end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
+    return info is not None and range_end <= info.last_ts
+
+def _register_series(df: pd.DataFrame, spill_path, cache_key: tuple, resolution: str) -> str:
+    """Zapisuje pobrany szereg w rejestrze i zwraca podsumowanie z uchwytem (lub komunikat o braku danych)."""
+    vehicle_id, start_date, end_date, _ = cache_key
     if df.empty:
-        return 0.0
+        return f"Brak danych dla pojazdu {vehicle_id} w zakresie od {start_date} do {end_date}."
     
-    # Czas między pomiarami to 1 minuta (1/60 godziny)
-    time_interval_h = 1/60 
-    
-    # Energia w kWh = Moc w kW * Czas w h
-    df['energy_kwh'] = df[power_col] * time_interval_h
-    
-    total_energy_kwh = df['energy_kwh'].sum()
-    total_distance_km = df['distance_km'].sum()
-    
-    if total_distance_km == 0:
-        return 0.0
-        
-    # Zużycie w kWh/km
-    consumption = total_energy_kwh / total_distance_km
-    return round(consumption, 4)
+    # Dane zostają w rejestrze procesu, do modelu trafia tylko uchwyt i podsumowanie
+    handle = registry.register(df, key=cache_key, meta={"vehicle_id": vehicle_id, "resolution": resolution},
+                               spill_path=spill_path)
+    return json.dumps(registry.summary(handle), ensure_ascii=False)
+
+def _dataset_handle(text: str):
+    """Zwraca uchwyt zbioru danych z samego uchwytu lub podsumowania fetch_data_for_chart."""
+    if is_handle(text):
+        return text
+    if text.startswith("{"):
+        payload = json.loads(text)
+        if "dataset" in payload:
+            return payload["dataset"]
+    return None
+
+def _load_dataset(data_json: str) -> pd.DataFrame:
+    """
+    Zwraca DataFrame dla uchwytu zbioru danych (lub całego podsumowania zwróconego
+    przez fetch_data_for_chart). Surowy string JSON z danymi jest nadal obsługiwany
+    dla zgodności wstecz. Zwrócony DataFrame może być współdzielony - nie modyfikować.
+    """
+    text = data_json.strip()
+    handle = _dataset_handle(text)
+    if handle is not None:
+        return registry.get(handle)
+    return pd.read_json(io.StringIO(text))
+
+def _analyze(data_json: str) -> AnalysisResult:
+    """
+    Zwraca wszystkie metryki zbioru danych. Dla uchwytu wynik jest liczony raz
+    i zapamiętywany w rejestrze, więc kolejne narzędzia calculate_* i raport go współdzielą.
+    """
+    text = data_json.strip()
+    handle = _dataset_handle(text)
+    if handle is not None:
+        return registry.derive(handle, "analysis", analyze_frame)
+    return analyze_frame(pd.read_json(io.StringIO(text)))
+
+def _data_identity(data_json: str):
+    """
+    Identyfikacja danych do klucza wykresu: dla uchwytu - podsumowanie zbioru (bez samego
+    uchwytu, który zmienia się przy ponownym pobraniu), dla surowego JSON - skrót treści.
+    """
+    text = data_json.strip()
+    handle = _dataset_handle(text)
+    if handle is not None:
+        summary = registry.summary(handle)
+        summary.pop("dataset")
+        return summary
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _dataset_missing_message(e: DatasetNotFoundError) -> str:
+    return (f"Zbiór danych {e.args[0]} wygasł lub nie istnieje. "
+            f"Pobierz dane ponownie narzędziem fetch_data_for_chart.")
 
 @tool
-def calculate_average_speed(data_json: str) -> float:
+@traced_tool
+def calculate_average_speed(data_json: str) -> Union[float, str]:
     """
     Oblicza średnią prędkość (km/h) na podstawie danych telemetrycznych.
 
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
-    :return: Średnia prędkość w km/h.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
+    :return: Średnia prędkość w km/h lub komunikat, gdy zbiór danych wygasł.
     """
     try:
-        df = pd.read_json(data_json)
-        if df.empty:
-            return 0.0
-        return round(df['speed_kmh'].mean(), 2)
+        return round(_analyze(data_json).avg_speed_kmh, 2)
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception:
         return 0.0
     
 @tool
-def calculate_total_distance(data_json: str) -> float:
+@traced_tool
+def calculate_total_distance(data_json: str) -> Union[float, str]:
     """
     Oblicza całkowity przejechany dystans (km) na podstawie danych telemetrycznych.
 
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
-    :return: Całkowity dystans w km.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
+    :return: Całkowity dystans w km lub komunikat, gdy zbiór danych wygasł.
     """
     try:
-        df = pd.read_json(data_json)
-        if df.empty:
-            return 0.0
-        return round(df['distance_km'].sum(), 2)
+        return round(_analyze(data_json).total_distance_km, 2)
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception:
         return 0.0
     
 @tool
-def calculate_traction_energy_per_km(data_json: str) -> float:
+@traced_tool
+def calculate_traction_energy_per_km(data_json: str) -> Union[float, str]:
     """
     Oblicza zużycie energii trakcyjnej w kWh/km.
 
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
-    :return: Zużycie energii trakcyjnej w kWh/km.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
+    :return: Zużycie energii trakcyjnej w kWh/km lub komunikat, gdy zbiór danych wygasł.
     """
     try:
-        df = pd.read_json(data_json)
-        return _calculate_energy_consumption(df, 'traction_power_kw')
+        return round(_analyze(data_json).traction_energy_per_km, 4)
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception:
         return 0.0
     
 @tool
-def calculate_hvac_energy_per_km(data_json: str) -> float:
+@traced_tool
+def calculate_hvac_energy_per_km(data_json: str) -> Union[float, str]:
     """
     Oblicza zużycie energii HVAC w kWh/km.
 
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
-    :return: Zużycie energii HVAC w kWh/km.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
+    :return: Zużycie energii HVAC w kWh/km lub komunikat, gdy zbiór danych wygasł.
     """
     try:
-        df = pd.read_json(data_json)
-        return _calculate_energy_consumption(df, 'hvac_power_kw')
+        return round(_analyze(data_json).hvac_energy_per_km, 4)
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception:
         return 0.0
     
 @tool
-def calculate_total_energy_per_km(data_json: str) -> float:
+@traced_tool
+def calculate_total_energy_per_km(data_json: str) -> Union[float, str]:
     """
     Oblicza całkowite zużycie energii (trakcja + HVAC) w kWh/km.
 
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
-    :return: Całkowite zużycie energii w kWh/km.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
+    :return: Całkowite zużycie energii w kWh/km lub komunikat, gdy zbiór danych wygasł.
     """
     try:
-        df = pd.read_json(data_json)
-        # Tworzenie kolumny z sumą mocy
-        df['total_power_kw'] = df['traction_power_kw'] + df['hvac_power_kw']
-        return _calculate_energy_consumption(df, 'total_power_kw')
+        return round(_analyze(data_json).total_energy_per_km, 4)
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception:
         return 0.0
 
+AGGREGATE_METRICS_QUERY = """
+SELECT COUNT(*) AS samples,
+       AVG(speed_kmh) AS avg_speed_kmh,
+       SUM(distance_km) AS total_distance_km,
+       SUM(traction_power_kw) AS traction_power_sum,
+       SUM(hvac_power_kw) AS hvac_power_sum,
+       SUM(traction_power_kw + hvac_power_kw) AS total_power_sum
+FROM vehicle_data
+WHERE vehicle_id = %s AND timestamp >= %s AND timestamp < %s;
+"""
+
+def _query_aggregate_metrics(vehicle_id: str, start_date: str, end_date: str) -> Dict[str, Any]:
+    """
+    Liczy metryki pojazdu w zakresie dat jednym zapytaniem agregującym w PostgreSQL.
+    Do aplikacji trafia jeden wiersz skalarów zamiast wszystkich pomiarów. Zakres
+    obejmuje pełne dni, więc gdy agregaty dzienne (rollups.py) obejmują cały zakres,
+    wynik jest dokładny i liczony z nich zamiast z surowych danych.
+    Wyniki są zaokrąglane tak samo jak w narzędziach calculate_* (analysis.analyze_frame).
+    """
+    range_start, range_end = _date_bounds(start_date, end_date)
+    with get_db_connection() as conn, db_call() as call:
+        fresh = rollups.rollups_fresh(conn, [vehicle_id], range_end)
+        with conn.cursor() as cur:
+            query = rollups.ROLLUP_METRICS_QUERY if fresh else AGGREGATE_METRICS_QUERY
+            cur.execute(query, (vehicle_id, range_start, range_end))
+            row = cur.fetchone()
+            call.rows = 1
+    return _metrics_from_sums(*row, resolution="day" if fresh else "raw")
+
+def _metrics_from_sums(samples, avg_speed, distance, traction_sum, hvac_sum, total_sum,
+                       resolution: str) -> Dict[str, Any]:
+    """Zamienia sumy z zapytania agregującego na metryki zaokrąglone jak w narzędziach calculate_*."""
+    samples = int(samples or 0)
+    distance = float(distance or 0)
+
+    def per_km(power_sum):
+        if not samples or distance == 0:
+            return 0.0
+        return round(float(power_sum or 0) * SAMPLE_INTERVAL_H / distance, 4)
+
+    return {
+        "resolution": resolution,
+        "samples": samples,
+        "avg_speed_kmh": round(float(avg_speed), 2) if samples else 0.0,
+        "total_distance_km": round(distance, 2),
+        "traction_energy_per_km": per_km(traction_sum),
+        "hvac_energy_per_km": per_km(hvac_sum),
+        "total_energy_per_km": per_km(total_sum),
+    }
+
+@tool
+@traced_tool
+def calculate_range_metrics(vehicle_id: str, start_date: str, end_date: str) -> str:
+    """
+    Oblicza w bazie danych wszystkie metryki pojazdu w zakresie dat (bez pobierania
+    surowych danych): liczbę pomiarów, średnią prędkość, dystans oraz zużycie energii
+    trakcyjnej, HVAC i całkowitej w kWh/km.
+
+    :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
+    :param start_date: Data początkowa w formacie 'YYYY-MM-DD'.
+    :param end_date: Data końcowa w formacie 'YYYY-MM-DD'.
+    :return: String JSON z metrykami lub komunikat o błędzie.
+    """
+    try:
+        return json.dumps(_query_aggregate_metrics(vehicle_id, start_date, end_date))
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+AGGREGATE_FLEET_METRICS_QUERY = """
+SELECT vehicle_id,
+       COUNT(*) AS samples,
+       AVG(speed_kmh) AS avg_speed_kmh,
+       SUM(distance_km) AS total_distance_km,
+       SUM(traction_power_kw) AS traction_power_sum,
+       SUM(hvac_power_kw) AS hvac_power_sum,
+       SUM(traction_power_kw + hvac_power_kw) AS total_power_sum
+FROM vehicle_data
+WHERE vehicle_id = ANY(%s) AND timestamp >= %s AND timestamp < %s
+GROUP BY vehicle_id;
+"""
+
+# Kolumny rankingu floty: klucz metryki -> (nagłówek tabeli, czy większa wartość jest wyżej)
+FLEET_COLUMNS = {
+    "avg_speed_kmh": ("Śr. prędkość [km/h]", True),
+    "total_distance_km": ("Dystans [km]", True),
+    "traction_energy_per_km": ("Trakcja [kWh/km]", False),
+    "hvac_energy_per_km": ("HVAC [kWh/km]", False),
+    "total_energy_per_km": ("Całkowite [kWh/km]", False),
+}
+
+def _query_fleet_metrics(vehicle_ids: List[str], start_date: str, end_date: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Liczy metryki wielu pojazdów jednym zapytaniem z GROUP BY vehicle_id (z agregatów
+    dziennych, gdy są aktualne). Pojazdy bez danych w zakresie nie mają wpisu w wyniku.
+    """
+    range_start, range_end = _date_bounds(start_date, end_date)
+    with get_db_connection() as conn, db_call() as call:
+        fresh = rollups.rollups_fresh(conn, vehicle_ids, range_end)
+        with conn.cursor() as cur:
+            query = rollups.ROLLUP_FLEET_METRICS_QUERY if fresh else AGGREGATE_FLEET_METRICS_QUERY
+            cur.execute(query, (list(vehicle_ids), range_start, range_end))
+            rows = cur.fetchall()
+            call.rows = len(rows)
+    resolution = "day" if fresh else "raw"
+    return {row[0]: _metrics_from_sums(*row[1:], resolution=resolution) for row in rows if row[1]}
+
+def _fleet_chart(ranking: List[tuple], title: str) -> go.Figure:
+    """Wykres słupkowy floty: prędkość, dystans i zużycie energii (pogrupowane) w osobnych panelach."""
+    from plotly.subplots import make_subplots
+
+    vehicles = [vehicle_id for vehicle_id, _ in ranking]
+    fig = make_subplots(rows=3, cols=1, shared_xaxes=True, vertical_spacing=0.08,
+                        subplot_titles=("Średnia prędkość", "Dystans", "Zużycie energii"))
+    palette = px.colors.qualitative.Plotly
+    panels = [
+        (1, ["avg_speed_kmh"], "km/h"),
+        (2, ["total_distance_km"], "km"),
+        (3, ["traction_energy_per_km", "hvac_energy_per_km", "total_energy_per_km"], "kWh/km"),
+    ]
+    for row, keys, unit in panels:
+        for key in keys:
+            fig.add_trace(go.Bar(
+                x=vehicles, y=[metrics[key] for _, metrics in ranking], name=FLEET_COLUMNS[key][0],
+                marker_color=palette[list(FLEET_COLUMNS).index(key) % len(palette)],
+            ), row=row, col=1)
+        fig.update_yaxes(title_text=unit, row=row, col=1)
+    fig.update_layout(title=title, barmode="group", height=900)
+    return fig
+
+@tool
+@traced_tool
+def compare_vehicles(vehicle_ids: List[str], start_date: str, end_date: str,
+                     sort_by: str = "total_energy_per_km", top_n: int = 20, chart: bool = False) -> str:
+    """
+    Porównuje wiele pojazdów (lub całą flotę) w zakresie dat jednym wywołaniem: liczy w bazie
+    średnią prędkość, dystans i zużycie energii (trakcja, HVAC, całkowite w kWh/km) każdego
+    pojazdu i zwraca ranking jako tabelę. Używaj do pytań o porównanie pojazdów, np. "który
+    pojazd zużywa najmniej energii" - zamiast wywoływać narzędzia osobno dla każdego pojazdu.
+
+    :param vehicle_ids: Lista identyfikatorów pojazdów (np. ['Pojazd_1', 'Pojazd_2']);
+                        pusta lista lub ['all'] oznacza wszystkie pojazdy.
+    :param start_date: Data początkowa w formacie 'YYYY-MM-DD'.
+    :param end_date: Data końcowa w formacie 'YYYY-MM-DD'.
+    :param sort_by: Metryka rankingu: 'avg_speed_kmh', 'total_distance_km' (malejąco) lub
+                    'traction_energy_per_km', 'hvac_energy_per_km', 'total_energy_per_km'
+                    (rosnąco - najbardziej efektywne pierwsze). Domyślnie 'total_energy_per_km'.
+    :param top_n: Maksymalna liczba pojazdów w tabeli (domyślnie 20).
+    :param chart: Czy dodatkowo wygenerować wykres porównawczy (ścieżka do pliku HTML w wyniku).
+    :return: Tabela rankingu w formacie Markdown (i ścieżka wykresu) lub komunikat o błędzie.
+    """
+    if sort_by not in FLEET_COLUMNS:
+        return f"Nieznana metryka rankingu: {sort_by} (dozwolone: {', '.join(FLEET_COLUMNS)})."
+    try:
+        requested, unknown = _fleet_selection(vehicle_ids, get_catalog(get_db_connection))
+        metrics = _query_fleet_metrics(requested, start_date, end_date) if requested else {}
+    except Exception as e:
+        return f"Błąd podczas porównywania pojazdów: {e}"
+    return _format_fleet(metrics, requested, unknown, start_date, end_date, sort_by, top_n, chart)
+
+def _fleet_selection(vehicle_ids: List[str], known) -> tuple:
+    """Rozdziela żądane pojazdy na znane z katalogu (bez powtórzeń) i nieznane; pusta lista/'all' - cała flota."""
+    requested = [v for v in vehicle_ids or [] if v.lower() != "all"]
+    if not requested:
+        requested = list(known)
+    unknown = [v for v in requested if v not in known]
+    return list(dict.fromkeys(v for v in requested if v in known)), unknown
+
+def _format_fleet(metrics: Dict[str, Dict[str, Any]], requested: List[str], unknown: List[str],
+                  start_date: str, end_date: str, sort_by: str, top_n: int, chart: bool) -> str:
+    """Buduje tabelę rankingu floty (i opcjonalnie wykres) z metryk pojazdów."""
+    if not metrics:
+        note = f" Nieznane pojazdy: {', '.join(unknown)}." if unknown else ""
+        return f"Brak danych dla wybranych pojazdów w zakresie od {start_date} do {end_date}.{note}"
+
+    label, descending = FLEET_COLUMNS[sort_by]
+    # Pojazdy bez przejechanego dystansu mają zużycie 0 kWh/km - w rankingu energii idą na koniec
+    ranking = sorted(metrics.items(), key=lambda item: (
+        not descending and item[1]["total_distance_km"] == 0,
+        -item[1][sort_by] if descending else item[1][sort_by],
+    ))
+    shown = ranking[:max(top_n, 1)]
+
+    lines = [
+        f"Porównanie pojazdów od {start_date} do {end_date} - ranking wg: {label} "
+        f"({'malejąco' if descending else 'rosnąco'}):",
+        "",
+        "| # | Pojazd | " + " | ".join(header for header, _ in FLEET_COLUMNS.values()) + " | Pomiary |",
+        "|---|---|" + "---|" * len(FLEET_COLUMNS) + "---|",
+    ]
+    for position, (vehicle_id, values) in enumerate(shown, start=1):
+        cells = " | ".join(str(values[key]) for key in FLEET_COLUMNS)
+        lines.append(f"| {position} | {vehicle_id} | {cells} | {values['samples']} |")
+    lines.append("")
+    if len(ranking) > len(shown):
+        lines.append(f"Pokazano {len(shown)} z {len(ranking)} pojazdów.")
+    no_data = [v for v in requested if v not in metrics]
+    if no_data:
+        lines.append(f"Brak danych w zakresie: {', '.join(no_data)}.")
+    if unknown:
+        lines.append(f"Nieznane pojazdy: {', '.join(unknown)}.")
+
+    if chart:
+        try:
+            key = chart_key("fleet", start_date, end_date, sort_by, shown)
+            chart_file = chart_store.get_or_render(key, lambda: _fleet_chart(
+                shown, title=f"Porównanie pojazdów od {start_date} do {end_date}"))
+            lines.append(f"Wykres zapisany: {chart_file}")
+        except Exception as e:
+            lines.append(f"Błąd podczas generowania wykresu porównawczego: {e}")
+    return "\n".join(lines).strip()
+
+@tool
+@traced_tool
+def calculate_average_speed_in_range(vehicle_id: str, start_date: str, end_date: str) -> Union[float, str]:
+    """
+    Oblicza w bazie danych średnią prędkość (km/h) pojazdu w zakresie dat.
+    Nie wymaga wcześniejszego użycia fetch_data_for_chart.
+
+    :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
+    :param start_date: Data początkowa w formacie 'YYYY-MM-DD'.
+    :param end_date: Data końcowa w formacie 'YYYY-MM-DD'.
+    :return: Średnia prędkość w km/h lub komunikat o błędzie.
+    """
+    try:
+        return _query_aggregate_metrics(vehicle_id, start_date, end_date)["avg_speed_kmh"]
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+@tool
+@traced_tool
+def calculate_total_distance_in_range(vehicle_id: str, start_date: str, end_date: str) -> Union[float, str]:
+    """
+    Oblicza w bazie danych całkowity dystans (km) pojazdu w zakresie dat.
+    Nie wymaga wcześniejszego użycia fetch_data_for_chart.
+
+    :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
+    :param start_date: Data początkowa w formacie 'YYYY-MM-DD'.
+    :param end_date: Data końcowa w formacie 'YYYY-MM-DD'.
+    :return: Całkowity dystans w km lub komunikat o błędzie.
+    """
+    try:
+        return _query_aggregate_metrics(vehicle_id, start_date, end_date)["total_distance_km"]
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
 @tool
+@traced_tool
+def calculate_energy_per_km_in_range(vehicle_id: str, start_date: str, end_date: str,
+                                     energy_type: str = "total") -> Union[float, str]:
+    """
+    Oblicza w bazie danych zużycie energii w kWh/km pojazdu w zakresie dat.
+    Nie wymaga wcześniejszego użycia fetch_data_for_chart.
+
+    :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
+    :param start_date: Data początkowa w formacie 'YYYY-MM-DD'.
+    :param end_date: Data końcowa w formacie 'YYYY-MM-DD'.
+    :param energy_type: Rodzaj energii: 'traction', 'hvac' lub 'total' (domyślnie).
+    :return: Zużycie energii w kWh/km lub komunikat o błędzie (np. nieznany rodzaj energii).
+    """
+    if energy_type not in ("traction", "hvac", "total"):
+        return f"Nieznany rodzaj energii: {energy_type} (dozwolone: 'traction', 'hvac', 'total')."
+    try:
+        return _query_aggregate_metrics(vehicle_id, start_date, end_date)[f"{energy_type}_energy_per_km"]
+    except Exception as e:
+        return f"Błąd podczas obliczania metryk: {e}"
+
+@tool
+@traced_tool
 def format_analysis_report(vehicle_id: str, start_date: str, end_date: str, data_json: str) -> str:
     """
     Generuje czytelny raport tekstowy podsumowujący analizę danych.
-    Wykorzystuje inne narzędzia do obliczeń i formatuje wyniki.
+    Wszystkie metryki są liczone w jednym przebiegu (analysis.analyze_frame).
 
     :param vehicle_id: Identyfikator pojazdu.
     :param start_date: Data początkowa.
     :param end_date: Data końcowa.
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
     :return: Sformatowany raport tekstowy.
     """
-    avg_speed = calculate_average_speed(data_json)
-    total_dist = calculate_total_distance(data_json)
-    traction_cons = calculate_traction_energy_per_km(data_json)
-    hvac_cons = calculate_hvac_energy_per_km(data_json)
-    total_cons = calculate_total_energy_per_km(data_json)
+    try:
+        result = _analyze(data_json)
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
+    except Exception as e:
+        return f"Błąd podczas generowania raportu: {e}"
+    return _format_report(vehicle_id, start_date, end_date, result)
+
+def _stream_raw_series(conn, vehicle_id: str, range_start: str, range_end: str):
+    """Kolejne paczki surowych pomiarów; czas pobrania każdej paczki liczy się jako czas bazy."""
+    chunks = iter_frames(conn, RAW_SERIES_QUERY, params=(vehicle_id, range_start, range_end))
+    while True:
+        with db_call() as call:
+            chunk = next(chunks, None)
+            call.rows = 0 if chunk is None else len(chunk)
+        if chunk is None:
+            return
+        yield chunk
+
+@tool
+@traced_tool
+def generate_range_report(vehicle_id: str, start_date: str, end_date: str) -> str:
+    """
+    Generuje raport analizy (jak format_analysis_report) bezpośrednio dla zakresu dat,
+    bez wcześniejszego fetch_data_for_chart. Surowe pomiary są czytane z bazy paczkami
+    i składane w sumy bieżące, więc raport jest dokładny (także percentyle i udział
+    postoju) dla dowolnie długiego zakresu, np. całego roku, przy stałym zużyciu pamięci.
+
+    :param vehicle_id: Identyfikator pojazdu (np. 'Pojazd_1').
+    :param start_date: Data początkowa w formacie 'YYYY-MM-DD'.
+    :param end_date: Data końcowa w formacie 'YYYY-MM-DD'.
+    :return: Sformatowany raport tekstowy lub komunikat o błędzie/braku danych.
+    """
+    try:
+        range_start, range_end = _date_bounds(start_date, end_date)
+        with get_db_connection() as conn:
+            result = analyze_chunks(_stream_raw_series(conn, vehicle_id, range_start, range_end))
+    except Exception as e:
+        return f"Błąd podczas generowania raportu: {e}"
+    if result.samples == 0:
+        return f"Brak danych dla pojazdu {vehicle_id} w zakresie od {start_date} do {end_date}."
+    return _format_report(vehicle_id, start_date, end_date, result)
+
+def _format_report(vehicle_id: str, start_date: str, end_date: str, result: AnalysisResult) -> str:
+    """Formatuje wynik analizy jako raport tekstowy."""
+    metrics = result.to_dict()
+    percentiles = ", ".join(f"p{p}: {v} km/h" for p, v in metrics["speed_percentiles"].items())
     
     report = f"""
     --- RAPORT ANALIZY DANYCH POJAZDU ---
@@ -248,78 +632,131 @@ def format_analysis_report(vehicle_id: str, start_date: str, end_date: str, data
     Okres: od {start_date} do {end_date}
     
     PODSUMOWANIE:
-    - Całkowity przejechany dystans: {total_dist} km
-    - Średnia prędkość w okresie: {avg_speed} km/h
+    - Liczba pomiarów: {metrics['samples']}
+    - Całkowity przejechany dystans: {metrics['total_distance_km']} km
+    - Średnia prędkość w okresie: {metrics['avg_speed_kmh']} km/h
+    - Prędkość maksymalna: {metrics['max_speed_kmh']} km/h
+    - Percentyle prędkości: {percentiles}
+    - Udział postoju: {round(metrics['idle_share'] * 100, 1)}%
     
     ZUŻYCIE ENERGII (kWh/km):
-    - Trakcja: {traction_cons} kWh/km
-    - HVAC: {hvac_cons} kWh/km
-    - Całkowite: {total_cons} kWh/km
+    - Trakcja: {metrics['traction_energy_per_km']} kWh/km
+    - HVAC: {metrics['hvac_energy_per_km']} kWh/km
+    - Całkowite: {metrics['total_energy_per_km']} kWh/km
+    - Energia łącznie: {metrics['total_energy_kwh']} kWh
     
     --- KONIEC RAPORTU ---
     """
-    return report.strip()
+    report = report.strip()
+    if result.aggregated:
+        report += "\n    (Dane zagregowane: percentyle i udział postoju są przybliżone.)"
+    return report
+
+PARAMETER_TITLES = {
+    'speed_kmh': 'Prędkość (km/h)',
+    'traction_power_kw': 'Moc Trakcyjna (kW)',
+    'hvac_power_kw': 'Moc HVAC (kW)',
+    'distance_km': 'Dystans (km)'
+}
+
+def _hex_to_rgba(color: str, alpha: float) -> str:
+    color = color.lstrip('#')
+    r, g, b = (int(color[i:i + 2], 16) for i in (0, 2, 4))
+    return f"rgba({r}, {g}, {b}, {alpha})"
+
+def _line_chart(df: pd.DataFrame, parameters: List[str], title: str, y_label: str,
+                legend_title: str = None, max_points: int = CHART_MAX_POINTS) -> go.Figure:
+    """
+    Buduje wykres liniowy z ograniczoną liczbą punktów na serię (LTTB). Dla sygnałów
+    mocy przy redukcji danych dodawana jest obwiednia min/max, aby piki pozostały widoczne.
+    """
+    missing = [p for p in parameters if p not in df.columns]
+    if missing:
+        raise ValueError(f"Brak kolumn w danych: {', '.join(missing)}")
+
+    palette = px.colors.qualitative.Plotly
+    fig = go.Figure()
+    for i, parameter in enumerate(parameters):
+        color = palette[i % len(palette)]
+        label = PARAMETER_TITLES.get(parameter, parameter) if len(parameters) == 1 else parameter
+        series = downsample_series(df['timestamp'], df[parameter], max_points=max_points,
+                                   envelope=parameter in ENVELOPE_COLUMNS)
+        if "lower" in series:
+            fig.add_trace(go.Scatter(
+                x=series["envelope_x"], y=series["lower"], mode='lines', line=dict(width=0),
+                legendgroup=parameter, showlegend=False, hoverinfo='skip',
+            ))
+            fig.add_trace(go.Scatter(
+                x=series["envelope_x"], y=series["upper"], mode='lines', line=dict(width=0),
+                fill='tonexty', fillcolor=_hex_to_rgba(color, 0.2), legendgroup=parameter,
+                name=f"{label} (min/max)",
+            ))
+        fig.add_trace(go.Scatter(
+            x=series["x"], y=series["y"], mode='lines', line=dict(color=color),
+            legendgroup=parameter, name=label, showlegend=len(parameters) > 1 or "lower" in series,
+        ))
+
+    fig.update_layout(title=title, xaxis_title='Czas', yaxis_title=y_label,
+                      legend_title_text=legend_title)
+    return fig
 
 @tool
+@traced_tool
 def generate_single_chart(data_json: str, parameter: str) -> str:
     """
     Generuje wykres liniowy dla pojedynczego parametru i zapisuje do pliku HTML.
+    Długie zakresy są redukowane do ograniczonej liczby punktów z zachowaniem kształtu serii.
     
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
     :param parameter: Nazwa kolumny do wykreślenia (np. 'speed_kmh', 'traction_power_kw').
     :return: String z ścieżką do pliku HTML lub komunikat o błędzie.
     """
     try:
-        df = pd.read_json(data_json)
+        df = _load_dataset(data_json)
         if df.empty:
             return "Brak danych do wygenerowania wykresu."
         
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
+        title = PARAMETER_TITLES.get(parameter, parameter)
+        key = chart_key(_data_identity(data_json), "single", parameter, CHART_MAX_POINTS)
         
-        title_map = {
-            'speed_kmh': 'Prędkość (km/h)',
-            'traction_power_kw': 'Moc Trakcyjna (kW)',
-            'hvac_power_kw': 'Moc HVAC (kW)',
-            'distance_km': 'Dystans (km)'
-        }
-        
-        fig = px.line(df, x='timestamp', y=parameter, 
-                      title=f'Wykres {title_map.get(parameter, parameter)} w czasie',
-                      labels={'timestamp': 'Czas', parameter: title_map.get(parameter, parameter)})
-        
-        # Zapisz do pliku HTML
-        chart_file = f"/tmp/chart_{parameter}.html"
-        fig.write_html(chart_file)
+        # Zapis do pliku HTML (istniejący wykres dla tych samych danych jest używany ponownie)
+        chart_file = chart_store.get_or_render(
+            key, lambda: _line_chart(df, [parameter], title=f'Wykres {title} w czasie', y_label=title)
+        )
         
         return f"Wykres zapisany: {chart_file}"
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception as e:
         return f"Błąd podczas generowania wykresu dla {parameter}: {e}"
     
 @tool
+@traced_tool
 def generate_multi_chart(data_json: str, parameters: List[str]) -> str:
     """
     Generuje wykres liniowy dla wielu parametrów i zapisuje do pliku HTML.
+    Długie zakresy są redukowane do ograniczonej liczby punktów z zachowaniem kształtu serii.
     
-    :param data_json: String JSON z danymi zwrócony przez fetch_data_for_chart.
+    :param data_json: Uchwyt zbioru danych zwrócony przez fetch_data_for_chart.
     :param parameters: Lista nazw kolumn do wykreślenia.
     :return: String z ścieżką do pliku HTML lub komunikat o błędzie.
     """
     try:
-        df = pd.read_json(data_json)
+        df = _load_dataset(data_json)
         if df.empty:
             return "Brak danych do wygenerowania wykresu."
         
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-        fig = px.line(df, x='timestamp', y=parameters, 
-                      title='Wykres wielu parametrów telemetrycznych w czasie',
-                      labels={'timestamp': 'Czas', 'value': 'Wartość', 'variable': 'Parametr'})
+        key = chart_key(_data_identity(data_json), "multi", list(parameters), CHART_MAX_POINTS)
         
-        # Zapisz do pliku HTML
-        chart_file = f"/tmp/chart_multi.html"
-        fig.write_html(chart_file)
+        # Zapis do pliku HTML (istniejący wykres dla tych samych danych jest używany ponownie)
+        chart_file = chart_store.get_or_render(
+            key, lambda: _line_chart(df, parameters, title='Wykres wielu parametrów telemetrycznych w czasie',
+                                     y_label='Wartość', legend_title='Parametr')
+        )
         
         return f"Wykres zapisany: {chart_file}"
+    except DatasetNotFoundError as e:
+        return _dataset_missing_message(e)
     except Exception as e:
         return f"Błąd podczas generowania wykresu dla wielu parametrów: {e}"
 
@@ -337,7 +774,7 @@ if __name__ == "__main__":
     if data.startswith("Błąd") or data.startswith("Brak"):
         print(data)
     else:
-        print(f"\nPobrano dane dla {vehicle}. Liczba rekordów: {len(pd.read_json(data))}")
+        print(f"\nPobrano dane dla {vehicle}. Liczba rekordów: {json.loads(data)['rows']}")
         
         # Przykładowe użycie narzędzi analitycznych
         print("\n--- Analiza Danych ---")
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict
+
+import pandas as pd
+import psycopg2
+from psycopg2.extras import execute_values
+
+from instrumentation import db_call
+
+# Jak długo (w sekundach) używać katalogu z pamięci procesu. Ładowanie danych w tym
+# procesie (bulk_load) unieważnia go od razu; zmiany z innych procesów są widoczne po TTL.
+VEHICLE_CATALOG_TTL_S = float(os.getenv("VEHICLE_CATALOG_TTL_S", "60"))
+
+# Katalog pojazdów utrzymywany przy ładowaniu danych: jeden wiersz na pojazd
+# zamiast DISTINCT / MIN / MAX po całej tabeli vehicle_data.
+CREATE_CATALOG_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS vehicle_catalog (
+    vehicle_id VARCHAR(50) PRIMARY KEY,
+    first_ts TIMESTAMP NOT NULL,
+    last_ts TIMESTAMP NOT NULL,
+    row_count BIGINT NOT NULL,
+    last_ingest_at TIMESTAMP NOT NULL
+);
+"""
+
+# Dopisanie paczki: statystyki są addytywne (min/max, licznik), więc wystarczy scalenie z wierszem
+UPSERT_CATALOG_QUERY = """
+INSERT INTO vehicle_catalog AS c (vehicle_id, first_ts, last_ts, row_count, last_ingest_at)
+VALUES %s
+ON CONFLICT (vehicle_id) DO UPDATE SET
+    first_ts = LEAST(c.first_ts, EXCLUDED.first_ts),
+    last_ts = GREATEST(c.last_ts, EXCLUDED.last_ts),
+    row_count = c.row_count + EXCLUDED.row_count,
+    last_ingest_at = EXCLUDED.last_ingest_at;
+"""
+
+REBUILD_CATALOG_QUERY = """
+TRUNCATE vehicle_catalog;
+INSERT INTO vehicle_catalog (vehicle_id, first_ts, last_ts, row_count, last_ingest_at)
+SELECT vehicle_id, MIN(timestamp), MAX(timestamp), COUNT(*), now()
+FROM vehicle_data
+GROUP BY vehicle_id;
+"""
+
+# Baza z danymi sprzed wprowadzenia katalogu - trzeba go wypełnić jednym skanem
+CATALOG_MISSING_QUERY = """
+SELECT NOT EXISTS (SELECT 1 FROM vehicle_catalog) AND EXISTS (SELECT 1 FROM vehicle_data);
+"""
+
+CATALOG_QUERY = """
+SELECT vehicle_id, first_ts, last_ts, row_count, last_ingest_at
+FROM vehicle_catalog
+ORDER BY vehicle_id;
+"""
+
+
+@dataclass(frozen=True)
+class VehicleInfo:
+    """Wiersz katalogu: zakres czasu i liczba pomiarów jednego pojazdu."""
+    vehicle_id: str
+    first_ts: datetime
+    last_ts: datetime
+    row_count: int
+    last_ingest_at: datetime
+
+
+def create_catalog_table(conn):
+    """
+    Tworzy tabelę vehicle_catalog, jeśli nie istnieje. Gdy katalog jest pusty,
+    a vehicle_data zawiera dane (baza sprzed katalogu), wypełnia go z vehicle_data.
+    """
+    with conn.cursor() as cur:
+        cur.execute(CREATE_CATALOG_TABLE_QUERY)
+        cur.execute(CATALOG_MISSING_QUERY)
+        missing = cur.fetchone()[0]
+    conn.commit()
+    if missing:
+        rebuild_catalog(conn)
+
+
+def rebuild_catalog(conn):
+    """Przelicza katalog od zera jednym skanem vehicle_data (np. po usunięciu danych)."""
+    with conn.cursor() as cur:
+        cur.execute(CREATE_CATALOG_TABLE_QUERY)
+        cur.execute(REBUILD_CATALOG_QUERY)
+        vehicles = cur.rowcount
+    conn.commit()
+    invalidate_catalog()
+    print(f"Przebudowano katalog pojazdów: {vehicles} pojazdów.")
+    return vehicles
+
+
+def record_chunk(cur, chunk: pd.DataFrame):
+    """
+    Dopisuje do katalogu statystyki paczki ładowanej do vehicle_data. Wywoływane na tym
+    samym kursorze przed zatwierdzeniem paczki, więc katalog zmienia się atomowo z danymi.
+    """
+    timestamps = pd.to_datetime(chunk["timestamp"])
+    stats = timestamps.groupby(chunk["vehicle_id"].to_numpy()).agg(["min", "max", "count"])
+    execute_values(
+        cur, UPSERT_CATALOG_QUERY,
+        [(str(vehicle_id), row["min"].to_pydatetime(), row["max"].to_pydatetime(), int(row["count"]))
+         for vehicle_id, row in stats.iterrows()],
+        template="(%s, %s, %s, %s, now())",
+    )
+
+
+_catalog = {"value": None, "read_at": 0.0, "generation": 0}
+_catalog_lock = threading.Lock()
+
+
+def invalidate_catalog():
+    """Unieważnia katalog w pamięci procesu (wywoływane po załadowaniu nowych danych)."""
+    with _catalog_lock:
+        _catalog.update(value=None, generation=_catalog["generation"] + 1)
+
+
+def _read_catalog(conn) -> Dict[str, VehicleInfo]:
+    try:
+        with conn.cursor() as cur:
+            cur.execute(CATALOG_QUERY)
+            rows = cur.fetchall()
+    except psycopg2.errors.UndefinedTable:
+        # Baza utworzona przed wprowadzeniem katalogu - tworzymy go i wypełniamy
+        conn.rollback()
+        create_catalog_table(conn)
+        with conn.cursor() as cur:
+            cur.execute(CATALOG_QUERY)
+            rows = cur.fetchall()
+    return _to_catalog(rows)
+
+
+def _cached_catalog():
+    """Katalog z pamięci procesu (None, gdy brak lub po TTL) i bieżąca generacja unieważnień."""
+    with _catalog_lock:
+        if _catalog["value"] is not None and time.monotonic() - _catalog["read_at"] < VEHICLE_CATALOG_TTL_S:
+            return _catalog["value"], _catalog["generation"]
+        return None, _catalog["generation"]
+
+
+def _store_catalog(value, generation):
+    with _catalog_lock:
+        # Unieważnienie w trakcie odczytu ma pierwszeństwo - taki wynik może być nieaktualny
+        if _catalog["generation"] == generation:
+            _catalog.update(value=value, read_at=time.monotonic())
+
+
+def _to_catalog(rows) -> Dict[str, VehicleInfo]:
+    return {row[0]: VehicleInfo(row[0], row[1], row[2], int(row[3]), row[4]) for row in rows}
+
+
+def get_catalog(conn_factory) -> Dict[str, VehicleInfo]:
+    """
+    Zwraca katalog pojazdów (vehicle_id -> VehicleInfo, w kolejności identyfikatorów).
+    Odczyt z bazy następuje nie częściej niż co VEHICLE_CATALOG_TTL_S sekund.
+
+    :param conn_factory: Funkcja zwracająca połączenie jako context manager
+                         (np. tools.get_db_connection), wywoływana tylko przy odczycie z bazy.
+    """
+    value, generation = _cached_catalog()
+    if value is not None:
+        return value
+    with conn_factory() as conn, db_call() as call:
+        value = _read_catalog(conn)
+        call.rows = len(value)
+    _store_catalog(value, generation)
+    return value
+
+
+async def aget_catalog() -> Dict[str, VehicleInfo]:
+    """Wersja get_catalog dla narzędzi asynchronicznych (odczyt przez pulę asyncpg)."""
+    from async_runtime import asyncpg, fetch, to_worker
+    from db_pool import get_pool
+
+    value, generation = _cached_catalog()
+    if value is not None:
+        return value
+    try:
+        with db_call() as call:
+            rows = await fetch(CATALOG_QUERY)
+            call.rows = len(rows)
+    except asyncpg.exceptions.UndefinedTableError:
+        # Brak tabeli katalogu - tworzy ją i wypełnia ścieżka synchroniczna
+        return await to_worker(get_catalog, get_pool().connection)
+    value = _to_catalog(rows)
+    _store_catalog(value, generation)
+    return value
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    db_url = os.getenv("DATABASE_URL")
+    if not db_url:
+        print("Błąd: Zmienna środowiskowa DATABASE_URL nie jest ustawiona.")
+    else:
+        conn = psycopg2.connect(db_url)
+        try:
+            rebuild_catalog(conn)
+        finally:
+            conn.close()